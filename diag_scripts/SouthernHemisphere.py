@@ -125,12 +125,12 @@ import os
 import pdb
 import sys
 import numpy as np
-from scipy.interpolate import griddata
 from scipy.interpolate import interp1d
 
 # ESMValTool defined Python packages
 sys.path.append("./interface_scripts")
 from esmval_lib import ESMValProject
+from regridding import get_regridder
 from auxiliary import info
 
 # Force matplotlib to not use any Xwindows backend.
@@ -407,40 +407,23 @@ def get_contour_config(modelconfig, config_file, area_key, datakey):
         return lev, diff, diff2, cm_model, cm_diff, cm_dev
 
 
-def interpolate_data_grid(data, lats, lons, target_lats, target_lons):
+def interpolate_data_grid(data, lats, lons, target_lats, target_lons,
+                          cache_dir=None):
     """Interpolates the data values to a specific lat/lon grid.
-    This function should only be used for 2D arrays (no time indeces etc.)"""
+    The data may also be a stack of 2D arrays (..., lats, lons). The
+    interpolation weights are computed once per pair of grids and cached
+    on disk in cache_dir (if given), see regridding.py"""
 
     # First check if the coordinates are the same, otherwise interpolate
     if (np.array_equal(lats, target_lats) and np.array_equal(lons, target_lons)):
         return data
 
     else:
-        grid_lats, grid_lons = np.meshgrid(target_lats, target_lons)
-        datapoints = np.zeros((len(lats) * len(lons), 2))
-        datavalues = data.reshape(-1)
-        i = 0
-        for lat in lats:
-            datapoints[i:i + len(lons), 0] = lat
-            datapoints[i:i + len(lons), 1] = lons
-            i += len(lons)
-
-        # Calculate the values on the new grid
-        gridvalues = griddata(datapoints,
-                              datavalues,
-                              (grid_lats, grid_lons),
-                              method='cubic')
-        nearest = griddata(datapoints,
-                           datavalues,
-                           (grid_lats, grid_lons),
-                           method='nearest')
-
-        # In some cases griddata cannot export values on the border of the grid
-        for i in xrange(gridvalues.shape[0]):
-            for j in xrange(gridvalues.shape[1]):
-                if (np.isnan(gridvalues[i, j])):
-                    gridvalues[i, j] = nearest[i, j]
-        return gridvalues.T
+        # Cubic interpolation, the values which can't be interpolated on
+        # the border of the grid are taken from the nearest neighbour
+        regridder = get_regridder(lats, lons, target_lats, target_lons,
+                                  method='cubic', cache_dir=cache_dir)
+        return regridder(data)
 
 
 def process_mean_plots(E, modelconfig, datakey, orientation, mean_name):
@@ -762,6 +745,7 @@ def process_radiation_maps(E, modelconfig, datakey, specifier):
     plot_dir = E.get_plot_dir()
     verbosity = E.get_verbosity()
     work_dir = E.get_work_dir()
+    weights_dir = os.path.join(work_dir, 'regridding_weights')
     datakeycs = datakey + 'cs'
 
     # Check that we have similar model sets (obs should be the same)
@@ -842,17 +826,20 @@ def process_radiation_maps(E, modelconfig, datakey, specifier):
                                              mlats,
                                              mlons,
                                              obslats,
-                                             obslons)
+                                             obslons,
+                                             cache_dir=weights_dir)
                 datacs = interpolate_data_grid(datacs,
                                                mcslats,
                                                mcslons,
                                                obslats,
-                                               obslons)
+                                               obslons,
+                                               cache_dir=weights_dir)
                 obscs = interpolate_data_grid(obscs,
                                               obscslats,
                                               obscslons,
                                               obslats,
-                                              obslons)
+                                              obslons,
+                                              cache_dir=weights_dir)
 
                 # Get contour specific plotting limits
                 a, b, c, d, e, f = get_contour_config(modelconfig,
@@ -1004,6 +991,7 @@ def process_simple_maps(E, modelconfig, datakey, specifier):
     plot_dir = E.get_plot_dir()
     verbosity = E.get_verbosity()
     work_dir = E.get_work_dir()
+    weights_dir = os.path.join(work_dir, 'regridding_weights')
 
     # Get the observations
     obsmodel, obs_loc, models = E.get_clim_model_and_obs_filenames(datakey)
@@ -1071,7 +1059,8 @@ def process_simple_maps(E, modelconfig, datakey, specifier):
                                              mlats,
                                              mlons,
                                              obslats,
-                                             obslons)
+                                             obslons,
+                                             cache_dir=weights_dir)
                 # Get contour specific plotting limits
                 lev, diff, cm_model, cm_diff = get_contour_config(modelconfig,
                                                                   config_file,
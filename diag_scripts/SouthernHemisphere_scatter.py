@@ -122,12 +122,12 @@ import ConfigParser
 import sys
 import os
 import numpy as np
-from scipy.interpolate import griddata
 from scipy.interpolate import interp1d
 
 # ESMValTool defined Python packages
 sys.path.append("./interface_scripts")
 from esmval_lib import ESMValProject
+from regridding import get_regridder
 from auxiliary import info
 
 # Force matplotlib to not use any Xwindows backend.
@@ -227,19 +227,20 @@ def calculate_scatterplot_values(modelconfig,
 
 def interpolate_3d(data, lats, lons, target_lats, target_lons):
     """Interpolate time/lat/lon grid to specific lat/lon coordinates."""
-    new_data = np.zeros((data.shape[0], len(target_lats), len(target_lons)))
-    for time in xrange(data.shape[0]):
-        new_data[time] = interpolate_data_grid(data[time, :, :],
-                                               lats,
-                                               lons,
-                                               target_lats,
-                                               target_lons)
-    return new_data
+    # All time steps are interpolated at once
+    return np.asarray(interpolate_data_grid(data,
+                                            lats,
+                                            lons,
+                                            target_lats,
+                                            target_lons), dtype=np.float64)
 
 
-def interpolate_data_grid(data, lats, lons, target_lats, target_lons):
+def interpolate_data_grid(data, lats, lons, target_lats, target_lons,
+                          cache_dir=None):
     """Interpolates the data values to a specific lat/lon grid.
-    This function should only be used for 2D arrays (no time indeces etc.)"""
+    The data may also be a stack of 2D arrays (..., lats, lons). The
+    interpolation weights are computed once per pair of grids and cached
+    on disk in cache_dir (if given), see regridding.py"""
 
     # First check if the coordinates are the same, otherwise interpolate
     if (np.array_equal(lats, target_lats)
@@ -247,31 +248,11 @@ def interpolate_data_grid(data, lats, lons, target_lats, target_lons):
         return data
 
     else:
-        grid_lats, grid_lons = np.meshgrid(target_lats, target_lons)
-        datapoints = np.zeros((len(lats) * len(lons), 2))
-        datavalues = data.reshape(-1)
-        i = 0
-        for lat in lats:
-            datapoints[i:i + len(lons), 0] = lat
-            datapoints[i:i + len(lons), 1] = lons
-            i += len(lons)
-
-        # Calculate the values on the new grid
-        gridvalues = griddata(datapoints,
-                              datavalues,
-                              (grid_lats, grid_lons),
-                              method='cubic')
-        nearest = griddata(datapoints,
-                           datavalues,
-                           (grid_lats, grid_lons),
-                           method='nearest')
-
-        # In some cases griddata cannot export values on the border of the grid
-        for i in xrange(gridvalues.shape[0]):
-            for j in xrange(gridvalues.shape[1]):
-                if (np.isnan(gridvalues[i, j])):
-                    gridvalues[i, j] = nearest[i, j]
-        return gridvalues.T
+        # Cubic interpolation, the values which can't be interpolated on
+        # the border of the grid are taken from the nearest neighbour
+        regridder = get_regridder(lats, lons, target_lats, target_lons,
+                                  method='cubic', cache_dir=cache_dir)
+        return regridder(data)
 
 
 def process_scatter(E, modelconfig):
@@ -169,11 +169,11 @@ matplotlib.use('Agg')
 # Common Python packages
 import matplotlib.pyplot as plt
 
-from scipy.interpolate import griddata
 
 # ESMValTool defined Python packages
 sys.path.append("./interface_scripts")
 from esmval_lib import ESMValProject
+from regridding import get_regridder
 from auxiliary import info
 
 from mpl_toolkits.basemap import Basemap
@@ -260,36 +260,23 @@ def convert_latlon_meters(lat1, lat2, lon1, lon2):
                      * np.cos(lon2 * np.pi / 180 - lon1 * np.pi / 180)) * 6371000
 
 
-def interpolate_data_grid(data, lats, lons, target_lats, target_lons):
+def interpolate_data_grid(data, lats, lons, target_lats, target_lons,
+                          cache_dir=None):
     """Interpolates the data values to a specific lat/lon grid.
-    This function should only be used for 2D arrays (no time indeces etc.)"""
+    The data may also be a stack of 2D arrays (..., lats, lons). The
+    interpolation weights are computed once per pair of grids and cached
+    on disk in cache_dir (if given), see regridding.py"""
 
     # First check if the coordinates are the same, otherwise interpolate
     if (np.array_equal(lats, target_lats) and np.array_equal(lons, target_lons)):
         return data
 
     else:
-        grid_lats, grid_lons = np.meshgrid(target_lats, target_lons)
-        datapoints = np.zeros((len(lats) * len(lons), 2))
-        datavalues = data.reshape(-1)
-        i = 0
-        for lat in lats:
-            datapoints[i:i + len(lons), 0] = lat
-            datapoints[i:i + len(lons), 1] = lons
-            i += len(lons)
-
-        # Calculate the values on the new grid
-        gridvalues = griddata(datapoints, datavalues, (grid_lats, grid_lons),
-                              method='cubic')
-        nearest = griddata(datapoints, datavalues, (grid_lats, grid_lons),
-                           method='nearest')
-
-        # In some cases griddata cannot export values on the border of the grid
-        for i in xrange(gridvalues.shape[0]):
-            for j in xrange(gridvalues.shape[1]):
-                if (np.isnan(gridvalues[i, j])):
-                    gridvalues[i, j] = nearest[i, j]
-        return gridvalues.T
+        # Cubic interpolation, the values which can't be interpolated on
+        # the border of the grid are taken from the nearest neighbour
+        regridder = get_regridder(lats, lons, target_lats, target_lons,
+                                  method='cubic', cache_dir=cache_dir)
+        return regridder(data)
 
 
 def process_divergence(E, modelconfig):
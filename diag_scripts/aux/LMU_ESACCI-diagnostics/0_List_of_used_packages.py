@@ -12,6 +12,7 @@ import imp
 
 import math
 import matplotlib
+import multiprocessing
 
 import netCDF4
 import numpy
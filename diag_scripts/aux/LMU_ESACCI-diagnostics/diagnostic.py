@@ -17,6 +17,7 @@ from netCDF4 import Dataset
 from geoval.core.data import GeoData
 from geoval.core.mapping import *
 import extended_data
+import kendall_tau
 from esmval_lib import ESMValProject
 #from GeoData_mapping import *
 
@@ -534,7 +535,7 @@ class BasicDiagnostics(Diagnostic):
         
         if self.cfg.regionalization and self._regions==None:
             self._write_regionalization_header()   
-            self._regions=self._ref_data.get_regions(self._reg_shape,self.cfg.shapeNames-1)
+            self._regions=self._ref_data.get_regions(self._reg_shape,self.cfg.shapeNames-1,cache_dir=self._work_dir + os.sep + "regions")
             print("     Region names: " + ", ".join(self._regions.keys()))
         
         
@@ -1126,17 +1127,13 @@ class BasicDiagnostics(Diagnostic):
             
         dataX=dataX.data.reshape(shapeX[0],shapeX[1]*shapeX[2])    
         dataY=dataY.data.reshape(shapeX[0],shapeX[1]*shapeX[2]) 
-        dataXY=np.append(dataX,dataY,axis=0)        
         
-        def __my_tau__(v):
-            """
-            wrapper for kendall's tau along 2 halfs of a vector
-            """
-            vs=v.shape
-            half=vs[0]/2
-            return stats.stats.kendalltau(v[np.arange(half)],v[np.arange(half)+half])
+        #number of processes sharing the pixels (optional in cfg)
+        cores=1
+        if 'cores' in self.cfg.__dict__.keys():
+            cores=self.cfg.cores
         
-        Kendall=np.apply_along_axis(__my_tau__,0,dataXY)  
+        Kendall=np.array(kendall_tau.kendall_tau(dataX,dataY,cores=cores))
         Kendall.shape=(Kendall.shape[0],shapeX[1],shapeX[2])     
         
         KT_corr.data.data[:]=Kendall[0]
@@ -9,10 +9,210 @@ from geoval.core.netcdf import NetCDFHandler
 from geoval.core.data import GeoData
 import matplotlib.pyplot as plt
 import collections
+import hashlib
 
 # TODO correct _set_cell_area
 # TODO discuss: get_shape_statistics, get_regions
 
+# region masks of this process, by shapefile and grid
+_region_masks = {}
+
+
+def _shape_edges(polygon):
+    """
+    edges (start x, start y, end x, end y) of all parts (rings) of a
+    polygon, each ring closed from its last to its first vertex
+    """
+    breaks = list(polygon.parts) + [0]
+    edges = []
+    for e in range(len(breaks) - 1):
+        ring = np.array(polygon.points[breaks[e]:(breaks[e + 1] - 1)],
+                        dtype=np.float64).reshape(-1, 2)
+        if len(ring) == 0:
+            continue
+        vx, vy = ring[:, 0], ring[:, 1]
+        edges.append(np.column_stack((np.roll(vx, 1), np.roll(vy, 1), vx, vy)))
+    if len(edges) == 0:
+        return np.zeros((0, 4))
+    return np.concatenate(edges)
+
+
+def rasterize_polygon(edges, lon, lat):
+    """
+    even-odd ray casting of all grid cells at once
+    
+    Parameters
+    ----------
+    edges : array (nedges, 4) from _shape_edges
+    lon, lat : arrays of the cell coordinates (same shape)
+    
+    Returns
+    -------
+    boolean array, True for cells inside the polygon (an odd number
+    of its rings, such that holes are excluded)
+    """
+    testx = np.where(lon < 180, lon, lon - 360).astype(np.float64).ravel()
+    testy = lat.astype(np.float64).ravel()
+    xj, yj, xi, yi = edges.T
+    inside = np.zeros(testy.shape, dtype=bool)
+    
+    # all cells of a row (same latitude) share the crossing edges
+    rows, row_index = np.unique(testy, return_inverse=True)
+    order = np.argsort(row_index, kind='mergesort')
+    starts = np.searchsorted(row_index[order], np.arange(len(rows) + 1))
+    for r, y in enumerate(rows):
+        cross = (yi > y) != (yj > y)
+        if not cross.any():
+            continue
+        xint = np.sort((xj[cross] - xi[cross]) * (y - yi[cross]) /
+                       (yj[cross] - yi[cross]) + xi[cross])
+        cells = order[starts[r]:starts[r + 1]]
+        # number of crossings right of the cell
+        n = len(xint) - np.searchsorted(xint, testx[cells], side='right')
+        inside[cells] = n % 2 == 1
+    return inside.reshape(lat.shape)
+
+
+def region_masks(shape, lon, lat, cache_dir=None):
+    """
+    rasterized polygons of a shapefile, cached in memory and (if
+    cache_dir is given) on disk by the polygons and the grid
+    
+    Returns
+    -------
+    boolean array (nshapes, ny, nx), True for cells inside the polygon
+    """
+    polygons = shape.shapes()
+    edges = [_shape_edges(polygon) for polygon in polygons]
+    
+    sha = hashlib.sha1()
+    for e in edges:
+        sha.update(str(e.shape))
+        sha.update(e.tostring())
+    for coordinate in [lon, lat]:
+        coordinate = np.ascontiguousarray(coordinate, dtype=np.float64)
+        sha.update(str(coordinate.shape))
+        sha.update(coordinate.tostring())
+    key = sha.hexdigest()
+    
+    if key in _region_masks:
+        return _region_masks[key]
+    
+    masks = None
+    if cache_dir is not None:
+        cache_file = cache_dir + os.sep + "regions_" + key + ".npz"
+        if os.path.isfile(cache_file):
+            try:
+                cached = np.load(cache_file)
+                masks = np.unpackbits(cached['masks'])[:cached['size']]
+                masks = masks.reshape(cached['shape']).astype(bool)
+            except (IOError, ValueError, KeyError):
+                masks = None
+    
+    if masks is None:
+        masks = np.array([rasterize_polygon(e, lon, lat) for e in edges])
+        masks = masks.reshape((len(edges),) + lat.shape)
+        if cache_dir is not None:
+            if not os.path.isdir(cache_dir):
+                try:
+                    os.makedirs(cache_dir)
+                except OSError:
+                    if not os.path.isdir(cache_dir):
+                        raise
+            tmp_file = cache_file + ".tmp" + str(os.getpid()) + ".npz"
+            np.savez_compressed(tmp_file, masks=np.packbits(masks),
+                                size=masks.size, shape=masks.shape)
+            os.rename(tmp_file, cache_file)
+    
+    _region_masks[key] = masks
+    return masks
+
+
+def region_labels(regions):
+    """
+    integer label grid from region masks (True outside of the region)
+    
+    Returns
+    -------
+    array with the index of the region of each cell (-1 outside of all
+    regions), None if any regions overlap
+    """
+    inside = np.logical_not(np.array(regions.values()))
+    if len(inside) == 0 or np.any(inside.sum(axis=0) > 1):
+        return None
+    labels = np.where(inside.any(axis=0), inside.argmax(axis=0), -1)
+    return labels
+
+
+def labelled_statistics(data, labels, nlabels, cell_area=None):
+    """
+    area weighted statistics of all labelled regions in one pass
+    
+    Parameters
+    ----------
+    data : masked array (ny, nx) or (nt, ny, nx)
+    labels : integer array (ny, nx), region index per cell, < 0 outside
+    nlabels : number of regions
+    cell_area : array (ny, nx), unity weights if None
+    
+    Returns
+    -------
+    table (ordered dict of columns, one row per region) with the
+    minimum, the area weighted mean, the maximum, the area weighted
+    standard deviation and the number of valid values; min, max and
+    count are taken over all time steps, mean and sd are given per time
+    step for 3D data (as GeoData.fldmean)
+    """
+    values = np.ma.getdata(data)
+    ntime = values.shape[0] if values.ndim == 3 else 1
+    values = values.reshape(ntime, -1)
+    valid = ~np.ma.getmaskarray(data).reshape(ntime, -1)
+    labels = np.asarray(labels).ravel()
+    if cell_area is None:
+        cell_area = np.ones(labels.shape)
+    area = np.broadcast_to(np.asarray(cell_area, dtype=np.float64).ravel(),
+                           values.shape)
+    
+    valid &= (labels >= 0)[np.newaxis, :]
+    region = np.broadcast_to(labels, values.shape)[valid]
+    step = np.broadcast_to(np.arange(ntime)[:, np.newaxis], values.shape)[valid]
+    x = values[valid].astype(np.float64)
+    w = area[valid]
+    
+    # weighted sums per time step and region
+    index = step * nlabels + region
+    size = ntime * nlabels
+    sum_w = np.bincount(index, weights=w, minlength=size)
+    sum_wx = np.bincount(index, weights=w * x, minlength=size)
+    sum_wxx = np.bincount(index, weights=w * x * x, minlength=size)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = (sum_wx / sum_w).reshape(ntime, nlabels).T
+        mean_sq = (sum_wxx / sum_w).reshape(ntime, nlabels).T
+        sd = np.sqrt(np.maximum(mean_sq - mean ** 2, 0))
+    
+    count = np.bincount(region, minlength=nlabels)
+    
+    # extremes over all time steps from the values sorted by region
+    minimum = np.ones(nlabels) * np.nan
+    maximum = np.ones(nlabels) * np.nan
+    if len(x) > 0:
+        order = np.argsort(region, kind='mergesort')
+        starts = np.searchsorted(region[order], np.arange(nlabels))
+        found = count > 0
+        minimum[found] = np.fmin.reduceat(x[order], starts[found])
+        maximum[found] = np.fmax.reduceat(x[order], starts[found])
+    
+    if ntime == 1 and np.ndim(data) != 3:
+        mean, sd = mean[:, 0], sd[:, 0]
+    
+    return collections.OrderedDict([('min', minimum),
+                                    ('mean', mean),
+                                    ('max', maximum),
+                                    ('sd', sd),
+                                    ('count', count)])
+
+
 class GeoData(GeoData):
 
     def C_set_cell_area(self): #Overwritten due to error
@@ -157,148 +357,49 @@ class GeoData(GeoData):
         self.regionalized=dict()
         regname=regions.keys()
         
-#        for s in np.arange(len(regions)):
-#            loc_content=self.data.copy()
-#            loc_content.mask=regions[regname[s]]
-#            
-#            try:
-#                a=np.nanmin(loc_content)
-#            except:
-#                a=np.nan
-#            try:
-#                b=np.nanmean(loc_content)
-#            except:
-#                b=np.nan
-#            try:
-#                c=np.nanmax(loc_content) 
-#            except:
-#                c=np.nan
-#            try:
-#                d=np.nanstd(loc_content)
-#            except:
-#                d=np.nan
-#            try:
-#                e=loc_content.count()
-#            except:
-#                e=np.nan
-                
-        for s in np.arange(len(regions)):
-            loc_content=self.copy()
-            #loc_content.data.mask=regions[regname[s]]
-            loc_content.data.mask=np.logical_or(loc_content.data.mask,regions[regname[s]])
-
-# A_laue_ax+
-            #print("==========================================================")
-            #print(regname[s])
-            #print(np.shape(loc_content.data.mask))
-            #print(np.shape(regions[regname[s]]))
-            #ncfile = NetCDFHandler()
-            #ncfile.open_file('debug.nc', 'w')
-            #dims = np.shape(loc_content.data.mask)
-            #nx = dims[1]
-            #ny = dims[0]
-            #ncfile.create_dimension('x',size=nx)
-            #ncfile.create_dimension('y',size=ny)
-            #data = ncfile.create_variable('data','i4',('y','x'))
-            #ncfile.assign_value('data', self.data.mask.astype(int))
-            #ncfile.close()
-            #print("==========================================================")
-            #if (s == 1):
-            #    exit()
-# A_laue_ax-
-            
-            try:
-                a=np.nanmin(loc_content.data)
-            except:
-                a=np.nan
-            try:
-                b=loc_content.fldmean()
-            except:
-                b=np.nan
-            try:
-                c=np.nanmax(loc_content.data) 
-            except:
-                c=np.nan
-            try:
-                lc2=loc_content.copy()
-                lc2.data=lc2.data**2
-                d=np.sqrt((lc2.fldmean()-b**2))
-            except:
-                d=np.nan
-            try:
-                e=loc_content.data.count()
-            except:
-                e=np.nan
+        cell_area=getattr(self,'cell_area',None)
+        if cell_area is not None and np.shape(cell_area) != self.data.shape[-2:]:
+            cell_area=None
+        
+        labels=region_labels(regions)
+        if labels is not None:
+            tables=[(regname,labelled_statistics(self.data,labels,len(regname),cell_area))]
+        else:
+            #overlapping regions: one labelled pass per region
+            tables=[([regname[s]],labelled_statistics(self.data,np.where(regions[regname[s]],-1,0),1,cell_area)) for s in np.arange(len(regions))]
             
-            self.regionalized[regname[s]]=[a,b,c,d,e]
+        for names,table in tables:
+            for r in np.arange(len(names)):
+                self.regionalized[names[r]]=[table[column][r] for column in table.keys()]
                                             
-    def get_regions(self,shape,column=0): #written before geoval was implemented
+    def get_regions(self,shape,column=0,cache_dir=None): #written before geoval was implemented
         """
         get setup for statistical information for different polygons in shapefile
         Parameters
         ----------
         shape : shp.Reader (shapefile.Reader)
             information on areas from a classic ESRI shapefile
+        column : int
+            column of the region names in the shapefile records
+        cache_dir : str
+            directory for the rasterized regions (optional)
+            
+        Returns
+        -------
+        masks per region name, True outside of the region
         """
         assert isinstance(shape,shp.Reader)
         
-    
-            
-        def point_in_poly(point,poly):
-
-            testy=point[1]
-            testx=point[0] if point[0]<180 else point[0]-360
-            
-            vertx=[item[0] for item in poly]
-            verty=[item[1] for item in poly]
-            
-            nvert=len(poly)
-            c=False
-          
-            j=nvert-1
-            for i in range(0, nvert):
-                if ( not((verty[i]>testy) == (verty[j]>testy)) and (testx < (vertx[j]-vertx[i]) * (testy-verty[i]) / (verty[j]-verty[i]) + vertx[i]) ):
-                    c = not c
-                j=i
-          
-            return c
-            
-                    
+        if not len(self.shape) in [2,3]:
+            assert False, "wrong data dimensions"
+        
         regions=dict()
         regname=np.array(shape.records())[:,column] 
         
-        for s in range(len(shape.shapes())):
-            breaks=shape.shapes()[s].parts
-            breaks.append(0)
-            loc_polys=[]
-            loc_masks=[]
-            for e in range(len(breaks)-1):
-                
-                loc_polys.append(shape.shapes()[s].points[breaks[e]:(breaks[e+1]-1)])
-            
-                if len(self.shape) == 3:
-                    loc_mask=np.any(self.data,axis=0).mask.copy()
-                elif len(self.shape) == 2:
-                    loc_mask=self.data.mask.copy()
-                else :
-                    assert False, "wrong data dimensions"
-                for i in np.arange(self.shape[0] if len(self.shape) == 2 else self.shape[1]):
-                    for j in np.arange(self.shape[1] if len(self.shape) == 2 else self.shape[2]):
-                        ll=[(self.lon[i,j]),self.lat[i,j]]
-    
-                        loc_mask[i,j]=point_in_poly(ll,loc_polys[-1])
-                        
-                loc_masks.append(loc_mask)     
-            
-#            if len(self.shape) == 3:
-#                loc_mask=self.data.mask.copy()
-#            elif len(self.shape) == 2:
-#                loc_mask=self.data.mask.copy()
-#            else :
-#                assert False, "wrong data dimensions"
-                
-#            regions[regname[s]]=np.logical_or(loc_mask,np.logical_not(sum(loc_masks) % 2))
-            regions[regname[s]]=np.logical_not(sum(loc_masks) % 2)
+        masks=region_masks(shape,self.lon,self.lat,cache_dir)
+        
+        for s in range(len(masks)):
+            regions[regname[s]]=np.logical_not(masks[s])
             
         return collections.OrderedDict(sorted(regions.items()))
         
@@ -0,0 +1,112 @@
+"""
+Pixelwise Kendall's tau for whole fields
+
+Computes Kendall's tau-b and its p-value between the time series of two
+(time, pixel) arrays for all pixels at once, instead of calling
+scipy.stats.kendalltau for each pixel:
+ - the pairs of time steps are compared lag by lag, vectorized across
+   all pixels of a block,
+ - masked and non-finite values are excluded pairwise, i.e., a time step
+   only enters the statistics of a pixel if both values are valid,
+ - the p-value is the two-sided normal approximation with the variance
+   corrected for ties (as in scipy.stats.kendalltau for more than 33
+   values or with ties); pixels with less than two valid time steps or
+   constant series get NaN,
+ - blocks of pixels can be distributed to several processes.
+"""
+
+import multiprocessing
+import numpy as np
+from scipy.special import erfc
+
+
+def _tie_sums(data):
+    """
+    sums over the groups of tied values of each pixel:
+    t(t-1)/2, t(t-1)(t-2) and t(t-1)(2t+5), t being the group size;
+    data is (time, pixel) with NaN for invalid values
+    """
+    ntime, npix = data.shape
+    data = np.sort(data, axis=0)  # NaN at the end, never equal
+    new_group = np.ones(data.shape, dtype=bool)
+    new_group[1:] = data[1:] != data[:-1]
+    group = np.cumsum(new_group, axis=0) - 1 + np.arange(npix) * ntime
+    valid = np.isfinite(data)
+
+    t = np.bincount(group[valid], minlength=ntime * npix).astype(float)
+    pixel = np.arange(ntime * npix) // ntime
+
+    def per_pixel(values):
+        return np.bincount(pixel, weights=values, minlength=npix)
+
+    return (per_pixel(t * (t - 1) / 2.),
+            per_pixel(t * (t - 1) * (t - 2)),
+            per_pixel(t * (t - 1) * (2 * t + 5)))
+
+
+def kendall_tau_block(x, y):
+    """
+    Kendall's tau-b and p-value of each column of the (time, pixel)
+    arrays x and y (masked arrays or NaN for missing values)
+    """
+    valid = ~(np.ma.getmaskarray(x) | np.ma.getmaskarray(y))
+    x = np.ma.getdata(x).astype(float)
+    y = np.ma.getdata(y).astype(float)
+    valid &= np.isfinite(x) & np.isfinite(y)
+    x = np.where(valid, x, np.nan)
+    y = np.where(valid, y, np.nan)
+
+    ntime, npix = x.shape
+    s = np.zeros(npix)        # concordant - discordant pairs
+    for lag in xrange(1, ntime):
+        dx = np.sign(x[lag:] - x[:-lag])
+        dy = np.sign(y[lag:] - y[:-lag])
+        s += np.nansum(dx * dy, axis=0)
+
+    n = valid.sum(axis=0).astype(float)
+    n0 = n * (n - 1) / 2.
+    xtie, x0, x1 = _tie_sums(x)
+    ytie, y0, y1 = _tie_sums(y)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tau = s / np.sqrt((n0 - xtie) * (n0 - ytie))
+        var_s = ((n * (n - 1) * (2 * n + 5) - x1 - y1) / 18. +
+                 (2 * xtie * ytie) / (n * (n - 1)) +
+                 np.where(n > 2, x0 * y0 / (9 * n * (n - 1) * (n - 2)), 0))
+        pval = erfc(np.abs(s) / np.sqrt(2 * var_s))
+
+    undefined = (n < 2) | (n0 == xtie) | (n0 == ytie)
+    tau[undefined] = np.nan
+    pval[undefined] = np.nan
+    return np.clip(tau, -1, 1), np.clip(pval, 0, 1)
+
+
+def _kendall_tau_args(args):
+    return kendall_tau_block(*args)
+
+
+def kendall_tau(x, y, block_size=2000, cores=1):
+    """
+    Kendall's tau-b and p-value of each column of the (time, pixel)
+    arrays x and y, computed in blocks of block_size pixels which are
+    distributed to 'cores' processes
+    """
+    assert x.shape == y.shape, 'ERROR: inconsistent shapes for Kendall\'s tau!'
+    npix = x.shape[1]
+    blocks = [(x[:, i:i + block_size], y[:, i:i + block_size])
+              for i in xrange(0, npix, block_size)]
+
+    if cores > 1 and len(blocks) > 1:
+        pool = multiprocessing.Pool(min(cores, len(blocks)))
+        try:
+            results = pool.map(_kendall_tau_args, blocks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = map(_kendall_tau_args, blocks)
+
+    if not results:
+        return np.zeros(0), np.zeros(0)
+    return (np.concatenate([tau for tau, pval in results]),
+            np.concatenate([pval for tau, pval in results]))
@@ -55,7 +55,7 @@ class SoilMoistureDiagnostic(BasicDiagnostics):
         super(SoilMoistureDiagnostic, self).write_data()
         
         if self.cfg.regionalization and not '_regions' in self.__dict__.keys():
-            self._regions=self._mod_data.get_regions(self._reg_shape,self.cfg.shapeNames-1)
+            self._regions=self._mod_data.get_regions(self._reg_shape,self.cfg.shapeNames-1,cache_dir=self._work_dir + os.sep + "regions")
             self._write_regionalization_header()
             print "this should not be calculated here"
         
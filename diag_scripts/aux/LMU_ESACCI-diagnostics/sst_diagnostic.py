@@ -1,4 +1,50 @@
 from diagnostic import *
+import hashlib
+import shutil
+import multiprocessing
+
+# cdo grids of the supported resolutions
+GRIDS = {"T63": "t63grid", "T85": "t85grid"}
+
+
+def _year_checkpoint(checkpoint_dir, year, files):
+    """
+    name of the preprocessed file of one year, identifying the input files
+    by name, size and modification time
+    """
+    sha = hashlib.sha1()
+    for f in files:
+        st = os.stat(f)
+        sha.update("%s %d %f\n" % (f, st.st_size, st.st_mtime))
+    return checkpoint_dir + os.sep + str(year) + "_" + sha.hexdigest()[:12] + ".nc"
+
+
+def _preprocess_year(args):
+    """
+    concatenate the files of one year, apply the sst flags, aggregate to
+    monthly means and remap; the result is written to its checkpoint file,
+    which is reused if it already exists
+    """
+    files, checkpoint, resolution = args
+    if os.path.isfile(checkpoint):
+        return checkpoint
+    
+    cdo = Cdo()
+    catfile = checkpoint + ".cat" + str(os.getpid())
+    tmpfile = checkpoint + ".tmp" + str(os.getpid())
+    try:
+        cdo.cat(input=files, output=catfile, options='-f nc4')
+        # flags (only sst where mask == 1), monthly mean and remapping in one go
+        cdo.remapcon(GRIDS[resolution],
+                     input="-monmean -div -selname,analysed_sst " + catfile +
+                           " -setvrange,1,1 -selname,mask " + catfile,
+                     output=tmpfile, options='-L -f nc4 -b F32')
+        os.rename(tmpfile, checkpoint)
+    finally:
+        for f in [catfile, tmpfile]:
+            if os.path.isfile(f):
+                os.remove(f)
+    return checkpoint
 
 
 class SeaSurfaceTemperatureDiagnostic(BasicDiagnostics):
@@ -44,7 +90,7 @@ class SeaSurfaceTemperatureDiagnostic(BasicDiagnostics):
         super(SeaSurfaceTemperatureDiagnostic, self).write_data()
         
         if self.cfg.regionalization and not '_regions' in self.__dict__.keys():
-            self._regions=self._mod_data.get_regions(self._reg_shape,self.cfg.shapeNames-1)
+            self._regions=self._mod_data.get_regions(self._reg_shape,self.cfg.shapeNames-1,cache_dir=self._work_dir + os.sep + "regions")
             self._write_regionalization_header()
             print "this should not be calculated here"
         
@@ -281,11 +327,10 @@ class SeaSurfaceTemperatureDiagnostic(BasicDiagnostics):
             return data
         elif (os.path.isfile(infile) or os.path.isfile(ofile)) and force:
             
-            #adjust timestep
-            thisfile = self._aggregate_timestep(ofile if os.path.isfile(ofile) else infile,timestep)
-            
-            #adjust resolution
-            thisfile = self._aggregate_resolution(thisfile,resolution)
+            #adjust timestep and resolution
+            thisfile = self._work_dir + os.sep + "temp" + os.sep + tempfile.NamedTemporaryFile().name.split('/')[-1]
+            cdo=Cdo()
+            cdo.remapcon(GRIDS[resolution], input="-monmean " + (ofile if os.path.isfile(ofile) else infile), output=thisfile, options='-f nc4 -b F32')
             
             subprocess.call(['cp',thisfile,ofile])
             
@@ -306,44 +351,51 @@ class SeaSurfaceTemperatureDiagnostic(BasicDiagnostics):
             low_date = min(ys)
             high_date = max(ys)
             
-            curyear=low_date
-                       
-            file_list_agg=[]
+            #the years are preprocessed independently (in parallel if
+            #preprocessing_workers > 1 in the cfg) into checkpoint files,
+            #an interrupted preprocessing resumes from these
+            checkpoint_dir = ofile + "_years"
+            if not os.path.exists(checkpoint_dir):
+                os.makedirs(checkpoint_dir)
             
-            while not curyear == (high_date + 1):
+            tasks=[]
+            for curyear in range(low_date, high_date + 1):
                 
                 use = np.array(np.where(np.all([file_timestamps/10000000000 == curyear],0)))
                 use=use[0][(np.argsort(file_timestamps[use[0]]))]
                 file_list_cur=np.array(file_list)[use].tolist()
                 
                 if len(file_list_cur)>0:
-                    #concatenate files
-                    thisfile = self._aggregate_obs_from_files(file_list_cur)
-                    
-                    #adjust mask
-                    thisfile = self._apply_sst_flags(thisfile)
-                
-                    #adjust timestep
-                    thisfile = self._aggregate_timestep(thisfile,timestep)
-                    
-                    #adjust resolution
-                    thisfile = self._aggregate_resolution(thisfile,resolution)
-                    
-                    #add to new file list
-                    file_list_agg.append(thisfile)
-                
-                curyear = curyear + 1
+                    tasks.append((file_list_cur, _year_checkpoint(checkpoint_dir, curyear, file_list_cur), resolution))
+            
+            workers=1
+            if 'preprocessing_workers' in self.cfg.__dict__.keys():
+                workers=self.cfg.preprocessing_workers
+            
+            print('   preprocessing ' + str(len(tasks)) + ' years with ' + str(workers) + ' worker(s)')
+            if workers > 1 and len(tasks) > 1:
+                pool = multiprocessing.Pool(min(workers, len(tasks)))
+                try:
+                    file_list_agg = pool.map(_preprocess_year, tasks)
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                file_list_agg = map(_preprocess_year, tasks)
                 
-                print(file_list_agg)
+            print(file_list_agg)
 
-            thisfile = self._aggregate_obs_from_files(file_list_agg)
-            
-            [os.remove(tf) for tf in file_list_agg]
+            thisfile = self._work_dir + os.sep + "temp" + os.sep + tempfile.NamedTemporaryFile().name.split('/')[-1]
+            cdo=Cdo()
+            cdo.cat(input=file_list_agg, output=thisfile, options='-f nc4')
 
             subprocess.call(['cp',thisfile,ofile])
             
             os.remove(thisfile)
             
+            #all years done
+            shutil.rmtree(checkpoint_dir)
+            
             data = self._load_cci_generic(ofile,var)
             return data
             
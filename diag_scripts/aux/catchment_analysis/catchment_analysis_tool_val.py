@@ -10,6 +10,10 @@
 ;; Contents:
 ;;    def analysecatchments
 ;;    def computemean
+;;    def read_catchments
+;;    def timmean_field
+;;    def catchment_means
+;;    def write_timmean
 ;;    def writefile
 ;;    def readfile
 ;;    def check
@@ -35,6 +39,7 @@ import pdb
 import re
 import subprocess as spr
 import sys
+import tempfile
 
 from copy import deepcopy
 from difflib import get_close_matches
@@ -84,7 +89,8 @@ def analysecatchments(project_info,
                       PRECIPREFCALCULATIN=None,
                       catchments=None,
                       defaultreffile=None,
-                      fmt={}):
+                      fmt={},
+                      chunksize=None):
     """
     Analyse catchments. Currently supported variables: 'runoff' and 'ET'
     INPUT:
@@ -129,11 +135,9 @@ def analysecatchments(project_info,
         - CALCULATION       True/False. calculate climatological means (True)
                             or use already existing files
         - KEEPTIMMEAN       True/False. If True, files like
-                         'tmp_<<<MODEL>>>_<<<var>>>_<<<CATCHMENT>>>.<<<fmt>>>'
+                            'tmp_<<<MODEL>>>_<<<var>>>.nc'
                             will be stored in POUT containing the timmean data
-                            for the catchments (note that the file format
-                            <<<fmt>>> is
-                            defined by the input file)
+                            on the catchment grid
         - PLOT              True/False. If True, plot according
                             SEPPLOTS-options all variables into one file
         - SEPPLOTS          Integer. If 2: relative and absolute variables will
@@ -184,6 +188,9 @@ def analysecatchments(project_info,
     --- Plotting formatoptions ---
         - fmt           dictionary defining formatoptions for the plot.
                         Possible keywords are given in xyplotformatter
+    --- Memory ---
+        - chunksize     Integer or None. Number of time steps read at once
+                        for the time means (None: all)
     OUTPUT:
     txt-Files containing catchment data:
         - POUT + <<<MODEL>>>_<<<VAR>>>_catchments.txt: absolute value for each
@@ -192,7 +199,7 @@ def analysecatchments(project_info,
             (absolute and relative) to reference each catchment of the model
             <<<MODEL>>> and variable <<<VAR>>> timmean-files (if KEEPTIMMEAN
             is True)
-        - POUT/tmp_<<<MODEL>>>_<<<VAR>>>_<<<CATCHMENT>>>.xxx: timmean-files
+        - POUT/tmp_<<<MODEL>>>_<<<VAR>>>.nc: timmean-files
             containing the timmean-values.
     plotfiles (see switches PLOT and SEPPLOTS above)
         - POUT+<<<MODEL>>>_bias-plot.pdf
@@ -219,7 +226,8 @@ def analysecatchments(project_info,
 
     # create data an save it to dictionary
     if CALCULATION:
-        data = computemean(ifiles, pcatchment, catchments, POUT)
+        data = computemean(ifiles, pcatchment, catchments, POUT,
+                           chunksize=chunksize)
         diff2ref = {model: {var: {} for var in sorted(data[model].keys())}
                     for model in sorted(data.keys())}
         fullrefdata = {model: {var: {} for var in sorted(data[model].keys())}
@@ -268,22 +276,21 @@ def analysecatchments(project_info,
                                   'vname': ifiles[model][var].get(
                                       'refvname', var)}}},
                         pcatchment, catchments, POUT,
-                        KEEPTIMMEAN=False)
+                        KEEPTIMMEAN=False, chunksize=chunksize)
                     writefile(refdata['reference'][var], POUT +
                               'ref_' + var + '_catchments.txt',
                               'Observations:')
 
                     # compute difference to reference data for each grid cell
                     # and perform fldmean
+                    labels, areas = read_catchments(pcatchment)
+                    timmean = data[model][var].values()[0]['timmean']
+                    refmean = timmean_field(
+                        [REFFILE], ifiles[model][var].get('refvname', var))
+                    diffmeans = catchment_means(timmean - refmean, labels,
+                                                areas, catchments)
                     diff2ref[model][var] = {catchment: {
-                        'data': float(
-                            cdo.output(input=(
-                                "-fldmean -sub -selname,%s "
-                                "%s -selname,%s %s") % (
-                                    ifiles[model][var].get('vname', var),
-                                    data[model][var][catchment]['timmeanfile'],
-                                    ifiles[model][var].get('refvname', var),
-                                    REFFILE))[0]),
+                        'data': diffmeans[catchment],
                         'unit': data[model][var][catchment]['unit']
                         } for catchment in sorted(data[model][var].keys())}
 
@@ -295,8 +302,9 @@ def analysecatchments(project_info,
                 if not KEEPTIMMEAN:
                     spr.call(
                         ['rm'] +
-                        [data[model][var][catchment]['timmeanfile'] for
-                            catchment in sorted(data[model][var].keys())])
+                        sorted(set(
+                            data[model][var][catchment]['timmeanfile'] for
+                            catchment in sorted(data[model][var].keys()))))
                 # # write data to file for each catchment
                 writefile(data[model][var], POUT + model + '_' + var +
                           '_catchments.txt', ' ' + model + ':')
@@ -364,7 +372,8 @@ def analysecatchments(project_info,
                                output_format=suffix)
 
 
-def computemean(ifiles, pcatchment, catchments, POUT="", KEEPTIMMEAN=True):
+def computemean(ifiles, pcatchment, catchments, POUT="", KEEPTIMMEAN=True,
+                chunksize=None):
     """compute climatological mean of input files
     Input:
         ifiles              dictionary. Syntax:
@@ -383,103 +392,212 @@ def computemean(ifiles, pcatchment, catchments, POUT="", KEEPTIMMEAN=True):
                       as used in pcatchment as value
         POUT        string. Output path for TIMMEAN files
         KEEPTIMMEAN True/False. Keep the timmeanfiles
+        chunksize   Integer or None. Number of time steps read at once (None:
+                      all). Limits the memory needed for long (e.g. daily)
+                      input files
+
+    Each input file is remapped to the catchment grid (with the 'cdo'
+    commands applied) by a single cdo call. The time mean is computed once
+    per model and variable and reduced to the area weighted means of all
+    catchments at once.
   """
     logger.info('Computing means...')
-    # set up dictionary containing the names of the maskfiles
-    maskfiles = {catchment: POUT + 'tmp_' + catchment + '.nc' for catchment in
-                 sorted(catchments.keys())}
+    labels, areas = read_catchments(pcatchment)
 
     # create grid file for remapping
-    gridfile = POUT + 'tmp-grid_' + str(np.random.randint(0, 100000)) + '.txt'
-    with open(gridfile, 'w') as f:
+    fd, gridfile = tempfile.mkstemp(prefix='tmp-grid_', suffix='.txt',
+                                    dir=POUT or None)
+    with os.fdopen(fd, 'w') as f:
         f.writelines([name + '\n' for name in cdo.griddes(input=pcatchment)])
 
-    # create mask files
-    for catchment in sorted(maskfiles.keys()):
-        cdo.eqc(catchments[catchment], input=pcatchment,
-                output=maskfiles[catchment])
     # compute climatological means and save it (together with the unit) to
     # output
     output = {model: {
-        var: {catchment: {} for catchment in sorted(maskfiles.keys())}
+        var: {catchment: {} for catchment in sorted(catchments.keys())}
         for var in sorted(ifiles[model].keys())}
         for model in sorted(ifiles.keys())}
-    TMPFILES = []
-    for model in sorted(ifiles.keys()):
-        for var in sorted(ifiles[model].keys()):
-            modelfiles = deepcopy(ifiles[model][var]['file'])
-            if isinstance(modelfiles, (str, unicode)):
-                modelfiles = [modelfiles]
-                ending = modelfiles[0].split('.')[-1]
-                thisremappedfiles = ["%stmp-remap_%i.%s" % (
-                    POUT, np.random.randint(0, 100000),
-                    ending)]
-                TMPFILES += thisremappedfiles
-            else:
-                ending = modelfiles[0].split('.')[-1]
-                thisremappedfiles = ["%stmp-remap_%i.%s" % (
-                    POUT, np.random.randint(0, 100000), ending)
-                    for FILE in modelfiles]
-                TMPFILES += thisremappedfiles
-            for FILE in modelfiles:
-                remappedfile = thisremappedfiles[modelfiles.index(FILE)]
-                cdo.remapcon(gridfile,
-                             input=' -selname,%s %s' % (
-                                 ifiles[model][var].get('vname', var),
-                                 FILE),
-                             output=remappedfile)
-            for catchment in sorted(maskfiles.keys()):
-                # define temporary (if not KEEPTIMMEAN) file for
-                # timmean calculation
-                timmeanfile = POUT + 'tmp_' + \
-                    '_'.join(name for name in [model, var, catchment]) + \
-                    '.' + ending
-                # calculate timmean
-                if len(thisremappedfiles) == 1:
-                    cdo.timmean(
-                        input='-ifthen %s %s' % (maskfiles[catchment],
-                                                 thisremappedfiles[-1]),
-                        output=timmeanfile)
-                else:
-                    TMPFILES.append(
-                        "%stmp-remap_%i.%s" % (
-                            POUT, np.random.randint(0, 100000), ending))
-                    cdo.mergetime(
-                        input='-timmean %s' % (
-                            ' -timmean '.join(thisremappedfiles)),
-                        output=TMPFILES[-1])
-                    cdo.timmean(
-                        input='-ifthen %s %s' % (maskfiles[catchment],
-                                                 TMPFILES[-1]),
-                        output=timmeanfile)
-                output[model][var][catchment]['timmeanfile'] = timmeanfile
-                output[model][var][catchment]['data'] = float(
-                    cdo.output(input=ifiles[model][var].get('cdo', '') +
-                               '-fldmean ' + timmeanfile)[0])
-                if ifiles[model][var].get('unit', False):
-                    output[model][var][catchment]['unit'] = \
-                        ifiles[model][var]['unit']
-                elif output[model][var][catchment]['unit'][-3:] == '.nc':
-                    output[model][var][catchment]['unit'] = \
-                        str(
-                            nc.Dataset(
-                                ifiles[model][var]['file']
-                                ).variables[var].units).replace(' ', '')
-                else:
-                    logger.warning(
-                        'Attention: No unit specified for model %s, '
-                        'variable %s', model, var)
-                    output[model][var][catchment]['unit'] = ''
-                if not KEEPTIMMEAN:
-                    os.remove(timmeanfile)  # delete timmeanfile
-    # delete maskfiles and gridfile
-    spr.call(['rm'] +
-             [maskfiles[catchment] for catchment in sorted(maskfiles.keys())] +
-             [gridfile] +
-             TMPFILES)
+    try:
+        for model in sorted(ifiles.keys()):
+            for var in sorted(ifiles[model].keys()):
+                modelfiles = deepcopy(ifiles[model][var]['file'])
+                if isinstance(modelfiles, (str, unicode)):
+                    modelfiles = [modelfiles]
+                vname = ifiles[model][var].get('vname', var)
+                thisremappedfiles = []
+                try:
+                    for FILE in modelfiles:
+                        fd, remappedfile = tempfile.mkstemp(
+                            prefix='tmp-remap_', suffix='.nc',
+                            dir=POUT or None)
+                        os.close(fd)
+                        thisremappedfiles.append(remappedfile)
+                        cdo.remapcon(gridfile,
+                                     input='%s-selname,%s %s' % (
+                                         ifiles[model][var].get('cdo', ''),
+                                         vname, FILE),
+                                     output=remappedfile)
+                    timmean = timmean_field(thisremappedfiles, vname,
+                                            chunksize)
+                    # file for the timmean data of all catchments
+                    timmeanfile = POUT + 'tmp_' + \
+                        '_'.join(name for name in [model, var]) + '.nc'
+                    if KEEPTIMMEAN:
+                        write_timmean(thisremappedfiles[0], vname, timmean,
+                                      timmeanfile)
+                finally:
+                    for remappedfile in thisremappedfiles:
+                        os.remove(remappedfile)
+                means = catchment_means(timmean, labels, areas, catchments)
+                for catchment in sorted(catchments.keys()):
+                    output[model][var][catchment]['timmeanfile'] = timmeanfile
+                    output[model][var][catchment]['timmean'] = timmean
+                    output[model][var][catchment]['data'] = means[catchment]
+                    if ifiles[model][var].get('unit', False):
+                        output[model][var][catchment]['unit'] = \
+                            ifiles[model][var]['unit']
+                    elif output[model][var][catchment]['unit'][-3:] == '.nc':
+                        output[model][var][catchment]['unit'] = \
+                            str(
+                                nc.Dataset(
+                                    ifiles[model][var]['file']
+                                    ).variables[var].units).replace(' ', '')
+                    else:
+                        logger.warning(
+                            'Attention: No unit specified for model %s, '
+                            'variable %s', model, var)
+                        output[model][var][catchment]['unit'] = ''
+    finally:
+        # delete gridfile
+        os.remove(gridfile)
     return output
 
 
+def read_catchments(pcatchment):
+    """read the catchment definition
+    Input:
+        pcatchment  string. Path to nc-file containing the catchment
+                      definition
+    Output:
+        labels      2D array. Catchment number of each grid cell (NaN for
+                      missing values)
+        areas       2D array. Area of each grid cell (as used by cdo fldmean)
+    """
+    if pcatchment not in _catchment_grids:
+        with nc.Dataset(pcatchment) as f:
+            names = [name for name, variable in f.variables.items()
+                     if variable.ndim >= 2 and name not in f.dimensions and
+                     'bnds' not in name and 'bounds' not in name]
+            labels = np.ma.filled(np.ma.asarray(
+                f.variables[names[0]][:], dtype=float), np.nan)
+        labels = labels.reshape(labels.shape[-2:])
+        fd, areafile = tempfile.mkstemp(prefix='tmp-area_', suffix='.nc')
+        os.close(fd)
+        try:
+            cdo.gridarea(input=pcatchment, output=areafile)
+            with nc.Dataset(areafile) as f:
+                areas = np.asarray(f.variables['cell_area'][:], dtype=float)
+        finally:
+            os.remove(areafile)
+        _catchment_grids[pcatchment] = (labels, areas.reshape(labels.shape))
+    return _catchment_grids[pcatchment]
+
+
+# catchment definitions and grid cell areas, by catchment file
+_catchment_grids = {}
+
+
+def timmean_field(ifiles, vname, chunksize=None):
+    """time mean of a variable (as cdo timmean, missing values ignored)
+    Input:
+        ifiles      list of nc-files on the same grid. The time mean of
+                      several files is the mean of the time means of each file
+        vname       string. Name of the variable
+        chunksize   Integer or None. Number of time steps read at once (None:
+                      all)
+    Output:
+        2D masked array. Time mean
+    """
+    means = []
+    for ifile in ifiles:
+        with nc.Dataset(ifile) as f:
+            variable = f.variables[vname]
+            if variable.ndim == 2:
+                means.append(np.ma.asarray(variable[:], dtype=float))
+                continue
+            ntime = variable.shape[0]
+            step = ntime if chunksize is None else max(int(chunksize), 1)
+            total = np.zeros(variable.shape[-2:])
+            count = np.zeros(variable.shape[-2:])
+            for start in xrange(0, ntime, step):
+                block = np.ma.asarray(variable[start:start + step],
+                                      dtype=float)
+                block = block.reshape((-1,) + total.shape)
+                total += block.filled(0).sum(axis=0)
+                count += block.count(axis=0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                means.append(np.ma.masked_where(count == 0, total / count))
+    if len(means) == 1:
+        return means[0]
+    return np.ma.array(means).mean(axis=0)
+
+
+def catchment_means(field, labels, areas, catchments):
+    """area weighted means of all catchments (as cdo fldmean) in one pass
+    Input:
+        field       2D (masked) array on the catchment grid
+        labels      2D array. Catchment number of each grid cell
+        areas       2D array. Grid cell areas
+        catchments  {<<<CATCHMENT>>>:<<<CATCHMENTNUMBER>>>}
+    Output:
+        {<<<CATCHMENT>>>: mean} (NaN for catchments without valid values)
+    """
+    names = sorted(catchments.keys())
+    numbers = np.array([catchments[name] for name in names], dtype=float)
+    order = np.argsort(numbers)
+    # index of the catchment of each grid cell (-1: none of the catchments)
+    position = np.searchsorted(numbers[order], labels.ravel())
+    position = np.minimum(position, len(numbers) - 1)
+    index = np.where(numbers[order][position] == labels.ravel(),
+                     order[position], -1)
+
+    valid = (index >= 0) & ~np.ma.getmaskarray(field).ravel()
+    values = np.ma.getdata(field).ravel()[valid]
+    weights = areas.ravel()[valid]
+    sum_w = np.bincount(index[valid], weights=weights,
+                        minlength=len(names))
+    sum_wx = np.bincount(index[valid], weights=weights * values,
+                         minlength=len(names))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = sum_wx / sum_w
+    return {name: float(mean) for name, mean in zip(names, means)}
+
+
+def write_timmean(template, vname, field, ofile):
+    """write a time mean field to a nc-file with the grid of template"""
+    with nc.Dataset(template) as src, nc.Dataset(ofile, 'w') as dst:
+        variable = src.variables[vname]
+        for name, dimension in src.dimensions.items():
+            if name in variable.dimensions[:-2]:
+                dst.createDimension(name, 1)
+            else:
+                dst.createDimension(name, len(dimension))
+        for name, source in src.variables.items():
+            if name == vname or set(source.dimensions) & \
+                    set(variable.dimensions[:-2]):
+                continue
+            target = dst.createVariable(name, source.dtype, source.dimensions)
+            target.setncatts({key: source.getncattr(key)
+                              for key in source.ncattrs()
+                              if key != '_FillValue'})
+            target[:] = source[:]
+        target = dst.createVariable(vname, 'f8', variable.dimensions,
+                                    fill_value=1e20)
+        target.setncatts({key: variable.getncattr(key)
+                          for key in variable.ncattrs()
+                          if key not in ['_FillValue', 'missing_value']})
+        target[:] = field.reshape(target.shape)
+
+
 def writefile(data, output, title):
     """write data to file as to be read by function readfile"""
     import csv
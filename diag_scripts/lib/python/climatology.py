@@ -0,0 +1,161 @@
+"""
+Vectorized climatological statistics of (time, ...) arrays of monthly data
+
+All functions assume that the first axis of the data is time, holding
+consecutive months starting in January (the usual layout of the
+reformatted T2Ms/T3M files), and accept numpy masked arrays.
+Means are computed by reshape-and-reduce instead of loops over the grid
+points; optional weights (e.g., the number of days per month from
+days_per_month) enter as weights along the time axis.
+
+Run this file to benchmark the functions against the loop versions
+formerly used in esmval_lib.ESMValProject.
+"""
+
+import calendar as pycalendar
+import numpy as np
+
+# Days per month for the CF calendars with a fixed length of the year
+FIXED_CALENDARS = {'noleap': [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31],
+                   '365_day': [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31],
+                   'all_leap': [31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31],
+                   '366_day': [31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31],
+                   '360_day': [30] * 12}
+
+
+def days_per_month(n_months, start_year, start_month=1, calendar='standard'):
+    """Returns the number of days of n_months consecutive months as array.
+    Supports the CF calendars standard/gregorian/proleptic_gregorian/julian
+    (differing only before 1582, which is ignored here), noleap/365_day,
+    all_leap/366_day and 360_day."""
+    months = np.arange(n_months) + start_month - 1
+    years = start_year + months // 12
+    months = months % 12
+    if calendar in FIXED_CALENDARS:
+        return np.array(FIXED_CALENDARS[calendar], dtype=float)[months]
+    if calendar not in ['standard', 'gregorian', 'proleptic_gregorian',
+                        'julian']:
+        raise ValueError("Unsupported calendar: " + str(calendar))
+    return np.array([pycalendar.monthrange(year, month + 1)[1]
+                     for year, month in zip(years, months)], dtype=float)
+
+
+def time_mean(data, weights=None):
+    """Returns the (weighted) mean over the time axis. Masked values are
+    ignored, grid points without any valid value are masked."""
+    if weights is None:
+        return data.mean(axis=0)
+    weights = np.asarray(weights, dtype=float).reshape(
+        (-1,) + (1,) * (data.ndim - 1))
+    return np.ma.average(data, axis=0,
+                         weights=np.broadcast_to(weights, data.shape))
+
+
+def month_mask(n_months, months, start_month=1):
+    """Returns a boolean array, True for the time steps in 'months'
+    (1 = January, ..., 12 = December)."""
+    month_of_step = (np.arange(n_months) + start_month - 1) % 12 + 1
+    return np.in1d(month_of_step, [int(month) for month in months])
+
+
+def monthly_climatology(data, weights=None, start_month=1):
+    """Returns the mean annual cycle (12, ...) of the data, also for time
+    series not covering a whole number of years."""
+    months = (np.arange(data.shape[0]) + start_month - 1) % 12
+    climatology = []
+    for month in xrange(12):
+        select = months == month
+        climatology.append(time_mean(data[select], None if weights is None
+                                     else np.asarray(weights)[select]))
+    if np.ma.isMaskedArray(data):
+        return np.ma.array(climatology)
+    return np.array(climatology)
+
+
+def seasonal_mean(data, months, weights=None, start_month=1):
+    """Returns the mean over all time steps of the given months (an
+    arbitrary set, e.g., [12, 1, 2] for DJF)."""
+    select = month_mask(data.shape[0], months, start_month)
+    return time_mean(data[select], None if weights is None
+                     else np.asarray(weights)[select])
+
+
+def seasonal_series(data, months, weights=None, start_month=1):
+    """Returns the mean over the given months for each year (years which
+    do not contain all months are averaged over the available ones). The
+    season is assigned to the year of its last month, i.e., December
+    counts to the following year for DJF."""
+    months = [int(month) for month in months]
+    month_of_step = (np.arange(data.shape[0]) + start_month - 1) % 12
+    year_of_step = (np.arange(data.shape[0]) + start_month - 1) // 12
+    # Months after the last month of the season belong to the next year
+    last = months[-1] - 1
+    year_of_step = year_of_step + (month_of_step > last)
+    select = month_mask(data.shape[0], months, start_month)
+    series = []
+    for year in np.unique(year_of_step[select]):
+        in_year = select & (year_of_step == year)
+        series.append(time_mean(data[in_year], None if weights is None
+                                else np.asarray(weights)[in_year]))
+    return np.ma.array(series)
+
+
+def annual_means(data, weights=None, start_month=1):
+    """Returns the mean of each (calendar) year."""
+    return seasonal_series(data, range(1, 13), weights, start_month)
+
+
+def dimension_means(data, dim_index):
+    """Returns the mean over all axes except dim_index, i.e., one value
+    per index along dim_index."""
+    axes = tuple(axis for axis in xrange(data.ndim) if axis != dim_index)
+    return data.mean(axis=axes)
+
+
+def _loop_monthly(data):
+    means = np.zeros(data.shape)[:12]
+    for month in xrange(12):
+        for lat in xrange(means.shape[1]):
+            for lon in xrange(means.shape[2]):
+                means[month, lat, lon] = np.mean(data[month::12, lat, lon])
+    return means
+
+
+def _loop_seasonal(data, months):
+    mask = np.ones(data.shape)
+    for month in months:
+        mask[int(month) - 1::12, :, :] = 0
+    masked_values = np.ma.masked_array(data, mask)
+    mean_values = np.zeros(data.shape[1:])
+    for lat in xrange(data.shape[1]):
+        for lon in xrange(data.shape[2]):
+            mean_values[lat, lon] = masked_values[:, lat, lon].mean()
+    return mean_values
+
+
+def benchmark(n_years=10, n_lats=90, n_lons=180):
+    """Compares the vectorized functions with the former loops."""
+    import time
+    data = np.random.rand(n_years * 12, n_lats, n_lons)
+    cases = [('monthly climatology',
+              lambda: _loop_monthly(data),
+              lambda: monthly_climatology(data)),
+             ('seasonal mean (DJF)',
+              lambda: _loop_seasonal(data, [12, 1, 2]),
+              lambda: seasonal_mean(data, [12, 1, 2]))]
+    print("Grid: %d months x %d lats x %d lons" % data.shape)
+    for name, loop, vectorized in cases:
+        start = time.time()
+        expected = loop()
+        loop_time = time.time() - start
+        start = time.time()
+        result = vectorized()
+        vectorized_time = time.time() - start
+        assert np.allclose(expected, result)
+        print("%-20s loop: %8.3f s  vectorized: %8.4f s  speedup: %6.0fx"
+              % (name, loop_time, vectorized_time,
+                 loop_time / max(vectorized_time, 1e-6)))
+
+
+if __name__ == "__main__":
+    benchmark()
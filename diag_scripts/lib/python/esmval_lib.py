@@ -7,6 +7,7 @@ import os
 import pdb
 import sys
 import projects
+import climatology
 import numpy as np
 
 from netCDF4 import Dataset
@@ -40,37 +41,13 @@ class ESMValProject(object):
         """Returns the mean values over certain dimensions. """
         # Usually the input array is three dimensional (time, lats, lons)
         if   (type(dim_index) == int):
-            means = np.zeros(data.shape[dim_index])
-            for mean in xrange(len(means)):
-                if (dim_index == 0):
-                    means[mean] = np.mean(data[mean, :, :])
-                if (dim_index == 1):
-                    means[mean] = np.mean(data[:, mean, :])
-                if (dim_index == 2):
-                    means[mean] = np.mean(data[:, :, mean])
+            means = climatology.dimension_means(data, dim_index)
         elif (dim_index == 'monthly'):
-            means = np.zeros(12)
-            for month in xrange(12):
-                means[month] = np.mean(data[month::12, :, :])
+            means = np.array([data[month::12].mean() for month in xrange(12)])
         elif (dim_index == 'annual'):
-            new_shape = data.shape
-            new_shape = list(new_shape)
-            new_shape[0] = 12
-            means = np.zeros((new_shape))
-            for month in xrange(12):
-                for lat in xrange(means.shape[1]):
-                    for lon in xrange(means.shape[2]):
-                        means[month, lat, lon] = np.mean(data[month::12, lat, lon])
-        elif (dim_index == 'annual'):
-            new_shape = data.shape
-            new_shape = list(new_shape)
-            new_shape[0] = 12
-            means = np.zeros((new_shape))
-            for month in xrange(12):
-                for lat in xrange(means.shape[1]):
-                    for lon in xrange(means.shape[2]):
-                        means[month, lat, lon] = np.mean(data[month::12, lat, lon])
-        return means
+            means = climatology.monthly_climatology(data)
+        # Grid points without valid values become NaN
+        return np.ma.filled(means, np.nan)
 
     def check_model_instances(self, first_set, second_set):
         """Checks that two model sets have same elemenents. """
@@ -122,29 +99,24 @@ class ESMValProject(object):
         """Returns the season specific mean values for each lat, lon from data.
         We assume the usual indexing of time, lat, lon"""
         season_key = experiment + '_season_' + season
-        data_shape = data.shape
 
         if (season == 'annual'):
-            # For annual season we merely copy the data
-            masked_values = data
+            # For annual season we merely use all the data
+            season_months = range(1, 13)
         else:
-            # For a specific season we mask the undesired values
             season_months = modelconfig.get(season_key, 'season_months').split()
-            mask = np.ones((data_shape))
-            for month in season_months:
-                month_loc = int(month) - 1
-                mask[month_loc::12, :, :] = 0
-            masked_values = np.ma.masked_array(data, mask)
 
         if (monthly):
-            return masked_values
+            if (season == 'annual'):
+                return data
+            # For a specific season we mask the undesired values
+            mask = np.zeros(data.shape, dtype=bool)
+            mask[~climatology.month_mask(data.shape[0], season_months)] = True
+            return np.ma.masked_array(data, mask)
 
-        mean_values = np.zeros((data_shape[1], data_shape[2]))
-        # Seasonal mean values
-        for lat in xrange(data_shape[1]):
-            for lon in xrange(data_shape[2]):
-                mean_values[lat, lon] = masked_values[:, lat, lon].mean()
-        return mean_values
+        # Seasonal mean values, grid points without valid values become NaN
+        return np.ma.filled(climatology.seasonal_mean(data, season_months),
+                            np.nan)
 
     def find_nearest_value(self, array, value):
         """ Finds the nearest value in an array. """
@@ -215,7 +187,7 @@ class ESMValProject(object):
             exp = currDiag.get_var_attr_exp()
             for idx in range(len(variables)):
                 for model in self.project_info['MODELS']:
-                    currProject = getattr(vars()['projects'], model.split_entries()[0])()
+                    currProject = projects.get_project(model.entries[0])
                     fullpath = currProject.get_cf_fullpath(self.project_info,
                                                            model,
                                                            field_types[idx],
@@ -307,113 +279,115 @@ class ESMValProject(object):
                        datakey, datafile, extend=''):
         """Extracts desired data for a specific area for a model from all
         model data. Also extends lat/lon coordinates (and therefore required
-        values) if specified (these area "ghostlayers" for interpolation)."""
+        values) if specified (these area "ghostlayers" for interpolation).
+        See iter_model_data for reading the data in blocks of time steps."""
+        lats_req, lons_req, lat_index, lon_index = \
+            self.get_region_indices(modelconfig, experiment, area,
+                                    datafile, extend)
+        data = self.read_region(modelconfig, datafile.variables[datakey],
+                                slice(None), lat_index, lon_index)
+
+        # Specify what to return based on the experiment
+        # Zonal means want latitudes as well
+        if   (experiment == 'zonal_means'):
+            return lats_req, data
+
+        # Equatorial and Southern Hemisphere need all
+        elif (experiment == 'equatorial'
+                or experiment == 'SouthernHemisphere'):
+            return lats_req, lons_req, data
+
+        # The scatterplots are fine with just the data
+        else:
+            return data
+
+    def iter_model_data(self, modelconfig, experiment, area,
+                        datakey, datafile, extend='', block_size=120):
+        """Same as get_model_data, but reads the data in blocks of (at most)
+        block_size time steps. Yields (time slice, data block) pairs, such
+        that callers can reduce the data block by block without holding all
+        time steps in memory, e.g.
+
+            total = 0.
+            for times, block in E.iter_model_data(...):
+                total += block.sum(axis=0)
+            mean = total / datafile.variables[datakey].shape[0]
+
+        The coordinates are available from get_region_indices."""
+        lats_req, lons_req, lat_index, lon_index = \
+            self.get_region_indices(modelconfig, experiment, area,
+                                    datafile, extend)
+        variable = datafile.variables[datakey]
+        for start in xrange(0, variable.shape[0], block_size):
+            times = slice(start, min(start + block_size, variable.shape[0]))
+            yield times, self.read_region(modelconfig, variable, times,
+                                          lat_index, lon_index)
+
+    def get_region_indices(self, modelconfig, experiment, area,
+                           datafile, extend=''):
+        """Returns the lats and lons of the area of interest and the index
+        arrays selecting them from the lat/lon coordinates of datafile.
+        Wrapping around the dateline/poles and the longitude ghost layers
+        (for global longitudes) are expressed by the index arrays, hence
+        no data has to be copied to stitch the area together."""
         lats = datafile.variables['lat'][:]
         lons = datafile.variables['lon'][:]
 
         # We take coordinates and transfer them into array indices
         coords = self.get_area_coordinates(modelconfig, experiment, area)
-        indices = self.get_array_indices(lats, lons, coords)
+        indices = list(self.get_array_indices(lats, lons, coords))
 
         # Next define ghostlayers if needed
         # Latitudes extension assumes that you're not at poles
         # Longitutes extension works with all kinds of values
-        # This is a nasty way to change tuple values but the easiest at hand
         lon_global = False
         if (extend == 'lats' or extend == 'both'):
-            ilist = list(indices)
-            ilist[0] += -1
-            ilist[1] += 1
-            indices = tuple(ilist)
+            indices[0] += -1
+            indices[1] += 1
         if (extend == 'lons' or extend == 'both'):
             # If we have global longtitude values then assign ghost layers later
             if   (indices[3] - indices[2] + 1 == len(lons)):
                 lon_global = True
             else:
-                ilist = list(indices)
-                ilist[2] += -1
-                ilist[3] += 1
-                indices = tuple(ilist)
-
-        # Next extract required lats and lons, the breaks are needed for
-        # special cases when we have to loop over lats and/or lons without
-        # taking all the values
-        lat_break = len(lats) - indices[0]
-        lon_break = len(lons) - indices[2]
-
-        if   (indices[0] > indices[1] and indices[2] > indices[3]):
-            # Both are looped
-            lats_req = np.zeros(len(lats) - indices[0] + indices[1] + 1)
-            lats_req[:lat_break] = lats[indices[0]:]
-            lats_req[lat_break:] = lats[:indices[1] + 1]
-
-            lons_req = np.zeros(len(lons) - indices[2] + indices[3] + 1)
-            lons_req[:lon_break] = lons[indices[2]:]
-            lons_req[lon_break:] = lons[:indices[3] + 1]
-
-        elif (indices[0] > indices[1] and indices[2] <= indices[3]):
-            # Only lats are looped
-            lats_req = np.zeros(len(lats) - indices[0] + indices[1] + 1)
-            lats_req[:lat_break] = lats[indices[0]:]
-            lats_req[lat_break:] = lats[:indices[1] + 1]
-
-            lons_req = lons[indices[2]:indices[3] + 1]
-
-        elif (indices[0] <= indices[1] and indices[2] > indices[3]):
-            # Only lons are looped
-            lats_req = lats[indices[0]:indices[1] + 1]
-
-            lons_req = np.zeros(len(lons) - indices[2] + indices[3] + 1)
-            lons_req[:lon_break] = lons[indices[2]:]
-            lons_req[lon_break:] = lons[:indices[3] + 1]
+                indices[2] += -1
+                indices[3] += 1
 
+        # Indices of the required lats and lons, looping over the end of
+        # the coordinate if needed
+        if (indices[0] > indices[1]):
+            lat_index = np.r_[indices[0]:len(lats), 0:indices[1] + 1]
+        else:
+            lat_index = np.clip(np.arange(indices[0], indices[1] + 1),
+                                0, len(lats) - 1)
+        if (indices[2] > indices[3]):
+            lon_index = np.r_[indices[2]:len(lons), 0:indices[3] + 1]
         else:
-            # Neither are looped
-            lats_req = lats[indices[0]:indices[1] + 1]
-            lons_req = lons[indices[2]:indices[3] + 1]
-
-        # Read in the required data for a specific model.
-        # We have to define some special cases when there's looping over
-        # latitudes or longtitudes.
-        data = np.zeros((datafile.variables[datakey].shape[0],
-                         lats_req.shape[0], lons_req.shape[0]))
-
-        if (indices[0] > indices[1] and indices[2] > indices[3]):
-            # Extract the four corners from the nc file
-            data[:, :lat_break, :lon_break] = \
-                datafile.variables[datakey][:, indices[0]:, indices[2]:]
-
-            data[:, :lat_break, lon_break:] = \
-                datafile.variables[datakey][:, indices[0]:, :indices[3] + 1]
-
-            data[:, lat_break:, :lon_break] = \
-                datafile.variables[datakey][:, :indices[1] + 1, indices[2]:]
-
-            data[:, lat_break:, lon_break:] = \
-                datafile.variables[datakey][:, :indices[1] + 1, :indices[3] + 1]
-
-        elif (indices[0] > indices[1] and indices[2] <= indices[3]):
-            # Looping only over lats
-            data[:, :lat_break, :] = \
-                datafile.variables[datakey][:, indices[0]:,
-                                            indices[2]:indices[3] + 1]
-
-            data[:, lat_break:, :] = \
-                datafile.variables[datakey][:, :indices[1] + 1,
-                                            indices[2]:indices[3] + 1]
-
-        elif (indices[0] <= indices[1] and indices[2] > indices[3]):
-            # Looping only over lons
-            data[:, :, :lon_break] = \
-                datafile.variables[datakey][:, indices[0]:indices[1] + 1,
-                                            indices[2]:]
-
-            data[:, :, lon_break:] = \
-                datafile.variables[datakey][:, indices[0]:indices[1] + 1,
-                                            :indices[3] + 1]
+            lon_index = np.arange(indices[2], indices[3] + 1) % len(lons)
+
+        lats_req = lats[lat_index]
+        lons_req = lons[lon_index]
+
+        # Ghost layers for global longtitude values
+        if (lon_global is True):
+            lon_index = np.r_[lon_index[-1], lon_index, lon_index[0]]
+            lons_req = np.r_[lons_req[-1] - 360, lons_req, lons_req[0] + 360]
+        return lats_req, lons_req, lat_index, lon_index
+
+    def read_region(self, modelconfig, variable, times, lat_index, lon_index):
+        """Reads the time steps 'times' of the area given by the index arrays
+        (see get_region_indices) from a (time, lat, lon) netCDF variable.
+        Each contiguous run of the indices is read as a slice, e.g. the two
+        sides of a region looping over the end of the longitudes, and the
+        slices are concatenated (no data outside the area is read)."""
+        lat_runs = self.get_index_runs(lat_index)
+        lon_runs = self.get_index_runs(lon_index)
+        if (len(lat_runs) == 1 and len(lon_runs) == 1):
+            data = variable[times, lat_runs[0], lon_runs[0]]
         else:
-            data = datafile.variables[datakey][:, indices[0]:indices[1] + 1,
-                                               indices[2]:indices[3] + 1]
+            data = np.ma.concatenate(
+                [np.ma.concatenate([variable[times, lat_run, lon_run]
+                                    for lon_run in lon_runs], axis=2)
+                 for lat_run in lat_runs], axis=1)
 
         # Now we mask unwanted values if specified
         mask = modelconfig.getboolean('general', 'mask_unwanted_values')
@@ -433,33 +407,19 @@ class ESMValProject(object):
                 data = self.mask_unwanted_values(data, high=high)
             elif (llow):
                 data = self.mask_unwanted_values(data, low=low)
+        return data
 
-        # Ghost layers for global longtitude values
-        if (lon_global is True):
-            newlons = np.zeros(len(lons_req) + 2)
-            newdata = np.zeros((data.shape[0], data.shape[1], data.shape[2] + 2))
-            newlons[0] = lons_req[-1] - 360
-            newlons[1:-1] = lons_req
-            newlons[-1] = lons_req[0] + 360
-            newdata[:, :, 0] = data[:, :, -1]
-            newdata[:, :, 1:-1] = data[:, :, :]
-            newdata[:, :, -1] = data[:, :, 0]
-            lons_req = newlons
-            data = newdata
+    def get_index_runs(self, index):
+        """Splits an index array into slices of consecutive indices. """
+        breaks = np.flatnonzero(np.diff(index) != 1) + 1
+        starts = np.r_[0, breaks]
+        stops = np.r_[breaks, len(index)]
+        return [slice(index[start], index[stop - 1] + 1)
+                for start, stop in zip(starts, stops)]
 
-        # Specify what to return based on the experiment
-        # Zonal means want latitudes as well
-        if   (experiment == 'zonal_means'):
-            return lats_req, data
-
-        # Equatorial and Southern Hemisphere need all
-        elif (experiment == 'equatorial'
-                or experiment == 'SouthernHemisphere'):
-            return lats_req, lons_req, data
-
-        # The scatterplots are fine with just the data
-        else:
-            return data
+    def get_jobs(self):
+        """ returns the number of namelist tasks run in parallel (--jobs) """
+        return self.project_info['RUNTIME'].get('jobs', 1)
 
     def get_model_id(self, inmodel):
         """ Returns the id tag of the model if defined and empty string if not.
@@ -756,7 +716,7 @@ class ESMValProject(object):
                 for model in self.project_info['MODELS']:
                         #~ print model.split_entries()[0] # gives 'JSBACH'
                         #~ print vars()
-                        currProject = getattr(vars()['projects'], model.split_entries()[0])()
+                        currProject = projects.get_project(model.entries[0])
                         variable_defs_base_vars = currDiag.add_base_vars_fields(requested_vars, model)
 
                         base_vars = currDiag.select_base_vars(variable_defs_base_vars, model,
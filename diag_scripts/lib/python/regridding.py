@@ -0,0 +1,167 @@
+"""
+Reusable regridding between regular lat/lon grids
+
+A Regridder holds everything that depends on the source and target grid
+only, such that it can be applied to any number of fields (or stacks of
+fields) on the same grids:
+ - 'nearest' and 'linear' interpolation are stored as a sparse matrix of
+   weights (target points x source points), applying them is a single
+   sparse matrix multiplication for a whole stack of fields,
+ - 'cubic' interpolation (Clough-Tocher, as in scipy's griddata) keeps the
+   Delaunay triangulation of the source grid, only the (linear) gradient
+   estimation is done per stack.
+Target points outside the convex hull of the source grid (NaN with
+'linear'/'cubic') are filled with the nearest neighbour values.
+
+The results are identical to scipy.interpolate.griddata on the points
+(lat, lon) of the grids. Regridders are cached in memory and, if a
+cache_dir is given, on disk, keyed by the grids and the method.
+"""
+
+import cPickle as pickle
+import hashlib
+import os
+import numpy as np
+from scipy import sparse
+from scipy.interpolate import CloughTocher2DInterpolator
+from scipy.spatial import Delaunay, cKDTree
+
+# Regridders of this process, by key
+_regridders = {}
+
+
+def grid_points(lats, lons):
+    """Returns the (lat, lon) points of a regular grid, lons varying
+    fastest (i.e., the order of data.reshape(-1) for (lat, lon) data)."""
+    grid_lats, grid_lons = np.meshgrid(lats, lons, indexing='ij')
+    return np.column_stack((grid_lats.reshape(-1), grid_lons.reshape(-1)))
+
+
+def regridder_key(lats, lons, target_lats, target_lons, method):
+    """Returns a hash identifying the source/target grids and the method."""
+    sha = hashlib.sha1(method)
+    for coordinate in [lats, lons, target_lats, target_lons]:
+        coordinate = np.ascontiguousarray(coordinate, dtype=np.float64)
+        sha.update(str(coordinate.shape))
+        sha.update(coordinate.tostring())
+    return sha.hexdigest()
+
+
+def get_regridder(lats, lons, target_lats, target_lons, method='cubic',
+                  cache_dir=None):
+    """Returns the (cached) Regridder for the given grids and method."""
+    key = regridder_key(lats, lons, target_lats, target_lons, method)
+    if key not in _regridders:
+        regridder = None
+        if cache_dir is not None:
+            regridder = Regridder.load(cache_dir, key)
+        if regridder is None:
+            regridder = Regridder(lats, lons, target_lats, target_lons,
+                                  method)
+            if cache_dir is not None:
+                regridder.save(cache_dir, key)
+        _regridders[key] = regridder
+    return _regridders[key]
+
+
+def sparse_weights(indices, weights, n_source):
+    """Returns the sparse (target x source) matrix from the source indices
+    and weights per target point (one row each)."""
+    n_target, n_weights = indices.shape
+    rows = np.repeat(np.arange(n_target), n_weights)
+    return sparse.csr_matrix((weights.reshape(-1),
+                              (rows, indices.reshape(-1))),
+                             shape=(n_target, n_source))
+
+
+class Regridder(object):
+    """Interpolation from one lat/lon grid to another."""
+    def __init__(self, lats, lons, target_lats, target_lons, method='cubic'):
+        if method not in ['nearest', 'linear', 'cubic']:
+            raise ValueError("Unknown interpolation method: " + str(method))
+        self.method = method
+        self.source_shape = (len(lats), len(lons))
+        self.target_shape = (len(target_lats), len(target_lons))
+        points = grid_points(lats, lons)
+        targets = grid_points(target_lats, target_lons)
+
+        # Nearest neighbours, used on their own or to fill the points
+        # outside of the triangulation
+        nearest = cKDTree(points).query(targets)[1]
+        self.nearest = sparse_weights(nearest.reshape(-1, 1),
+                                      np.ones((len(targets), 1)),
+                                      len(points))
+        self.weights = None
+        self.triangulation = None
+        self.targets = targets
+        self.outside = np.zeros(len(targets), dtype=bool)
+
+        if method == 'nearest':
+            self.weights = self.nearest
+            return
+
+        triangulation = Delaunay(points)
+        simplices = triangulation.find_simplex(targets)
+        self.outside = simplices < 0
+        if method == 'linear':
+            # Barycentric coordinates of the targets in their triangles
+            transform = triangulation.transform[simplices]
+            delta = targets - transform[:, 2]
+            bary = np.einsum('ijk,ik->ij', transform[:, :2], delta)
+            weights = np.column_stack((bary, 1 - bary.sum(axis=1)))
+            weights[self.outside] = 0
+            self.weights = sparse_weights(
+                triangulation.simplices[simplices], weights, len(points))
+        else:
+            self.triangulation = triangulation
+
+    def __call__(self, data):
+        """Interpolates data of shape (..., lats, lons) to the target grid,
+        returns an array of shape (..., target lats, target lons)."""
+        data = np.asarray(data, dtype=np.float64)
+        stack_shape = data.shape[:-2]
+        values = data.reshape((-1,) + (np.prod(self.source_shape),)).T
+
+        if self.weights is not None:
+            result = self.weights.dot(values)
+        else:
+            interpolator = CloughTocher2DInterpolator(self.triangulation,
+                                                      values)
+            result = interpolator(self.targets)
+        if np.any(self.outside) or np.isnan(result).any():
+            nearest = self.nearest.dot(values)
+            fill = np.isnan(result)
+            fill[self.outside] = True
+            result[fill] = nearest[fill]
+        return result.T.reshape(stack_shape + self.target_shape)
+
+    def save(self, cache_dir, key):
+        """Stores the regridder in cache_dir (if possible)."""
+        if not os.path.isdir(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except OSError:
+                if not os.path.isdir(cache_dir):
+                    raise
+        path = os.path.join(cache_dir, key + ".pkl")
+        tmp_path = path + ".tmp" + str(os.getpid())
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(self, f, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError):
+            # Some scipy versions can't pickle the triangulation
+            os.remove(tmp_path)
+            return
+        os.rename(tmp_path, path)
+
+    @classmethod
+    def load(cls, cache_dir, key):
+        """Returns the regridder stored in cache_dir or None."""
+        path = os.path.join(cache_dir, key + ".pkl")
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except Exception:
+            return None
@@ -4,8 +4,8 @@ implicit none
 
 !----------------------------------------
 ! reads in text files containing details of all events defined by global_rain_sm_lgc.f90
-! and outputs ascii files containing large control sample of soil moisture anomaly differences from each event configuration
-! each filename defines x,y location and month and contains info on event at that pixel 
+! and outputs a binary file containing large control sample of soil moisture anomaly differences from each event configuration
+! each record defines x,y location (of the 5x5 deg box) and contains the samples and events of that box for the month 
 ! (w=wet pixel, d=dry pixels)
 ! 1: number of days since 31/12/02, 2: rain_w, 3: rain_d, 4: sm_w, 5: ave sm_d, 6: sm_clim_w, 7:sm_clim_d
 ! 8: box-mean sm, 9:n_d, 10 onwards :pixel numbers for n dry pixels
@@ -35,7 +35,7 @@ integer::i,j,l,iop,ii,jj,s,iout,jout,jjout,jjout_old=0,ndom
 real::a,b, find_max_contrast,dsm,dsm_max=10.*2*1000.
 !
 character*150::event_fname
-character*2::cmon,ich,jch
+character*2::cmon
 integer::ic,rw,rd,smw,smd,smw_clim,smd_clim,n,box_mean_sm,day
 integer,dimension((box_del2*2+1)**2)::k
 real,dimension(nyr,nt/npd,1-box_del2:ny+box_del2,1-box_del2:nx+box_del2)::sm
@@ -150,6 +150,17 @@ endif
 
 
 
+!----------------------------
+! OPEN OUTPUT FILE
+! all samples and events of this month go to a single binary (stream)
+! file, one record per 5x5 deg output box:
+! iout, jjout, nsample, nevent, sample(1:nsample), event(1:nevent)
+!----------------------------
+
+open(3,file=trim(sfiledir)//'5x5G_mon'//cmon//'.bin',status='replace',&
+       access='stream',form='unformatted')
+
+
 ! LOOP OVER ALL POINTS LOOKING FOR EVENTS
 do j=1, ny
 
@@ -363,22 +374,13 @@ do j=1, ny
 !
         if(nevent(jout,iout).eq.0) cycle
 !
-        write(ich,'(i2)') iout ; if(iout.lt.10)ich(1:1)='0'
-        write(jch,'(i2)') jjout ; if(jjout.lt.10)jch(1:1)='0'
-
-        open(3,file=trim(sfiledir)//'5x5G_mon'//cmon//'/i'//ich//'j'//jch//'_fort.3')
-        open(4,file=trim(sfiledir)//'5x5G_mon'//cmon//'/i'//ich//'j'//jch//'_fort.4')
-        do i=1,nsample(jout,iout)
-            write(3,*) sample(i,jout,iout)
-        enddo
-
-        do i=1,nevent(jout,iout)
-            write(4,*) event(i,jout,iout)
-        enddo
-        close(3) ; close(4)
+        write(3) iout, jjout, nsample(jout,iout), nevent(jout,iout), &
+                 sample(1:nsample(jout,iout),jout,iout), &
+                 event(1:nevent(jout,iout),jout,iout)
     enddo
 
 enddo   !end of y loop
+close(3)
 !
 
 end
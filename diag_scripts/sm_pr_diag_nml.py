@@ -56,8 +56,8 @@ import os
 import re
 import glob
 import errno
+import multiprocessing
 import numpy as np
-import random as rd
 import ConfigParser
 import pdb
 import stat
@@ -105,6 +105,23 @@ def main(project_info):
     work_dir = E.get_work_dir()
     verbosity = E.get_verbosity()
     fileout = work_dir
+
+    # Settings of the permutation test
+    modelconfig = ConfigParser.ConfigParser()
+    modelconfig.read(E.get_configfile())
+    shuffle_times = 500
+    if modelconfig.has_option('general', 'shuffle_times'):
+        shuffle_times = modelconfig.getint('general', 'shuffle_times')
+    seed = None
+    if modelconfig.has_option('general', 'random_seed'):
+        seed = modelconfig.getint('general', 'random_seed')
+    # The CPUs are shared with the other tasks of the namelist (--jobs)
+    processes = max(1, multiprocessing.cpu_count() // E.get_jobs())
+    if modelconfig.has_option('general', 'processes'):
+        processes = modelconfig.getint('general', 'processes')
+    month_processes = 1
+    if modelconfig.has_option('general', 'month_processes'):
+        month_processes = modelconfig.getint('general', 'month_processes')
     
     if not os.path.exists(plot_dir):
         os.makedirs(plot_dir)
@@ -139,52 +156,42 @@ def main(project_info):
 
         samplefileout = fileout + 'sample_events/'
 
-        for mn in np.arange(1, 13):
-
-            # -------------------------------------------------
-            # Create montly arrays required by fortran routines
-            # -------------------------------------------------
-
-            prbef, smbef, praft, smaft, \
-                monthlypr, monthlysm, days_per_year = get_monthly_input(project_info, mn, time, 
-                                                         lon, lat, time_bnds_1, pr, sm, fileout,
-                                                         samplefileout, model,
-                                                         verbosity)
-
-            # -----------------------
-            # Run fortran routines
-            # -----------------------
-
-            info('Executing global_rain_sm for month ' + str(mn), verbosity, required_verbosity=1)
-
-            grs.global_rain_sm(np.asfortranarray(monthlypr),
-                               np.asfortranarray(prbef),
-                               np.asfortranarray(praft),
-                               np.asfortranarray(monthlysm),
-                               np.asfortranarray(smbef),
-                               np.asfortranarray(smaft),
-                               np.asfortranarray(smclim[mn - 1, :, :]),
-                               np.asfortranarray(topo),
-                               np.asfortranarray(lon),
-                               np.asfortranarray(mn),
-                               fileout, days_per_year)
-
-            info('Executing sample_events for month ' + str(mn), verbosity, required_verbosity=1)
-
-            se.sample_events(np.asfortranarray(monthlysm),
-                             np.asfortranarray(smbef),
-                             np.asfortranarray(smaft),
-                             np.asfortranarray(lon),
-                             np.asfortranarray(lat),
-                             np.asfortranarray(mn),
-                             fileout, days_per_year, samplefileout)
+        # Input of all months, inherited by the worker processes
+        month_input.update(project_info=project_info, time=time, lon=lon,
+                           lat=lat, time_bnds_1=time_bnds_1, pr=pr, sm=sm,
+                           smclim=smclim, topo=topo, fileout=fileout,
+                           samplefileout=samplefileout, model=model,
+                           verbosity=verbosity)
+
+        months = list(np.arange(1, 13))
+        if month_processes > 1:
+            pool = multiprocessing.Pool(min(month_processes, len(months)))
+            try:
+                month_boxes = pool.map(process_month, months)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            month_boxes = map(process_month, months)
+        month_input.clear()
+
+        # Samples (non events) and events of each box, all months
+        boxes = {}
+        for samples_events in month_boxes:
+            for box, (samples, events) in samples_events.iteritems():
+                boxes.setdefault(box, ([], []))
+                boxes[box][0].append(samples)
+                boxes[box][1].append(events)
 
         # ---------------------------------------------------
         # Compute p_values (as in Fig. 3, Taylor et al 2012)
         # --------------------------------------------------
         info('Computing diagnostic', verbosity, required_verbosity=1)
 
-        xs, ys, p_vals = get_p_val(samplefileout)
+        xs, ys, p_vals = get_p_val(boxes,
+                                   shuffle_times=shuffle_times,
+                                   seed=seed,
+                                   processes=processes)
 
         # --------------------------------------------------
         # Save diagnostic to netCDF file and plot
@@ -201,6 +208,118 @@ def main(project_info):
     
 
 
+# Input shared by the months of one model, see process_month
+month_input = {}
+
+
+def process_month(mn):
+
+    """
+    ;; Arguments
+    ;;    mn: int
+    ;;          month
+    ;;
+    ;; Return
+    ;;    boxes: dict
+    ;;          (samples, events) per 5x5 deg grid-box, see read_sample_store
+    ;;
+    ;; Description
+    ;;    Runs the fortran routines for one month, with the input in
+    ;;    month_input. The months are independent of each other, hence
+    ;;    they can be run in parallel processes.
+    ;;
+    """
+
+    mi = month_input
+    verbosity = mi['verbosity']
+    fileout = mi['fileout']
+    samplefileout = mi['samplefileout']
+
+    # -------------------------------------------------
+    # Create montly arrays required by fortran routines
+    # -------------------------------------------------
+
+    prbef, smbef, praft, smaft, \
+        monthlypr, monthlysm, days_per_year = get_monthly_input(mi['project_info'], mn, mi['time'], 
+                                                 mi['lon'], mi['lat'], mi['time_bnds_1'],
+                                                 mi['pr'], mi['sm'], fileout,
+                                                 samplefileout, mi['model'],
+                                                 verbosity)
+
+    # -----------------------
+    # Run fortran routines
+    # -----------------------
+
+    info('Executing global_rain_sm for month ' + str(mn), verbosity, required_verbosity=1)
+
+    grs.global_rain_sm(np.asfortranarray(monthlypr),
+                       np.asfortranarray(prbef),
+                       np.asfortranarray(praft),
+                       np.asfortranarray(monthlysm),
+                       np.asfortranarray(smbef),
+                       np.asfortranarray(smaft),
+                       np.asfortranarray(mi['smclim'][mn - 1, :, :]),
+                       np.asfortranarray(mi['topo']),
+                       np.asfortranarray(mi['lon']),
+                       np.asfortranarray(mn),
+                       fileout, days_per_year)
+
+    info('Executing sample_events for month ' + str(mn), verbosity, required_verbosity=1)
+
+    se.sample_events(np.asfortranarray(monthlysm),
+                     np.asfortranarray(smbef),
+                     np.asfortranarray(smaft),
+                     np.asfortranarray(mi['lon']),
+                     np.asfortranarray(mi['lat']),
+                     np.asfortranarray(mn),
+                     fileout, days_per_year, samplefileout)
+
+    # The event files of global_rain_sm are only needed by sample_events
+    shutil.rmtree(os.path.join(fileout, "event_output",
+                               "mon" + str(mn).zfill(2)))
+
+    store = os.path.join(samplefileout, "5x5G_mon" + str(mn).zfill(2) + ".bin")
+    boxes = read_sample_store(store)
+    os.remove(store)
+    return boxes
+
+
+def read_sample_store(filename):
+
+    """
+    ;; Arguments
+    ;;    filename: str
+    ;;          binary file written by sample_events for one month
+    ;;
+    ;; Return
+    ;;    boxes: dict
+    ;;          (samples, events) arrays per 5x5 deg grid-box (iout, jout)
+    ;;
+    ;; Description
+    ;;    Each record of the file holds iout, jout, nsample, nevent (int32),
+    ;;    followed by the nsample samples and nevent events (float32).
+    ;;    A box written twice keeps its last record.
+    ;;
+    """
+
+    with open(filename, 'rb') as f:
+        buf = f.read()
+
+    boxes = {}
+    offset = 0
+    while offset < len(buf):
+        iout, jout, nsample, nevent = np.frombuffer(buf, dtype='i4', count=4,
+                                                    offset=offset)
+        offset += 16
+        samples = np.frombuffer(buf, dtype='f4', count=nsample, offset=offset)
+        offset += 4 * nsample
+        events = np.frombuffer(buf, dtype='f4', count=nevent, offset=offset)
+        offset += 4 * nevent
+        boxes[(int(iout), int(jout))] = (samples.astype(float),
+                                         events.astype(float))
+    return boxes
+
+
 def coord_change(cubelist):
 
     """
@@ -296,7 +415,7 @@ def get_monthly_input(project_info, mn, time, lon, lat,
     #-------------------------
     
     model = project_info['MODELS'][0]
-    currProject = getattr(vars()['projects'], model.split_entries()[0])()
+    currProject = projects.get_project(model.entries[0])
 
     model_info = model.split_entries()
 
@@ -350,13 +469,6 @@ def get_monthly_input(project_info, mn, time, lon, lat,
     smbef = np.zeros((nyr, 8, ny, nx), dtype='f4')
     smaft = np.zeros((nyr, 8, ny, nx), dtype='f4')
 
-    try:
-        os.mkdir(os.path.join(samplefileout, "5x5G_mon" + str(mn).zfill(2)), stat.S_IWUSR | stat.S_IRUSR | stat.S_IXUSR | stat.S_IRGRP | stat.S_IXGRP | stat.S_IROTH | stat.S_IXOTH)
-    except OSError as exc:
-        if exc.errno != errno.EEXIST:
-            raise exc
-        pass
-
     try:
         os.mkdir(os.path.join(fileout, "event_output", "mon" + str(mn).zfill(2)), stat.S_IWUSR | stat.S_IRUSR | stat.S_IXUSR | stat.S_IRGRP | stat.S_IXGRP | stat.S_IROTH | stat.S_IXOTH)
     except OSError as exc:
@@ -508,12 +620,99 @@ def get_monthly_input(project_info, mn, time, lon, lat,
 
 
 
-def get_p_val(in_dir):
+def permutation_p_value(events, non_events, shuffle_times, random_state,
+                        block_size=10000000):
+
+    """
+    ;; Arguments
+    ;;    events: array
+    ;;          values of the events
+    ;;    non_events: array
+    ;;          values of the non events
+    ;;    shuffle_times: int
+    ;;          number of random permutations
+    ;;    random_state: numpy.random.RandomState
+    ;;          random number generator
+    ;;    block_size: int
+    ;;          maximum number of permuted values held in memory
+    ;;
+    ;; Return
+    ;;    p_val: float
+    ;;          percentile of the observed delta among the deltas of the
+    ;;          randomly permuted events/non events
+    ;;
+    ;; Description
+    ;;    All permutations are drawn as index arrays (argsort of random
+    ;;    numbers) and the deltas of a block of permutations are computed
+    ;;    at once. The p_value is the position of the shuffled delta closest
+    ;;    to the observed delta, found with searchsorted.
+    ;;
+    """
+
+    all_ev_nev = np.concatenate((events, non_events))
+    n_ev = len(events)
+    n_all = len(all_ev_nev)
+    total = all_ev_nev.sum()
+
+    # delta = events_average - non_events_average
+    delta = np.mean(events) - np.mean(non_events)
+
+    sdeltas = []
+    n_block = max(1, block_size // max(n_all, 1))
+    for start in range(0, shuffle_times, n_block):
+        n_perm = min(n_block, shuffle_times - start)
+        perms = np.argsort(random_state.rand(n_perm, n_all), axis=1)
+        sev_sum = all_ev_nev[perms[:, :n_ev]].sum(axis=1)
+        sdeltas.append(sev_sum / n_ev - (total - sev_sum) / (n_all - n_ev))
+    sdeltas = np.sort(np.concatenate(sdeltas))
+
+    # Closest shuffled delta, the lower one if both neighbours are equally
+    # close, and its first position in the sorted deltas
+    i = np.searchsorted(sdeltas, delta)
+    if i == len(sdeltas) or \
+            (i > 0 and abs(sdeltas[i - 1] - delta) <= abs(sdeltas[i] - delta)):
+        i = np.searchsorted(sdeltas, sdeltas[i - 1])
+
+    return i / float(shuffle_times)
+
+
+def get_box_p_val(args):
+
+    """
+    ;; Arguments
+    ;;    args: tuple
+    ;;          non events, events, shuffle_times and random seed of one
+    ;;          grid box
+    ;;
+    ;; Return
+    ;;    p_val: float
+    ;;          p_value of the grid box (-999. if less than 25 events)
+    ;;
+    """
+
+    non_events, events, shuffle_times, seed = args
+
+    # Minumun number of event to consider the gridbox = 25
+    if len(events) <= 24:
+        return -999.
+
+    return permutation_p_value(events, non_events, shuffle_times,
+                               np.random.RandomState(seed))
+
+
+def get_p_val(boxes, shuffle_times=500, seed=None, processes=1):
 
     """ 
     ;; Arguments
-    ;;    in_dir: dir
-    ;;          directory with intermediary files from fortran routines
+    ;;    boxes: dict
+    ;;          lists of the non events and events (arrays) per 5x5 deg
+    ;;          grid-box (x, y), as returned by the fortran routines
+    ;;    shuffle_times: int
+    ;;          number of random permutations per grid-box
+    ;;    seed: int
+    ;;          seed for reproducible permutations (None: random)
+    ;;    processes: int
+    ;;          number of processes sharing the grid-boxes
     ;;
     ;; Return 
     ;;    xs: array [lon]
@@ -533,107 +732,34 @@ def get_p_val(in_dir):
     ;;
     """
 
-    # Find gridboxes (xs, ys) with events
+    # Gridboxes (xs, ys) with events
 
-    f_ev = glob.glob(in_dir +'*/*.4')
-    xss = []
-    yss = []
-    for f in f_ev:
-        xss.append(int(f[-12:-10]))
-        yss.append(int(f[-9:-7]))   
-    xs = np.unique(xss) 
-    ys = np.unique(yss)
-    
-    p_vals = [] 
+    xs = np.unique([box[0] for box in boxes])
+    ys = np.unique([box[1] for box in boxes])
 
-    for x in xs: 
+    # The seed of each box only depends on the seed and the box, hence
+    # the results do not depend on the number of processes
+    tasks = []
+    for x in xs:
         for y in ys:
-            
-            # Read events
-
-            ev_f = glob.glob(in_dir +'*/i'+str(x).zfill(2) +'j'+str(y).zfill(2)+'_fort.4')
-
-            levents = []
-
-            for ef in ev_f:
-
-                levents.append((np.genfromtxt(ef,dtype=(float), \
-                               skip_header=0, delimiter=' ')).tolist())
-
-            if levents != []: 
-                events = []
-                for l in levents:
-                    if isinstance(l, list):
-                        for e in l:
-                            events.append(e)
-                    else:
-                        events.append(l)
-            else:
-               events = levents
-
-            # Minumun number of event to consider the gridbox = 25   
-            if len(events) > 24:
-
-                # Read non events
-
-                nev_f = glob.glob(in_dir +'*/i'+str(x).zfill(2) +'j'+ str(y).zfill(2) +'_fort.3')
-
-                lnon_events = []
-
-                for ef in nev_f:
-
-                    lnon_events.append((np.genfromtxt(ef,dtype=(float), \
-                                   skip_header=0, delimiter=' ')).tolist())
-
-                if lnon_events != []: 
-                    non_events = []                     
-                    for l in lnon_events:
-                        if isinstance(l, list):
-                            for e in l:
-                                non_events.append(e)
-                        else:
-                            non_events.append(l) 
-                else:
-                    non_events = lnon_events 
-
-                # delta = events_average - non_events_average
-                delta = np.mean(events) - np.mean(non_events)
-
-                #-----------------------------
-                # Merge events and non events
-                # Shuffle n times (n=500)
-                # Get delta of shuffled events
-                #-----------------------------
-
-                all_ev_nev = events + non_events
-
-                sdeltas = []
-
-                shuffle_times = 500.0
-                for i in range(0, int(shuffle_times)):
-
-                    rd.shuffle(all_ev_nev)
-                    sev = all_ev_nev[0:len(events)]
-                    snev = all_ev_nev[len(events)::]
-                    sdelta = np.mean(sev) - np.mean(snev)
-                    sdeltas.append(sdelta)
-                #-----------------------------    
-                # Sort (min to max) shuffled deltas
-                # Find p_val
-                #-----------------------------
-
-                sdeltas.sort()
-
-                closet_val = min(sdeltas, key=lambda x:abs(x-delta))
-
-                p_val = sdeltas.index(closet_val)/shuffle_times
-
-                p_vals.append(p_val)
-
-            else:
+            non_events, events = boxes.get((x, y), ([], []))
+            box_seed = None if seed is None else [seed, x, y]
+            tasks.append((np.concatenate(non_events) if non_events != []
+                          else np.array([]),
+                          np.concatenate(events) if events != []
+                          else np.array([]),
+                          shuffle_times, box_seed))
+
+    if processes > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(processes)
+        try:
+            p_vals = pool.map(get_box_p_val, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        p_vals = map(get_box_p_val, tasks)
 
-                p_vals.append(-999.)  
- 
     return xs, ys, p_vals
 
 
@@ -815,7 +941,7 @@ def get_topo(project_info, longi, lati, model):
     # Read model info
     #-------------------------
     
-    currProject = getattr(vars()['projects'], model.split_entries()[0])()
+    currProject = projects.get_project(model.entries[0])
 
     model_info = model.split_entries()
 
@@ -889,7 +1015,7 @@ def plot_diagnostic(fileout, plot_dir, project_info, model):
     # Read model info
     #-------------------------
     
-    currProject = getattr(vars()['projects'], model.split_entries()[0])()
+    currProject = projects.get_project(model.entries[0])
 
     start_year = currProject.get_model_start_year(model)
     end_year = currProject.get_model_end_year(model)
@@ -989,7 +1115,7 @@ def read_pr_sm_topo(project_info, model):
     # Read model info
     #-------------------------
 
-    currProject = getattr(vars()['projects'], model.split_entries()[0])()
+    currProject = projects.get_project(model.entries[0])
 
     model_info = model.split_entries()
 
@@ -1239,7 +1365,7 @@ def write_nc(fileout, xs, ys, p_vals, project_info, model):
     # Read model info
     #-------------------------
     
-    currProject = getattr(vars()['projects'], model.split_entries()[0])()
+    currProject = projects.get_project(model.entries[0])
 
     model_info = model.split_entries()
 
@@ -169,8 +169,7 @@ def get_climo_filenames(E, variable):
         exp = currDiag.get_var_attr_exp()
         for idx in range(len(variables)):
             for model in E.project_info['MODELS']:
-                currProject = getattr(vars()['projects'],
-                                      model.split_entries()[0])()
+                currProject = projects.get_project(model.entries[0])
                 fullpath = currProject.get_cf_fullpath(E.project_info,
                                                        model,
                                                        field_types[idx],
@@ -36,6 +36,14 @@ class writeProjinfoError(Exception):
         return repr(self.value)
 
 
+class taskExecuteError(Exception):
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return repr(self.value)
+
+
 def info(string, verbosity, required_verbosity):
     """ @brief Print an info string to standard out
         @param string the info message to print
@@ -0,0 +1,334 @@
+# Metadata check of input files which are already CMOR compliant
+#
+# What it does:
+#  - Checks whether an input file already looks like the output of the
+#    default check/reformat (reformat_scripts/default/): variable name,
+#    float type, _FillValue and the attributes of the CMOR table
+#    (var_attrib), names, order, orientation, type and attributes of the
+#    coordinates (time_attrib, plev_attrib, lat_attrib, lon_attrib) and a
+#    monthly time axis in TUNITS covering exactly start_year-01 to
+#    end_year-12 at the 15th of each month, 00:00 (check_time_range).
+#    Only the attributes and the coordinate variables are read, not the
+#    data of the variable.
+#  - The units must be the CMOR units of the variable: check_units renames
+#    (and possibly rescales) every alternative unit listed in
+#    recognized_units.dat, so a file in any of those units differs from the
+#    reformatted one and is never compliant.
+#  - Jobs needing more than the reformat_coord/check_units/var_attrib steps
+#    of the default reformat are never eligible: other reformat routines,
+#    model fixes, several input files, irregular grids, land/ocean masks,
+#    porosity/depth information and non-monthly fields.
+#  - A compliant input file is linked into the climo directory instead of
+#    being rewritten by the reformat script (see
+#    reformat.ReformatJob.link_compliant_input), any failed check falls
+#    back to the reformat script.
+#
+# CMIP5 input files never qualify: their variables carry cell_methods
+# "time: mean", missing_value, history, original_name, ..., their
+# coordinates carry bounds and their time axis is in other units (e.g.
+# days since 1850-01-01) at mid-month 12:00. A link cannot hide these
+# differences and diagnostics may rely on the time units of the
+# reformatted files, so only files written by the default reformat itself
+# (e.g. copied from another climo directory) pass. The fast path is
+# therefore off by default, the GLOBAL entry
+#    <reformat_fast_path type="boolean"> True </reformat_fast_path>
+# turns it on.
+#
+# Usage:
+#    problem = check_job(reformat_script, runtime, temporary, infiles)
+#    if problem is None:
+#        problem = check_file(infiles[0], "tas", "T2Ms", 2000, 2004)
+#    if problem is None:
+#        link(infiles[0], outfile)
+
+import os
+import tempfile
+
+import numpy as np
+try:
+    import netCDF4
+except ImportError:
+    netCDF4 = None
+
+# Fill value and time units of the reformatted files (see constants.ncl)
+FILL = 1.e20
+TUNITS = "days since 1950-01-01 00:00:00"
+CMOR_TABLE = os.path.join("reformat_scripts", "cmor", "CMOR_%s.dat")
+FIX_FILE = os.path.join("reformat_scripts", "fixes", "%s_%s_fix.ncl")
+
+# Coordinates in the order of the reformatted files
+COORDINATES = ['time', 'plev', 'lat', 'lon']
+
+# Attributes of the reformatted coordinates (time_attrib, plev_attrib,
+# lat_attrib and lon_attrib), the calendar of the time coordinate is kept
+COORDINATE_ATTRIBUTES = {
+    'time': {'long_name': "time", 'axis': "T", 'units': TUNITS,
+             'standard_name': "time"},
+    'plev': {'positive': "down", 'axis': "Z", 'long_name': "pressure",
+             'units': "Pa", 'standard_name': "air_pressure"},
+    'lat': {'long_name': "latitude", 'axis': "Y", 'units': "degrees_north",
+            'standard_name': "latitude"},
+    'lon': {'long_name': "longitude", 'axis': "X", 'units': "degrees_east",
+            'standard_name': "longitude"}}
+
+# Variables for which the default reformat adds porosity/depth information
+EXTENDED_VARIABLES = ['mrso', 'mrsos']
+
+# Variable attributes of the CMOR tables, by variable
+_cmor_attributes = {}
+
+
+def get_cmor_attributes(variable):
+    """ @brief Variable attributes of a variable in its CMOR table
+               (reformat_scripts/cmor/CMOR_<variable>.dat)
+        @return A dictionary, None if there is no table
+
+        The values are read like read_cmor does: the second ':'-separated
+        field of the line, squeezed.
+    """
+    if variable not in _cmor_attributes:
+        attributes = None
+        try:
+            with open(CMOR_TABLE % variable) as f:
+                in_attributes = False
+                for line in f:
+                    if line.startswith("! Variable attributes"):
+                        attributes = {}
+                        in_attributes = True
+                    elif line.startswith("! Additional variable"):
+                        break
+                    elif in_attributes and not line.startswith("!"):
+                        fields = line.split(":")
+                        if len(fields) > 1:
+                            attributes[fields[0].strip()] = fields[1].strip()
+        except IOError:
+            pass
+        _cmor_attributes[variable] = attributes
+    return _cmor_attributes[variable]
+
+
+def get_cmor_units(variable):
+    """ @brief Units of a variable in its CMOR table
+        @return A string, None if there is no table or no units entry
+    """
+    return (get_cmor_attributes(variable) or {}).get('units')
+
+
+def check_job(reformat_script, runtime, temporary, infiles):
+    """ @brief Check whether a reformat job may use the fast path at all
+        @param reformat_script The reformat script of the job
+        @param runtime The 'RUNTIME' entries of the job
+        @param temporary The 'TEMPORARY' section of the job
+        @param infiles The input files of the job
+        @return None if eligible, otherwise the reason (a string)
+    """
+    if os.path.basename(os.path.dirname(reformat_script)) != "default":
+        return "reformat routine " + reformat_script
+    fixfile = FIX_FILE % (runtime['project_basename'], runtime['model'])
+    if os.path.isfile(fixfile):
+        return "model fixes in " + fixfile
+    if len(infiles) != 1:
+        return "%d input files" % len(infiles)
+    if "Lmon" in temporary['infile_path'] \
+            or "Omon" in temporary['infile_path']:
+        return "land/ocean mask information to be added"
+    if temporary['variable'] in EXTENDED_VARIABLES:
+        return "porosity/depth information to be added"
+    if 'M' not in temporary['field']:
+        return "field " + temporary['field'] + " is not a monthly field"
+    if int(temporary['start_year']) == 0 and int(temporary['end_year']) == 0:
+        return "no time range selected"
+    return None
+
+
+def check_file(path, variable, field, start_year, end_year):
+    """ @brief Check whether a file is CMOR compliant as written by the
+               default reformat
+        @param path The input file
+        @param variable Variable (standard name)
+        @param field The field (see tutorial.pdf for available fields)
+        @param start_year First year requested
+        @param end_year Last year requested
+        @return None if compliant, otherwise the first failed check
+                (a string)
+    """
+    if netCDF4 is None:
+        return "netCDF4 is not available"
+    try:
+        dataset = netCDF4.Dataset(path)
+    except (IOError, RuntimeError) as exc:
+        return "cannot open " + path + " (" + str(exc) + ")"
+    try:
+        return check_dataset(dataset, variable, field,
+                             int(start_year), int(end_year))
+    finally:
+        dataset.close()
+
+
+def check_dataset(dataset, variable, field, start_year, end_year):
+    """ @brief See check_file
+        @param dataset An open netCDF4.Dataset
+    """
+    if variable not in dataset.variables:
+        return "no variable " + variable
+    var = dataset.variables[variable]
+    if var.dtype != np.float32:
+        return "type " + str(var.dtype) + " of " + variable + " is not float"
+
+    # Attributes (check_fill, check_units, var_attrib): _FillValue, the
+    # CMOR attributes and an optional 'coordinates' attribute only
+    attributes = var.ncattrs()
+    if '_FillValue' not in attributes:
+        return "no _FillValue"
+    if np.float32(var.getncattr('_FillValue')) != np.float32(FILL):
+        return "_FillValue is not " + str(FILL)
+    cmor_attributes = get_cmor_attributes(variable)
+    if not cmor_attributes or 'units' not in cmor_attributes:
+        return "no CMOR units for " + variable
+    if 'units' not in attributes \
+            or var.getncattr('units') != cmor_attributes['units']:
+        return "units are not " + cmor_attributes['units']
+    problem = _check_attributes(var, variable, cmor_attributes,
+                                ['_FillValue', 'coordinates'])
+    if problem is not None:
+        return problem
+
+    # Rank and names/order of the coordinates (check_rank, reformat_coord)
+    dims = list(var.dimensions)
+    if not ('T' + str(len(dims) - 1)) in field:
+        return "rank " + str(len(dims)) + " does not match field " + field
+    if [dim for dim in COORDINATES if dim in dims] != dims \
+            or dims[0] != 'time':
+        return "coordinates (" + ", ".join(dims) + ") are not " \
+            + "(" + ", ".join(COORDINATES) + ") or a subset"
+    if ('z' in field) != ('lon' not in dims and 'plev' in dims):
+        return "coordinates (" + ", ".join(dims) + ") do not match field " \
+            + field
+    for dim in dims:
+        if dim not in dataset.variables \
+                or dataset.variables[dim].dimensions != (dim,):
+            return "no coordinate variable " + dim
+        if dim != 'time' and len(dataset.dimensions[dim]) < 2:
+            return "dummy coordinate " + dim
+
+    for dim in dims:
+        coord = dataset.variables[dim]
+        if coord.dtype != np.float64:
+            return "type " + str(coord.dtype) + " of " + dim \
+                + " is not double"
+        problem = _check_attributes(coord, dim, COORDINATE_ATTRIBUTES[dim],
+                                    ['calendar'] if dim == 'time' else [])
+        if problem is not None:
+            return problem
+        if dim == 'time':
+            problem = _check_time(coord, start_year, end_year)
+        else:
+            problem = {'plev': _check_plev,
+                       'lat': _check_lat,
+                       'lon': _check_lon}[dim](coord)
+        if problem is not None:
+            return problem
+    return None
+
+
+def _monotonic(values):
+    """ @brief 1: strictly increasing, -1: strictly decreasing, 0: neither
+    """
+    steps = np.diff(values)
+    if np.all(steps > 0):
+        return 1
+    if np.all(steps < 0):
+        return -1
+    return 0
+
+
+def _check_attributes(var, name, expected, optional):
+    """ @brief Exactly the expected attributes and values, and optionally
+               some others with any value
+        @param var A netCDF4.Variable
+        @param name Name of the variable (for the message)
+        @param expected Dictionary of the required attributes
+        @param optional List of further allowed attribute names
+        @return None if the attributes match, otherwise the reason
+    """
+    for attribute in var.ncattrs():
+        if attribute not in expected and attribute not in optional:
+            return "unexpected attribute " + name + ":" + attribute
+    for attribute, value in sorted(expected.items()):
+        if attribute not in var.ncattrs() \
+                or var.getncattr(attribute) != value:
+            return name + ":" + attribute + " is not '" + value + "'"
+    return None
+
+
+def _check_time(coord, start_year, end_year):
+    """ @brief A monthly time axis from start_year-01 to end_year-12,
+               at the 15th of each month, 00:00 (check_time_range)
+
+        The reformat keeps the calendar of the input file, the units are
+        TUNITS (time_attrib).
+    """
+    if 'calendar' not in coord.ncattrs():
+        return "no time:calendar"
+    values = coord[:]
+    if np.ma.count_masked(values) > 0 or _monotonic(values) != 1:
+        return "time coordinate is not increasing"
+    ntime = 12 * (end_year - start_year + 1)
+    if len(values) != ntime:
+        return "%d time steps instead of %d" % (len(values), ntime)
+    try:
+        dates = netCDF4.num2date(values, TUNITS, coord.calendar)
+    except (ValueError, TypeError) as exc:
+        return "cannot decode time coordinate (" + str(exc) + ")"
+    months = [(date.year, date.month) for date in dates]
+    if months != [(start_year + tt // 12, tt % 12 + 1)
+                  for tt in range(ntime)]:
+        return "time coordinate does not cover " + str(start_year) \
+            + "-01 to " + str(end_year) + "-12 month by month"
+    if any((date.day, date.hour, date.minute, date.second) != (15, 0, 0, 0)
+           for date in dates):
+        return "time coordinate is not the 15th of each month, 00:00"
+    return None
+
+
+def _check_plev(coord):
+    """ @brief Pressure levels decreasing (reformat_plev)
+    """
+    if _monotonic(coord[:]) != -1:
+        return "pressure levels are not decreasing"
+    return None
+
+
+def _check_lat(coord):
+    """ @brief Latitudes increasing S-N (reformat_lat)
+    """
+    values = coord[:]
+    if _monotonic(values) != 1:
+        return "latitudes are not increasing"
+    if values[0] < -90. or values[-1] > 90.:
+        return "latitudes are not within -90 to 90"
+    return None
+
+
+def _check_lon(coord):
+    """ @brief Longitudes increasing within [0, 360) without a repeated
+               first column (reformat_lon)
+    """
+    values = coord[:]
+    if _monotonic(values) != 1:
+        return "longitudes are not increasing"
+    if values[0] < 0. or values[-1] >= 360. or values[-1] == 0. \
+            or values[0] == values[-1] - 360.:
+        return "longitudes are not within [0, 360)"
+    return None
+
+
+def link(source, target):
+    """ @brief Atomically put a symbolic link to source at target
+    """
+    tmp_fd, tmp_path = tempfile.mkstemp(prefix=".tmp_",
+                                        dir=os.path.dirname(target))
+    os.close(tmp_fd)
+    os.remove(tmp_path)
+    os.symlink(os.path.abspath(source), tmp_path)
+    os.rename(tmp_path, target)
@@ -1,9 +1,12 @@
 from auxiliary import writeProjinfoError
 from operator import itemgetter
+import manifest
 import os
 import pdb
 import projects
 import re
+import tempfile
+import variable_registry
 from auxiliary import info
 
 
@@ -50,18 +53,14 @@ class Data_interface(object):
         self.mip = '${MIP}'
         self.exp = '${EXP}'
 
-        self.do_not_remove_these =\
-            [item for item in os.listdir('interface_data/')
-             if re.search('.*_interface_templates', item) is not None]
-
-        self.do_not_remove_these.insert(0, "README")
-        self.do_not_remove_these.insert(0, ".svn")
+        # Template the interface file is rendered from (if any)
+        self.template = None
 
         indata_root = self.get_data_root()
         if 'AUXILIARIES' in project_info:
             # 'CMIP5_fx' is hardcoded as it is (so far) the only class supporting
             # the 'AUXILIARIES'-tag
-            fx_project = getattr(globals()['projects'], 'CMIP5_fx')()
+            fx_project = projects.get_project('CMIP5_fx')
             fx_files = fx_project.get_fx_files(project_info)
             self.interface.fx_keys = project_info['AUXILIARIES']['FX_files'].fx_files.keys()
             self.interface.fx_values = [os.path.join(indata_root, item.get_fullpath()) for item in project_info['AUXILIARIES']['FX_files'].fx_files.values()]
@@ -130,8 +129,7 @@ class Data_interface(object):
         figfiles_suffix = []
 
         for model in project_info['MODELS']:
-            currProject = getattr(globals()['projects'],
-                                  model.split_entries()[0])()
+            currProject = projects.get_project(model.entries[0])
 
             figfiles_suffix.append(currProject.get_figure_file_names(project_info,
                                                                      model,
@@ -171,8 +169,7 @@ class Data_interface(object):
 
         # Collect and extend the model_specifiers array.
         for model in project_info['MODELS']:
-            currProject = getattr(globals()['projects'],
-                                  model.split_entries()[0])()
+            currProject = projects.get_project(model.entries[0])
 
             for mspec in currProject.model_specifiers:
                 if mspec not in model_specifiers:
@@ -190,8 +187,7 @@ class Data_interface(object):
         # project lacks a certain specifier it can explicitly added through the
         # add_specifier-array or it is given the value 'No_value'.
         for model in project_info['MODELS']:
-            currProject = getattr(globals()['projects'],
-                                  model.split_entries()[0])()
+            currProject = projects.get_project(model.entries[0])
 
             models_tmp = []
             for mspecs in model_specifiers:
@@ -233,50 +229,29 @@ class Data_interface(object):
             @param variable_def_dir Folder where variable definitions reside
 
             Repackages the variable specific information that resides in
-            the NCL-var_def/-files in the 'variable_info'-attribute.
+            the NCL-var_def/-files in the 'variable_info'-attribute (parsed
+            once, see variable_registry.py).
         """
-        variable_info_file = os.path.join(variable_def_dir, variable + ".ncl")
-
-        # Read and parse the existing var_def-file
-        variable_info_raw = open(variable_info_file, "r").read()
-        var_def = variable_info_raw.split('\n')
-
-        # Check whether the "variable_info"-attribute is True/False
-        variable_info_true_regex = re.compile("variable_info\s*=\s*True")
-        if variable_info_true_regex.search(variable_info_raw) is not None:
-            variable_info_true = True
-        else:
-            variable_info_true = False
-
-        # Remove comments
-        remove_comments = re.compile('(.*?);.*')
-        variable_info = [remove_comments.sub(r'\1', entry) for entry in var_def]
-
-        # Remove lines in the "variable_def"-file missing the
-        # "variable_info"-attribute
-        variable_info_entry_regex = re.compile("variable_info@.*=.*")
-        variable_info = [entry for entry in variable_info
-                         if variable_info_entry_regex.search(entry) is not None]
-
-        variable_info = [re.sub("variable_info@", "", entry)
-                         for entry in variable_info]
-
-        # Split variable_info attribute strings to a [key, value]-list
-        regexp_equal = re.compile("\s*=\s*")
-        variable_info = [regexp_equal.split(entry) for entry in variable_info]
-
-        return variable_info_true, variable_info
-
-    def write_env_projinfo(self, project_info):
-        """ @brief Writes XML-file information to env. variables
+        variable_def = variable_registry.get_registry().get_variable_def(
+            variable_def_dir, variable)
+        variable_info = [list(entry)
+                         for entry in variable_def['variable_info']]
+        return variable_def['variable_info_true'], variable_info
+
+    def get_env_projinfo(self, project_info):
+        """ @brief Collects XML-file information for env. variables
             @param project_info Current namelist in dictionary format
+            @return A dictionary (variable name -> value)
 
             Information between Python and NCL is (partially) exchanged
-            through environment variables. This function write the
+            through environment variables. This function converts the
             project_info-dictionary content to environment variables
-            prefixed with "ESMValTool_".
+            prefixed with "ESMValTool_". They are passed on to the launched
+            script only, the environment of the Python process is not
+            modified.
         """
         verbosity = project_info['GLOBAL']['verbosity']
+        environment = {}
 
         for section_key in ['GLOBAL', 'RUNTIME', 'TEMPORARY']:
             if section_key in project_info.keys():
@@ -284,28 +259,130 @@ class Data_interface(object):
                     info("writing key to env. variable, key=" + key,
                          verbosity, required_verbosity=11)
                     # Check and fail on duplicate entries
-                    if "ESMValTool_" + key in os.environ:
+                    if "ESMValTool_" + key in environment:
                         raise writeProjinfoError("Environment variable "
                                                  + "'ESMValTool_" + key
                                                  + "' already defined")
 
-                    os.environ["ESMValTool_" + key] = \
+                    environment["ESMValTool_" + key] = \
                         str(project_info[section_key][key])
+        return environment
+
+    def get_language(self):
+        """ @brief Interface language derived from the class name
+        """
+        return re.search("([a-zA-Z]*)_.*",
+                         self.__class__.__name__).group(1).lower()
+
+    def get_run_dir(self):
+        """ @brief Folder for the launch directories and rendered interfaces
+        """
+        if 'run_dir' in self.project_info.get('RUNTIME', {}):
+            return self.project_info['RUNTIME']['run_dir']
+        return os.path.join(tempfile.gettempdir(),
+                            "ESMValTool_" + str(os.getuid()))
+
+    def get_sources(self):
+        """ @brief Files the rendered interface depends on
+        """
+        sources = []
+        if self.template is not None:
+            sources.append(self.template)
+        if 'variables' in vars(self.interface):
+            variable_def_dir = self.interface.variable_def_dir[0]
+            sources.extend([os.path.join(variable_def_dir, curr_var + ".ncl")
+                            for curr_var in self.interface.variables])
+        return sources
+
+    def get_rendered_entries(self):
+        """ @brief Names of the interface entries used by the template
+        """
+        if self.template is None:
+            return []
+        with open(self.template) as f:
+            return [place_holder.lower()
+                    for place_holder in re.findall("<<([A-Z_]+)>>", f.read())]
+
+    def render_template(self, target_file, format_entries, line_cont):
+        """ @brief Replace the template placeholders with configuration data
+            @param target_file The interface file to write
+            @param format_entries Callable converting a list of interface
+                                  entries to a list of strings
+            @param line_cont Separator between the entries of a list
+        """
+        fsource = open(self.template, "r")
+        ftarget = open(target_file, "w")
+
+        # Replace template file placeholders, <<[A-Z_]+>>, with
+        # configuration data
+        src = fsource.readlines()
+        for line in src:
+            if re.search("<<[A-Z_]+>>", line):
+                # left_hand_side, place_holder, right_hand_side
+                lhs, place_holder, rhs \
+                    = re.search("(.*)<<([A-Z_]+)>>(.*)", line).group(1, 2, 3)
+                if place_holder.lower() in vars(self.interface):
+                    place_holder = vars(self.interface)[place_holder.lower()]
+
+                    # Extend 'lhs' array with white space elements
+                    len_lhs = len(lhs)
+                    lhs = [lhs]
+                    lhs.extend([" " * len_lhs] * len(place_holder))
 
-    def clean_up_interface_folder(self, exceptions):
-        """ @brief Remove files from the interface_data/-folder
-            @param exceptions Do not remove these entries
+                    # Zip lhs- and placeholder- arrays to a new array. The
+                    # whitespace entries in lhs-array provides alignment
+                    # if/when data is written to file
+                    place_holder = format_entries(place_holder)
+                    place_holder = [item1 + item2
+                                    for item1, item2 in zip(lhs, place_holder)]
+                    ftarget.write(line_cont.join(place_holder) + rhs + '\n')
+                else:
+                    pass
+            else:
+                ftarget.write(line)
+        fsource.close()
+        ftarget.close()
+
+    def render_interface(self, target_dir):
+        """ @brief Write the interface files to target_dir
+
+            Implemented by the language specific child classes.
         """
-        # Clean up interface-folder
-        listdir = os.listdir("./interface_data/")
+        pass
 
-        # Remove exceptions from listdir
-        for listitem in exceptions:
-            if listitem in listdir:
-                listdir.remove(listitem)
+    def write_data_to_interface(self, executable):
+        """ @brief Prepare the launch of a script
+            @param executable The script to launch
+            @return A manifest.JobManifest instance
 
-        for direntry in listdir:
-            os.remove(os.path.join("./interface_data", direntry))
+            Creates a private launch directory, installs the (possibly
+            cached) rendered interface files in its interface_data/-folder
+            and writes the job manifest next to them.
+        """
+        verbosity = self.project_info['GLOBAL']['verbosity']
+        run_dir = self.get_run_dir()
+        prefix = os.path.splitext(os.path.basename(executable))[0]
+        launch_dir = manifest.create_launch_dir(os.path.join(run_dir,
+                                                             "launches"),
+                                                prefix)
+
+        environment = self.get_env_projinfo(self.project_info)
+        environment["ESMValTool_cwd"] = launch_dir
+        job = manifest.JobManifest(self.get_language(),
+                                   executable,
+                                   environment,
+                                   vars(self.interface),
+                                   self.get_sources(),
+                                   launch_dir=launch_dir,
+                                   rendered=self.get_rendered_entries())
+        job.environment["ESMValTool_manifest"] = job.get_path()
+
+        if job.install_interface(os.path.join(run_dir, "interface_cache"),
+                                 self.render_interface):
+            info("Reusing rendered interface " + job.digest,
+                 verbosity, required_verbosity=6)
+        job.write()
+        return job
 
 
 class Ncl_data_interface(Data_interface):
@@ -319,14 +396,14 @@ class Ncl_data_interface(Data_interface):
             @param project_info Current namelist in dictionary format
         """
         Data_interface.__init__(self, project_info)
+        self.template = "interface_data/ncl_interface_templates/ncl.tmpl"
 
         # A data structure needed only by NCL, hence defined here instead
         # of in the base class. The dict_keys are are used to keep track
         # of the current data sets
         self.interface.dict_keys = []
         for model in project_info['MODELS']:
-            currProject = getattr(globals()['projects'],
-                                  model.split_entries()[0])()
+            currProject = projects.get_project(model.entries[0])
 
             self.interface.dict_keys.append(currProject.get_dict_key(model, self.mip, self.exp))
 
@@ -337,56 +414,22 @@ class Ncl_data_interface(Data_interface):
             if class_regex.search(self.interface.diag_script_cfg[0]) is None:
                 del(self.interface.diag_script_cfg)
 
-    def write_data_to_interface(self):
+    def render_interface(self, target_dir):
         """ @brief Write the configuration data to NCL format
 
             This routine writes the configuration data from the xml-,
-            diagnostic_def/-files to NCL formatted files the
-            interface_data/-folder. These files are then read by the
-            NCL diag_scripts.
+            diagnostic_def/-files to NCL formatted files in target_dir
+            (which ends up as the interface_data/-folder of the launch).
+            These files are then read by the NCL diag_scripts.
         """
-        self.clean_up_interface_folder(self.do_not_remove_these)
+        def format_entries(place_holder):
+            if isinstance(place_holder[0], int):
+                return [str(ph) for ph in place_holder]
+            else:  # Assume string
+                return ['"' + ph + '"' for ph in place_holder]
 
-        fsource = open("interface_data/ncl_interface_templates/ncl.tmpl", "r")
-        ftarget = open("interface_data/ncl.interface", "w")
-
-        # Replace template file placeholders, <<[A-Z_]+>>, with
-        # configuration data
-        ncl_src = fsource.readlines()
-        for line in ncl_src:
-            if re.search("<<[A-Z_]+>>", line):
-                # left_hand_side, place_holder, right_hand_side
-                lhs, place_holder, rhs \
-                    = re.search("(.*)<<([A-Z_]+)>>(.*)", line).group(1, 2, 3)
-                if place_holder.lower() in vars(self.interface):
-                    place_holder = vars(self.interface)[place_holder.lower()]
-
-                    # Extend 'lhs' array with white space elements
-                    len_lhs = len(lhs)
-                    lhs = [lhs]
-                    lhs.extend([" " * len_lhs] * len(place_holder))
-
-                    # Zip lhs- and placeholder- arrays to a new array. The
-                    # whitespace entries in lhs-array provides alignment
-                    # if/when data is written to file
-                    if isinstance(place_holder[0], int):
-                        place_holder = [str(ph) for ph in place_holder]
-
-                    else:  # Assume string
-                        place_holder = ['"' + ph + '"' for ph in place_holder]
-
-                    place_holder = [item1 + item2
-                                    for item1, item2 in zip(lhs, place_holder)]
-                    ftarget.write(', \\\n'.join(place_holder) + rhs + '\n')
-                else:
-                    pass
-            else:
-                ftarget.write(line)
-        fsource.close()
-        ftarget.close()
-
-        # Write proj_info to environment variables
-        self.write_env_projinfo(self.project_info)
+        self.render_template(os.path.join(target_dir, "ncl.interface"),
+                             format_entries, ', \\\n')
 
         # Read and parse the var_def/-file
         if 'variables' in vars(self.interface):
@@ -397,9 +440,8 @@ class Ncl_data_interface(Data_interface):
                     = self.reparse_variable_info(curr_var, variable_def_dir)
 
                 # Write parsed content to temp-file in interface_data
-                variable_info_file = "interface_data/"\
-                                     + curr_var\
-                                     + "_info.tmp"
+                variable_info_file = os.path.join(target_dir,
+                                                  curr_var + "_info.tmp")
                 fvarinfo = open(variable_info_file, "w")
 
                 if variable_info_true:
@@ -435,48 +477,17 @@ class R_data_interface(Data_interface):
             @param project_info Current namelist in dictionary format
         """
         Data_interface.__init__(self, project_info)
+        self.template = "interface_data/r_interface_templates/r.tmpl"
 
-    def write_data_to_interface(self):
-        """ @brief Write the configuration data to Matlab format
+    def render_interface(self, target_dir):
+        """ @brief Write the configuration data to R format
         """
-        self.clean_up_interface_folder(self.do_not_remove_these)
+        def format_entries(place_holder):
+            return ['"' + str(ph) + '"' for ph in place_holder]
 
-        fsource = open("interface_data/r_interface_templates/r.tmpl", "r")
-        ftarget = open("interface_data/r.interface", "w")
-        line_cont = ', \n'
+        self.render_template(os.path.join(target_dir, "r.interface"),
+                             format_entries, ', \n')
 
-        # Replace template file placeholders, <<[A-Z_]+>>, with
-        # configuration data
-        r_src = fsource.readlines()
-        for line in r_src:
-            if re.search("<<[A-Z_]+>>", line):
-                # left_hand_side, place_holder, right_hand_side
-                lhs, place_holder, rhs \
-                    = re.search("(.*)<<([A-Z_]+)>>(.*)", line).group(1, 2, 3)
-                if place_holder.lower() in vars(self.interface):
-                    place_holder = vars(self.interface)[place_holder.lower()]
-
-                    # Extend 'lhs' array with white space elements
-                    len_lhs = len(lhs)
-                    lhs = [lhs]
-                    lhs.extend([" " * len_lhs] * len(place_holder))
-
-                    # Zip lhs- and placeholder- arrays to a new array. The
-                    # whitespace entries in lhs-array provides alignment
-                    # if/when data is written to file
-                    place_holder = ['"' + str(ph) + '"' for ph in place_holder]
-                    place_holder = [item1 + item2
-                                    for item1, item2 in zip(lhs, place_holder)]
-                    ftarget.write(line_cont.join(place_holder) + rhs + '\n')
-                else:
-                    pass
-            else:
-                ftarget.write(line)
-        fsource.close()
-        ftarget.close()
-
-        # Write proj_info to environment variables
-        self.write_env_projinfo(self.project_info)
         # Read and parse the var_def/-file
         if 'variables' in vars(self.interface):
             for curr_var in self.interface.variables:
@@ -486,9 +497,8 @@ class R_data_interface(Data_interface):
                     = self.reparse_variable_info(curr_var, variable_def_dir)
 
                 # Write parsed content to temp-file in data_interface
-                variable_info_file = "interface_data/"\
-                                     + curr_var\
-                                     + "_info.tmp"
+                variable_info_file = os.path.join(target_dir,
+                                                  curr_var + "_info.tmp")
                 fvarinfo = open(variable_info_file, "w")
 
                 if variable_info_true:
@@ -512,8 +522,3 @@ class Py_data_interface(Data_interface):
             @param project_info Current namelist in dictionary format
         """
         Data_interface.__init__(self, project_info)
-
-    def write_data_to_interface(self):
-        """ @brief Write the configuration data to Matlab format
-        """
-        self.clean_up_interface_folder(self.do_not_remove_these)
@@ -22,7 +22,9 @@ import reformat
 import operator
 import glob
 import exceptions
+import file_catalogue
 import pdb
+import variable_registry
 
 
 class Var:
@@ -57,7 +59,6 @@ class VAR_REQ:
 
     def __iter__(self):
         for i in range(len(self.var)):
-            os.environ['__ESMValTool_base_var'] = self.var[i]
             var_mip_exp = [item[i] for item in self.var_attrs.values()]
             key_mip_exp = [re.sub("var_attr_", "", item)
                            for item in self.var_attrs.keys()]
@@ -148,7 +149,6 @@ class Diagnostic:
 
     def __iter__(self):
         for i in range(len(self.variables)):
-            os.environ['__ESMValTool_base_var'] = self.variables[i].var
             yield self.variables[i].var,\
                 self.variables[i].fld,\
                 self.variables[i].mip,\
@@ -235,9 +235,10 @@ class Diagnostic:
             @return An instance of the VAR_REQ-class holding all required
             variables/fields
 
-            This function reads the first line of the file
-            'var_def/variable.ncl' to check whether the current variable
-            is derived from other variables. The syntax is either,
+            This function checks the 'Requires:' line of the file
+            'var_def/variable.ncl' (parsed once, see variable_registry.py)
+            whether the current variable is derived from other variables.
+            The syntax is either,
 
             @code
             ; Requires: var1:field1,var2:field2,...
@@ -266,44 +267,41 @@ class Diagnostic:
             del var_dict['var0']
             del var_dict['fld0']
 
-            f = open(os.path.join(self.variable_def_dir, variable.var
-                                  + ".ncl"), 'r')
-            for line in f:
-                tokens = line.split()
-
-                if "Requires:" in tokens:
-                    # If 'none', return orig. field
-                    if (tokens[2] == "none" or model_der == "True"):
-                        dep_vars.append(Var(var_dict,
-                                            "none",
-                                            "none"))
-                    else:
-                        sub_tokens = tokens[2].split(",")
-                        for sub in sub_tokens:
-                            element = sub.split(":")
-
-                            # Assume first digit is dimension in field type
-                            offset = self.find_dimension_entry(element[1]) - 1
-
-                            e_var = element[0]
-                            e_fld = element[1]
-                            e_fld = (variable.fld[0:offset + 1]
-                                     + e_fld[1 + offset]
-                                     + variable.fld[2 + offset]
-                                     + e_fld[3 + offset:])
-
-                            del keys
-                            del vars
-                            dep_var = copy.deepcopy(variable)
-                            dep_var.var = e_var
-                            dep_var.fld = e_fld
-                            keys = [item for item in dir(dep_var) if re.search("^__", item) is None]
-                            vars = [getattr(dep_var, item) for item in dir(dep_var) if re.search("^__", item) is None]
-                            dep_var_dict = dict(zip(keys, vars))
-
-                            dep_vars.append(Var(dep_var_dict,
-                                                variable.var,
-                                                variable.fld))
+            variable_def = variable_registry.get_registry().get_variable_def(
+                self.variable_def_dir, variable.var)
+            for requires in variable_def['requires']:
+                # If 'none', return orig. field
+                if (requires == "none" or model_der == "True"):
+                    dep_vars.append(Var(var_dict,
+                                        "none",
+                                        "none"))
+                else:
+                    sub_tokens = requires.split(",")
+                    for sub in sub_tokens:
+                        element = sub.split(":")
+
+                        # Assume first digit is dimension in field type
+                        offset = self.find_dimension_entry(element[1]) - 1
+
+                        e_var = element[0]
+                        e_fld = element[1]
+                        e_fld = (variable.fld[0:offset + 1]
+                                 + e_fld[1 + offset]
+                                 + variable.fld[2 + offset]
+                                 + e_fld[3 + offset:])
+
+                        del keys
+                        del vars
+                        dep_var = copy.deepcopy(variable)
+                        dep_var.var = e_var
+                        dep_var.fld = e_fld
+                        keys = [item for item in dir(dep_var) if re.search("^__", item) is None]
+                        vars = [getattr(dep_var, item) for item in dir(dep_var) if re.search("^__", item) is None]
+                        dep_var_dict = dict(zip(keys, vars))
+
+                        dep_vars.append(Var(dep_var_dict,
+                                            variable.var,
+                                            variable.fld))
 
         return dep_vars
 
@@ -317,12 +315,16 @@ class Diagnostic:
                 return True
         return False
 
-    def select_base_vars(self, variables, model, currProject, project_info):
+    def select_base_vars(self, variables, model, currProject, project_info,
+                         planned=()):
         """ @brief Determine base variables to be read from input file(s)
             @param variables - base variables provided by variable_defs script
             @param model - current model
             @param currProject - current project
             @param project_info - project_info-dictionary
+            @param planned - files written by tasks scheduled before (see
+                             scheduler.build_namelist_graph), they count as
+                             precomputed files before they exist
             @return base_vars - variables to be read from input file(s)
         """
         verbosity = project_info['GLOBAL']['verbosity']
@@ -333,7 +335,6 @@ class Diagnostic:
                 continue
 
             # first try: use base variables provided by variable_defs script
-            os.environ['__ESMValTool_base_var'] = base_var.var
             infile = reformat.infile(currProject,
                                      project_info,
                                      base_var,
@@ -345,7 +346,8 @@ class Diagnostic:
                                                       base_var.mip,
                                                       base_var.exp)
 
-            if (len(glob.glob(infile) + glob.glob(precomputed)) == 0):
+            if (len(file_catalogue.glob(project_info, infile)
+                    + self.get_precomputed(precomputed, planned)) == 0):
                 info(" No input files found for " + base_var.var +
                      " (" + base_var.fld + ") as " + infile, verbosity, 1)
 
@@ -364,7 +366,8 @@ class Diagnostic:
                                                           base_var.mip,
                                                           base_var.exp)
 
-                if (len(glob.glob(infile) + glob.glob(precomputed)) == 0):
+                if (len(file_catalogue.glob(project_info, infile)
+                        + self.get_precomputed(precomputed, planned)) == 0):
                     raise exceptions.IOError(2, "No input files found in ",
                                              infile)
                 else:
@@ -378,6 +381,13 @@ class Diagnostic:
 
         return base_vars
 
+    def get_precomputed(self, precomputed, planned):
+        """ @brief Existing or planned files of a precomputed path
+        """
+        if precomputed in planned:
+            return [precomputed]
+        return glob.glob(precomputed)
+
     def get_climate_field_type(self, field):
         """ @brief Update and return the field numbers to be used
             @param field A field number (see the doc/*.pdf:s for
@@ -0,0 +1,351 @@
+# Indexed catalogue of the input data files
+#
+# What it does:
+#  - Keeps a (persistent) SQLite index of the files in the input data
+#    directories, with the DRS facets (variable, mip, model, experiment,
+#    ensemble, years) parsed from the file names.
+#  - A directory is (re-)scanned only if its mtime differs from the one
+#    recorded at the last scan (incremental refresh), and at most once per
+#    process. Existence checks and wildcard look-ups in get_cf_infile/
+#    select_base_vars then become index queries instead of stat/listdir
+#    calls on the (network) file system.
+#  - Selects the files of a wildcard look-up covering a range of years
+#    (select_years), by the years of the file names or, if these are not
+#    available, by the first and last time step of the file (recorded in
+#    the index as well).
+#  - A directory is indexed from its listing only, without a stat call per
+#    file (directories are told apart by the file type of the directory
+#    entry where os.scandir is available).
+#  - The index is kept in the file given by the optional GLOBAL entry
+#    'file_catalogue' of the namelist, by default in the run directory
+#    (RUNTIME entry 'run_dir'), such that the forked tasks of a run share
+#    it, and in memory if neither is available.
+#
+# Usage:
+#    file_catalogue.isfile(project_info, path)
+#    file_catalogue.glob(project_info, pattern)
+#    file_catalogue.select_years(project_info, pattern, 1990, 1999)
+#    python interface_scripts/file_catalogue.py <catalogue> <data root> ...
+
+import fnmatch
+import glob as globmodule
+import os
+import re
+import sqlite3
+import sys
+try:
+    import netCDF4
+except ImportError:
+    netCDF4 = None
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+# Name of the default catalogue file in the run directory
+CATALOGUE_FILE = "file_catalogue.sqlite"
+
+# Pattern of the (optional) time period at the end of DRS file names
+PERIOD = re.compile("^([0-9]{4})[0-9]*-([0-9]{4})[0-9]*$")
+
+SCHEMA = ["""CREATE TABLE IF NOT EXISTS directories (
+                 path TEXT PRIMARY KEY,
+                 mtime REAL)""",
+          """CREATE TABLE IF NOT EXISTS files (
+                 dir TEXT,
+                 name TEXT,
+                 var TEXT,
+                 mip TEXT,
+                 model TEXT,
+                 exp TEXT,
+                 ensemble TEXT,
+                 start_year INTEGER,
+                 end_year INTEGER,
+                 PRIMARY KEY (dir, name))""",
+          """CREATE INDEX IF NOT EXISTS files_facets
+                 ON files (dir, var, mip, model, exp, ensemble)"""]
+
+
+def drs_facets(name):
+    """ @brief Parse the DRS facets from a file name
+        @param name File name, e.g., tas_Amon_MPI-ESM-LR_historical_r1i1p1_
+                    185001-200512.nc
+        @return List [var, mip, model, exp, ensemble, start_year, end_year],
+                entries not available are None
+
+        The first five entries are the leading '_'-separated parts of the
+        name, also for names not following the DRS.
+    """
+    facets = [None] * 7
+    if name.endswith(".nc"):
+        name = name[:-3]
+    parts = name.split("_")
+    facets[:min(len(parts), 5)] = parts[:5]
+    if len(parts) >= 6:
+        period = PERIOD.match(parts[-1])
+        if period is not None:
+            facets[5] = int(period.group(1))
+            facets[6] = int(period.group(2))
+    return facets
+
+
+def read_years(path):
+    """ @brief Years of the first and last time step of a file
+        @return (start_year, end_year), (None, None) if not available
+
+        Only the time coordinate is read (requires netCDF4).
+    """
+    if netCDF4 is None:
+        return None, None
+    try:
+        dataset = netCDF4.Dataset(path)
+    except (IOError, RuntimeError):
+        return None, None
+    try:
+        time = dataset.variables.get('time')
+        if time is None or len(time) == 0 or 'units' not in time.ncattrs():
+            return None, None
+        calendar = time.calendar if 'calendar' in time.ncattrs() \
+            else 'standard'
+        first, last = netCDF4.num2date([time[0], time[-1]], time.units,
+                                       calendar)
+        return first.year, last.year
+    except (ValueError, TypeError):
+        return None, None
+    finally:
+        dataset.close()
+
+
+def covering(ranges, start_year, end_year):
+    """ @brief Smallest selection of files covering a range of years
+        @param ranges List of (path, start_year, end_year)-tuples
+        @return The paths of the selected files (sorted), all files
+                overlapping the range if it is not covered completely
+
+        Files are picked greedily: among the files starting in the years
+        covered so far (or the next year), the one reaching furthest.
+    """
+    overlapping = [(start, end, path) for path, start, end in ranges
+                   if start <= end_year and end >= start_year]
+    selected = []
+    covered = start_year - 1
+    while covered < end_year:
+        candidates = [(end, path) for start, end, path in overlapping
+                      if start <= covered + 1 and end > covered]
+        if not candidates:
+            return sorted([path for start, end, path in overlapping])
+        end, path = max(candidates)
+        selected.append(path)
+        covered = end
+    return sorted(selected)
+
+
+def list_files(directory):
+    """ @brief Names of the entries of a directory which are not
+               directories, without a stat call per entry
+    """
+    if scandir is None:
+        return os.listdir(directory)
+    return [entry.name for entry in scandir(directory)
+            if not entry.is_dir(follow_symlinks=False)]
+
+
+class FileCatalogue(object):
+    """ @brief SQLite index of the files in the input data directories
+    """
+    def __init__(self, db_path=":memory:"):
+        """ @param db_path Path to the catalogue file (":memory:" for a
+                           catalogue living for this process only)
+        """
+        self.db_path = db_path
+        if db_path != ":memory:" and \
+                not os.path.isdir(os.path.dirname(os.path.abspath(db_path))):
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)))
+        self.connection = sqlite3.connect(db_path, timeout=60)
+        for statement in SCHEMA:
+            self.connection.execute(statement)
+        self.connection.commit()
+        self.checked = set()
+
+    def refresh(self, directory, force=False):
+        """ @brief Make sure the index of a directory is up to date
+            @param directory The directory
+            @param force Check the directory again even if already checked
+                         by this process
+            @return True if the directory exists
+        """
+        directory = os.path.abspath(directory)
+        if directory in self.checked and not force:
+            return True
+        try:
+            mtime = os.stat(directory).st_mtime
+        except OSError:
+            return False
+
+        row = self.connection.execute(
+            "SELECT mtime FROM directories WHERE path = ?",
+            (directory,)).fetchone()
+        if row is None or row[0] != mtime:
+            self.scan_directory(directory, mtime)
+        self.checked.add(directory)
+        return True
+
+    def scan_directory(self, directory, mtime):
+        """ @brief (Re-)build the index of a single directory
+
+            Only the directory listing is read. Subdirectories are left out
+            by the file type of their entry if os.scandir (or the scandir
+            module) is available, and indexed like files otherwise.
+        """
+        rows = [[directory, name] + drs_facets(name)
+                for name in list_files(directory)]
+        with self.connection:
+            self.connection.execute("DELETE FROM files WHERE dir = ?",
+                                    (directory,))
+            self.connection.executemany(
+                "INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.connection.execute(
+                "INSERT OR REPLACE INTO directories VALUES (?, ?)",
+                (directory, mtime))
+
+    def scan(self, root):
+        """ @brief Index all directories below a data root folder
+        """
+        for directory, subdirs, files in os.walk(root):
+            self.refresh(directory, force=True)
+
+    def isfile(self, path):
+        """ @brief Replacement for os.path.isfile on input files
+        """
+        directory, name = os.path.split(os.path.abspath(path))
+        if not self.refresh(directory):
+            return False
+        return self.connection.execute(
+            "SELECT 1 FROM files WHERE dir = ? AND name = ?",
+            (directory, name)).fetchone() is not None
+
+    def glob(self, pattern):
+        """ @brief Replacement for glob.glob on input files
+            @param pattern Path, wildcards are only supported in the file
+                           name part
+        """
+        directory, name = os.path.split(os.path.abspath(pattern))
+        if globmodule.has_magic(directory):
+            return globmodule.glob(pattern)
+        if not self.refresh(directory):
+            return []
+        if not globmodule.has_magic(name):
+            return [pattern] if self.isfile(pattern) else []
+
+        # Look up the files by their leading (fixed) DRS facets
+        fixed = re.split("[*?[]", name)[0].split("_")[:-1]
+        query = "SELECT name FROM files WHERE dir = ?"
+        args = [directory]
+        for column, value in zip(["var", "mip", "model", "exp", "ensemble"],
+                                 fixed):
+            query += " AND " + column + " = ?"
+            args.append(value)
+        names = [row[0] for row in self.connection.execute(query, args)]
+        return [os.path.join(os.path.dirname(pattern), match)
+                for match in sorted(fnmatch.filter(names, name))]
+
+    def time_ranges(self, pattern):
+        """ @brief Years covered by each file matching a (glob) path
+            @return List of (path, start_year, end_year)-tuples, the years
+                    are None if neither the file name nor the time
+                    coordinate provides them
+        """
+        ranges = []
+        for path in self.glob(pattern):
+            directory, name = os.path.split(os.path.abspath(path))
+            row = self.connection.execute(
+                "SELECT start_year, end_year FROM files "
+                "WHERE dir = ? AND name = ?", (directory, name)).fetchone()
+            if row is None:
+                start, end = drs_facets(name)[5:]
+            else:
+                start, end = row
+            if start is None:
+                start, end = read_years(path)
+                if start is not None and row is not None:
+                    with self.connection:
+                        self.connection.execute(
+                            "UPDATE files SET start_year = ?, end_year = ? "
+                            "WHERE dir = ? AND name = ?",
+                            (start, end, directory, name))
+            ranges.append((path, start, end))
+        return ranges
+
+    def find(self, directory, **facets):
+        """ @brief Query the files of a directory by their DRS facets
+            @param directory The directory
+            @param facets Facets to match (var, mip, model, exp, ensemble)
+            @return List of (path, start_year, end_year)-tuples
+        """
+        directory = os.path.abspath(directory)
+        if not self.refresh(directory):
+            return []
+        query = "SELECT name, start_year, end_year FROM files WHERE dir = ?"
+        args = [directory]
+        for column in sorted(facets):
+            query += " AND " + column + " = ?"
+            args.append(facets[column])
+        return [(os.path.join(directory, name), start, end)
+                for name, start, end
+                in self.connection.execute(query + " ORDER BY name", args)]
+
+
+# One catalogue (connection) per process and catalogue file, a
+# connection must not be shared with the forked worker processes
+_catalogues = {}
+
+
+def get_catalogue(project_info):
+    """ @brief The catalogue configured in the namelist
+        @param project_info Current namelist in dictionary format
+    """
+    db_path = project_info.get('GLOBAL', {}).get('file_catalogue')
+    if db_path is None:
+        run_dir = project_info.get('RUNTIME', {}).get('run_dir')
+        if run_dir is not None:
+            db_path = os.path.join(run_dir, CATALOGUE_FILE)
+        else:
+            db_path = ":memory:"
+    key = (os.getpid(), db_path)
+    if key not in _catalogues:
+        _catalogues[key] = FileCatalogue(db_path)
+    return _catalogues[key]
+
+
+def isfile(project_info, path):
+    return get_catalogue(project_info).isfile(path)
+
+
+def glob(project_info, pattern):
+    return get_catalogue(project_info).glob(pattern)
+
+
+
+def select_years(project_info, pattern, start_year, end_year):
+    """ @brief The files matching a (glob) path needed for a range of years
+        @param project_info Current namelist in dictionary format
+        @return List of paths (see covering), None if the years of a
+                matching file are unknown or no file overlaps the range
+    """
+    ranges = get_catalogue(project_info).time_ranges(pattern)
+    if not ranges or any([start is None for path, start, end in ranges]):
+        return None
+    selected = covering(ranges, int(start_year), int(end_year))
+    return selected or None
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        sys.stderr.write("usage: " + sys.argv[0]
+                         + " <catalogue file> <data root> [<data root> ...]\n")
+        sys.exit(1)
+    catalogue = FileCatalogue(sys.argv[1])
+    for root in sys.argv[2:]:
+        catalogue.scan(root)
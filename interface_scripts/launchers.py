@@ -1,11 +1,18 @@
 from auxiliary import nclExecuteError, nclExecuteWarning, error, info
+import atexit
 import os
 import pdb
 import re
+import resource_report
+import signal
 import subprocess
 import sys
 import string
 import StringIO
+import threading
+import tracing
+import traceback
+import uuid
 import contextlib
 
 @contextlib.contextmanager
@@ -26,8 +33,52 @@ def stdoutIO(std_outerr=None):
 class launchers(object):
     def __init__(self):
         self.persistent_env_variables = ['ESMValTool_data_root']
-        self.filename = os.path.join(os.path.dirname(__file__),                   
-                                        '../interface_data/curr_trace_indent.txt') 
+        self.filename = os.path.join(os.path.dirname(__file__),
+                                        '../interface_data/curr_trace_indent.txt')
+        # Job manifest of the launch (see manifest.py), set by
+        # projects.run_executable
+        self.manifest = None
+        # Environment variables set for the launched script only
+        self.extra_environment = {}
+        # Collector of the trace lines of the output (see tracing.py)
+        self.trace = None
+        # Last read warnings_to_ignore.txt, (path, mtime, size) and the
+        # set of warnings (see get_warnings_to_ignore)
+        self.warnings_to_ignore = (None, set())
+
+    def get_interface_dir(self):
+        """ @brief The interface_data/-folder used by the launched script
+        """
+        if self.manifest is not None:
+            return self.manifest.get_interface_dir()
+        return os.path.join(os.path.dirname(__file__), '../interface_data')
+
+    def get_launch_settings(self):
+        """ @brief Environment and working directory for the subprocess
+            @return Two entries, None meaning 'inherit from this process'
+
+            The 'ESMValTool_*' variables are taken from the job manifest and
+            passed on to the subprocess only, the launch runs in the private
+            launch directory of the manifest.
+        """
+        env, cwd = None, None
+        if self.manifest is not None:
+            env, cwd = self.manifest.get_environment(), self.manifest.launch_dir
+        if self.extra_environment:
+            env = dict(os.environ if env is None else env)
+            env.update(self.extra_environment)
+        return env, cwd
+
+    def reset_trace_indent(self):
+        """ @brief Reset NCL trace back indent (available with verbosity=2)
+        """
+        if self.manifest is not None:
+            self.filename = os.path.join(self.get_interface_dir(),
+                                         'curr_trace_indent.txt')
+        f_indent = open(self.filename, "w")
+        f_indent.write("0")
+        f_indent.close()
+
     def convert_arguments(self):
         """
         convert launcher arguments to a dictionary
@@ -48,88 +99,173 @@ class launchers(object):
             # input to the dict() command. As a result one obtains a dictionary
             exec 'self.launch_args = dict(' + self.arguments + ')'
 
-    def write_stdouterr(self, std_outerr, verbosity, exit_on_warning):
-        """ @brief Filder and write subprocess output to screen
-            @param std_outerr Array with stdout/stderr mixed
+    def get_classifier(self):
+        """ @brief Compiled pattern classifying one line of output
+            @return Regular expression with the groups 'fatal', 'error' and
+                    'warning', matching every line
+
+            The three (case insensitive) searches for fatal_string,
+            error_string and warning_string are combined into lookaheads
+            of a single pattern, compiled once per set of strings.
+        """
+        key = (self.fatal_string, self.error_string, self.warning_string)
+        if key not in _classifiers:
+            _classifiers[key] = re.compile(
+                '(?=.*?(?P<fatal>%s))?(?=.*?(?P<error>%s))?'
+                '(?=.*?(?P<warning>%s))?' % key, re.IGNORECASE)
+        return _classifiers[key]
+
+    def get_warnings_to_ignore(self):
+        """ @brief Warnings to be suppressed for the current diagnostic
+            @return Set of stripped warning lines
+
+            The warnings are written to the ignore file by the diagnostic
+            script while it is running, so the file is re-read whenever it
+            has changed since the last call (by modification time and size).
+        """
+        warnings_ignore_file = os.path.join(self.get_interface_dir(),
+                                            "warnings_to_ignore.txt")
+        try:
+            stat = os.stat(warnings_ignore_file)
+        except OSError:
+            return set()
+        key = (warnings_ignore_file, stat.st_mtime, stat.st_size)
+        if self.warnings_to_ignore[0] != key:
+            with open(warnings_ignore_file) as fin:
+                self.warnings_to_ignore = (key,
+                                           set(line.strip() for line in fin))
+        return self.warnings_to_ignore[1]
+
+    def launch(self, command, verbosity, exit_on_warning,
+               stderr=subprocess.STDOUT):
+        """ @brief Run command and filter its output while it is running
+            @param command Shell command to run
             @param verbosity Integer controling the verbosity of the output
             @param exit_on_warning Boolean defining whether the wrapper should
                                    exit on warnings
+            @param stderr Where the stderr of the command goes (default:
+                          mixed into stdout)
         """
-        # Supress some warnings if they've been written to the ignore file
-        # (this should be done by the diagnostic script)
-        warnings_ignore_file = "interface_data/warnings_to_ignore.txt"
-        if os.path.isfile(warnings_ignore_file):
-            fin = open(warnings_ignore_file)
-            diag_specific_warnings_to_ignore = fin.readlines()
-        else:
-            diag_specific_warnings_to_ignore = []
-
-        # Suppress version info output and empty lines
-        info = [line for line in range(len(std_outerr)) if ((line > self.filter_max_line) and len(std_outerr[line]) > 0)]
-
-        fatal = [line for line in range(len(std_outerr))
-                 if re.search(self.fatal_string, std_outerr[line], re.IGNORECASE)]
-
-        error = [line for line in range(len(std_outerr))
-                 if re.search(self.error_string, std_outerr[line], re.IGNORECASE)]
-
-        warning = [line for line in range(len(std_outerr))
-                   if re.search(self.warning_string, std_outerr[line], re.IGNORECASE)]
+        env, cwd = self.get_launch_settings()
+        run_application = subprocess.Popen(command, shell=True,
+                                           stdin=open(os.devnull),
+                                           stdout=subprocess.PIPE,
+                                           stderr=stderr,
+                                           env=env, cwd=cwd,
+                                           preexec_fn=os.setpgrp)
+        return self.follow(run_application, verbosity, exit_on_warning)
+
+    def follow(self, process, verbosity, exit_on_warning):
+        """ @brief Filter the output of a running process until it exits
+            @param process Subprocess (or forked_process) writing to its
+                           stdout pipe
+            @return Exit status of the process
+        """
+        try:
+            self.write_stdouterr(iter(process.stdout.readline, ''),
+                                 verbosity, exit_on_warning,
+                                 process=process)
+        except BaseException:
+            self.abort(process)
+            raise
+        finally:
+            process.stdout.close()
+            reap(process)
+        return process.returncode
+
+    def write_stdouterr(self, std_outerr, verbosity, exit_on_warning,
+                        process=None):
+        """ @brief Filder and write subprocess output to screen
+            @param std_outerr Iterable with stdout/stderr mixed (a list or
+                              the lines of a running subprocess)
+            @param verbosity Integer controling the verbosity of the output
+            @param exit_on_warning Boolean defining whether the wrapper should
+                                   exit on warnings
+            @param process Subprocess writing std_outerr, killed when
+                           aborting
 
-        # Remove warnings to be skipped
+            Each line is classified once and written as soon as it is read.
+            The first fatal line (or error/warning with exit_on_warning)
+            aborts the subprocess.
+        """
+        classify = self.get_classifier().match
         warnings_to_skip = []
-        if len(diag_specific_warnings_to_ignore) == 0:
-            warnings_to_keep = warning
-        else:
-            warnings_to_keep = []
-            for line in warning:
-                if std_outerr[line].strip() in [w.strip() for w in diag_specific_warnings_to_ignore]:
-                    warnings_to_skip.append(line)
-                else:
-                    warnings_to_keep.append(line)
 
-        if len(fatal) > 0:
-            for line in [currLine for currLine in std_outerr]:
+        for line_no, line in enumerate(std_outerr):
+            line = line.rstrip('\n')
+            if self.trace is not None and tracing.NCL_TRACE_MARKER in line \
+                    and self.trace.add(line):
+                continue
+            severity = classify(line)
+
+            if severity.group('fatal') is not None:
                 sys.stderr.write(self.lang + " ERROR MESSAGE: " + line + '\n')
-            raise nclExecuteError(self.lang + " ERROR (see full NCL output above)")
+                self.abort(process)
+                raise nclExecuteError(self.lang + " ERROR (see full NCL output above)")
 
-        if len(error) > 0:
-            for line in [currLine for currLine in std_outerr]:
+            if severity.group('error') is not None:
                 sys.stderr.write(self.lang + " ERROR MESSAGE: " + line + '\n')
 # A-laue_ax+
-            # In contrast to "fatal" errors, we treat "normal" errors as warnings
-            # and do not abort (except if "exit_on_warning" in the namelist is set
-            # to "True".)
-            if exit_on_warning:
+                # In contrast to "fatal" errors, we treat "normal" errors as warnings
+                # and do not abort (except if "exit_on_warning" in the namelist is set
+                # to "True".)
+                if exit_on_warning:
 # A-laue_ax-
-                raise nclExecuteError(self.lang + " ERROR (see full NCL output above)")
-
-        all_output_as_warning = False
-        if len(warnings_to_keep) > 0:
-            all_output_as_warning = True
-            for line in [currLine for currLine in std_outerr]:
-                sys.stderr.write(self.lang + " WARNING MESSAGE: " + line + '\n')
-            if exit_on_warning:
-                raise nclExecuteWarning(self.lang + " WARNING (see full NCL output above)")
-
-        if len(info) > 0 and verbosity <= 10 and not all_output_as_warning:
-            for line_no in info:
-                remove_quotation_marks = re.sub('"', '', std_outerr[line_no])
-                if re.search('.*info: (.*)', remove_quotation_marks) is not None:
-                    output_string = re.search(".*info: (.*)", remove_quotation_marks).group(1)
-                    sys.stdout.write(self.lang + " info: " + output_string + '\n')
+                    self.abort(process)
+                    raise nclExecuteError(self.lang + " ERROR (see full NCL output above)")
+                continue
+
+            if severity.group('warning') is not None:
+                # Supress some warnings if they've been written to the ignore
+                # file (this should be done by the diagnostic script)
+                if line.strip() in self.get_warnings_to_ignore():
+                    warnings_to_skip.append(line)
                 else:
-                    sys.stdout.write(std_outerr[line_no] + '\n')
+                    sys.stderr.write(self.lang + " WARNING MESSAGE: " + line + '\n')
+                    if exit_on_warning:
+                        self.abort(process)
+                        raise nclExecuteWarning(self.lang + " WARNING (see full NCL output above)")
+                    continue
 
-        if verbosity > 10:
-            for line in [currLine for currLine in std_outerr]:
+            if verbosity > 10:
                 sys.stdout.write(line + '\n')
+            # Suppress version info output and empty lines
+            elif line_no > self.filter_max_line and len(line) > 0:
+                output_string = _info_pattern.search(line.replace('"', ''))
+                if output_string is not None:
+                    sys.stdout.write(self.lang + " info: " + output_string.group(1) + '\n')
+                else:
+                    sys.stdout.write(line + '\n')
+            sys.stdout.flush()
 
         if len(warnings_to_skip) > 0:
             sys.stdout.write(self.lang + " info: The following warnings were ignored (specified to" + '\n')
             sys.stdout.write(self.lang + " info: be ignored in the diagnostic script)" + '\n')
             for line in warnings_to_skip:
-                sys.stdout.write(self.lang + " info: " + std_outerr[line] + '\n')
+                sys.stdout.write(self.lang + " info: " + line + '\n')
+
+    def abort(self, process):
+        """ @brief Stop a subprocess whose output caused an abort
+
+            Processes started in their own process group are killed
+            together with their children (e.g. the real executable
+            behind a wrapper script).
+        """
+        if process is None or process.poll() is not None:
+            return
+        try:
+            if os.getpgid(process.pid) == process.pid:
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+        except OSError:
+            pass
+
+
+# Compiled classifiers of the launchers, by (fatal, error, warning) string
+_classifiers = {}
+
+_info_pattern = re.compile('.*info: (.*)')
 
 
 class ncl_launcher(launchers):
@@ -151,29 +287,32 @@ class ncl_launcher(launchers):
 
             This wrapper will take an NCL script, execute it then scan the
             stdout for the keywords 'fatal' and 'warning'. If they occur an
-            exception is raised. The wrapper will also delete all
-            'ESMValTool_'-prefixed environment variables after execution.
+            exception is raised. The 'ESMValTool_'-prefixed environment
+            variables are only set for the NCL process (see
+            get_launch_settings).
+            Within a namelist run, the enter/leave trace of the NCL routines
+            is recorded to the timeline of the run (see tracing.py).
         """
         # Reset NCL trace back indent (available with verbosity=2)
-	f_ncl_indent = open(self.filename, "w")
-        f_ncl_indent.write("0")
-        f_ncl_indent.close()
+        self.reset_trace_indent()
 
         if not os.path.exists(ncl_executable):
             raise nclExecuteError(self.lang + " ERROR (file to execute, \""
                                             + ncl_executable
                                             + "\", is missing)")
 
-        run_application = subprocess.Popen("ncl " + ncl_executable, shell=True,
-                                           stdin=open(os.devnull),
-                                           stdout=subprocess.PIPE)
-        #run_application.wait()
-        std_outerr = run_application.communicate()[0].split('\n')
-        self.write_stdouterr(std_outerr, verbosity, exit_on_warning)
-
-        for key in [env for env in os.environ if re.search('^ESMValTool_*', env)]:
-            if key not in self.persistent_env_variables:
-                del(os.environ[key])
+        # Timeline of the NCL routines (enter_msg/leave_msg)
+        run_dir = project_info.get('RUNTIME', {}).get('run_dir')
+        if run_dir is not None:
+            self.extra_environment['ESMValTool_trace'] = "True"
+            self.trace = tracing.ncl_trace(run_dir)
+        try:
+            self.launch("ncl " + ncl_executable, verbosity, exit_on_warning,
+                        stderr=None)
+        finally:
+            if self.trace is not None:
+                self.trace.finish()
+                self.trace = None
 
 
 class r_launcher(launchers):
@@ -194,13 +333,15 @@ class r_launcher(launchers):
             crash on any R warnings
 
             This wrapper will take an R script and executes it.
-            The wrapper will also delete all 'ESMValTool_'-prefixed
-            environment variables after execution.
+            The 'ESMValTool_'-prefixed environment variables are only set
+            for the R process (see get_launch_settings).
+
+            With the launcher argument ('persistent_session', True) the
+            script is executed by a long-lived R process (see r_session),
+            which keeps the packages loaded between the diagnostics.
         """
         # Reset NCL trace back indent (available with verbosity=2)
-	f_r_indent = open(self.filename, "w")
-        f_r_indent.write("0" + '\n')
-        f_r_indent.close()
+        self.reset_trace_indent()
 
         if 'r_pre_launch' in project_info['GLOBAL']:
             r_pre_launch = project_info['GLOBAL']['r_pre_launch']
@@ -216,36 +357,167 @@ class r_launcher(launchers):
         r_launch = ' Rscript --slave --quiet '
 
         # Namelist override for R script launch command
+        persistent_session = False
         self.convert_arguments()
         if self.launch_args is not None:
             if 'r_launch' in self.launch_args.keys():
                 r_launch = self.launch_args['r_launch']
+            if 'persistent_session' in self.launch_args.keys():
+                persistent_session = self.launch_args['persistent_session']
+
+        if persistent_session:
+            env, cwd = self.get_launch_settings()
+            session = r_session.get(r_pre_launch + r_launch)
+            self.follow(session.call(r_script, env, cwd),
+                        verbosity, exit_on_warning)
+            session.release()
+            return
 
         r_run = r_pre_launch + r_launch + r_script
 
-        run_application = subprocess.Popen(r_run, shell=True,
-                                           stdin=open(os.devnull),
-                                           stdout=subprocess.PIPE,
-                                           stderr=subprocess.STDOUT)
-        run_application.wait()
-        std_outerr = run_application.communicate()[0].split('\n')
-        self.write_stdouterr(std_outerr, verbosity, exit_on_warning)
+        self.launch(r_run, verbosity, exit_on_warning)
+
 
-        for key in [env for env in os.environ if re.search('^ESMValTool_*', env)]:
-            del(os.environ[key])
+class r_session(object):
+    """ @brief Long-lived R process executing R scripts on request
+
+        The R side is interface_scripts/r_worker.r, requests are written to
+        its stdin, the output of a script ends with a line holding a random
+        token and the status. Idle sessions are kept per launch command and
+        reused by later calls of the same process (sessions are never
+        shared with forked processes). A session whose call was aborted is
+        killed and replaced by a new one on the next call.
+    """
+    worker_script = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 'r_worker.r')
+    idle = {}
+    owner = None
+
+    @classmethod
+    def get(cls, r_command):
+        """ @brief An idle session for r_command (started if necessary)
+        """
+        if cls.owner != os.getpid():
+            # pipes of the sessions of a parent process must not be used
+            cls.idle = {}
+            cls.owner = os.getpid()
+            atexit.register(cls.close_all)
+        sessions = cls.idle.setdefault(r_command, [])
+        while sessions:
+            session = sessions.pop()
+            if session.process.poll() is None:
+                return session
+        return cls(r_command)
+
+    @classmethod
+    def close_all(cls):
+        """ @brief Terminate the idle sessions of this process
+        """
+        if cls.owner != os.getpid():
+            return
+        for sessions in cls.idle.values():
+            for session in sessions:
+                session.shutdown()
+        cls.idle = {}
+
+    def __init__(self, r_command):
+        self.r_command = r_command
+        self.process = subprocess.Popen(r_command + ' ' + self.worker_script,
+                                        shell=True,
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT,
+                                        preexec_fn=os.setpgrp)
+        self.pid = self.process.pid
+        self.token = None
+        self.returncode = None
+
+    def call(self, r_script, env=None, cwd=None):
+        """ @brief Start the execution of r_script
+            @return self, with the part of the subprocess.Popen interface
+                    used by launchers.follow for this call
+        """
+        if env is None:
+            env = os.environ
+        self.token = 'ESMValTool-r-session-' + uuid.uuid4().hex
+        self.returncode = None
+        request = ['call ' + self.token]
+        if cwd is not None:
+            request.append('cwd ' + cwd)
+        request.extend(['env ' + name + '=' + value
+                        for name, value in sorted(env.items())
+                        if '\n' not in name + value])
+        request.append('script ' + r_script)
+        self.process.stdin.write('\n'.join(request) + '\n')
+        self.process.stdin.flush()
+        return self
+
+    @property
+    def stdout(self):
+        return self
+
+    def readline(self):
+        """ @brief Next output line of the current call ('' at its end)
+        """
+        if self.returncode is not None:
+            return ''
+        line = self.process.stdout.readline()
+        if line == '':
+            # the R process died (e.g. quit() in the script)
+            self.returncode = self.process.wait() or 1
+        elif line.startswith(self.token + ' '):
+            self.returncode = int(line.split()[1])
+            return ''
+        return line
+
+    def poll(self):
+        if self.process.poll() is not None and self.returncode is None:
+            self.returncode = self.process.returncode or 1
+        return self.returncode
+
+    def wait(self):
+        while self.readline() != '':
+            pass
+        return self.returncode
+
+    def kill(self):
+        self.process.kill()
+
+    def release(self):
+        """ @brief Return the session to the idle sessions
+        """
+        if self.process.poll() is None:
+            r_session.idle.setdefault(self.r_command, []).append(self)
+
+    def close(self):
+        """ @brief End of reading the output of the call (the session stays)
+        """
+        pass
+
+    def shutdown(self):
+        """ @brief Terminate the R process
+        """
+        if self.process.poll() is None:
+            self.process.stdin.close()
+            self.process.wait()
 
 
 class py_launcher(launchers):
     """
     general python launcher
     """
-    def __init__(self, execute_as_shell=False, **kwargs):
+    def __init__(self, execute_as_shell=False, execute_in_worker=False,
+                 **kwargs):
         """
         Parameters
         ----------
         execute_as_shell : bool
             execute launcher in shell using e.g. subprocess
             if False, then the diagnostic script is called directly
+        execute_in_worker : bool
+            execute the diagnostic script in a forked child of this
+            process, which has the scientific python stack preloaded
+            (takes precedence over execute_as_shell)
         """
         super(py_launcher, self).__init__(**kwargs)
         self.lang = "PY "
@@ -254,6 +526,7 @@ class py_launcher(launchers):
         self.fatal_string = 'fatal:'
         self.warning_string = 'warning:'
         self.execute_as_shell = execute_as_shell
+        self.execute_in_worker = execute_in_worker
 
     def execute(self, python_executable, project_info, verbosity, exit_on_warning):
         """ @brief Wrapper to execute PYTHON scripts
@@ -265,8 +538,9 @@ class py_launcher(launchers):
 
             This wrapper will take a PYTHON script, execute it then scan the
             stdout for the keywords 'fatal' and 'warning'. If they occur an
-            exception is raised. The wrapper will also delete all
-            'ESMValTool_'-prefixed environment variables after execution.
+            exception is raised. When executed as shell, the
+            'ESMValTool_'-prefixed environment variables are only set for
+            the python process (see get_launch_settings).
 
             An alternative way to launch python scripts would be to call them
             directly. This would imply however an import of the diagnostic
@@ -282,8 +556,12 @@ class py_launcher(launchers):
         if self.launch_args is not None:
             if 'execute_as_shell' in self.launch_args.keys():
                 self.execute_as_shell = self.launch_args['execute_as_shell']
+            if 'execute_in_worker' in self.launch_args.keys():
+                self.execute_in_worker = self.launch_args['execute_in_worker']
 
-        if self.execute_as_shell:
+        if self.execute_in_worker:
+            self._execute_worker(python_executable, project_info, verbosity, exit_on_warning)
+        elif self.execute_as_shell:
             self._execute_shell(python_executable, project_info, verbosity, exit_on_warning)
         else:  # Default option
             self._execute_script(python_executable, project_info, verbosity, exit_on_warning)
@@ -327,15 +605,176 @@ class py_launcher(launchers):
         """
         execute python script in shell as subprocess
         """
-        run_application = subprocess.Popen("python " + python_executable, shell=True,
-                                           stdin=open(os.devnull),
-                                           stdout=subprocess.PIPE)
-        run_application.wait()
-        std_outerr = run_application.communicate()[0].split('\n')
-        self.write_stdouterr(std_outerr, verbosity, exit_on_warning)
+        self.launch("python " + os.path.abspath(python_executable),
+                    verbosity, exit_on_warning, stderr=None)
+
+    def _execute_worker(self, python_executable, project_info, verbosity, exit_on_warning):
+        """
+        execute python script in a forked child process
+
+        The heavy modules (see PRELOAD_MODULES) are imported once into
+        this process, each diagnostic then runs in a child forked from it.
+        With more than one job the task processes are forked from the
+        scheduler, which preloads the modules before (see
+        scheduler.run_tasks), otherwise every task would import them again.
+        The child starts without any import cost, shares the preloaded
+        memory copy-on-write and gets the project_info as is (no
+        pickling). The diagnostic module is only imported in the child,
+        hence nothing leaks from one diagnostic into the next. The output
+        of the child is filtered like the one of a shell launch, a
+        non-zero exit status raises nclExecuteError.
+
+        Parameters
+        ----------
+        python_executable : str
+            name of executable script
+        project_info : dict
+            dictionary with relevant project info from namelist
+        """
+        if not os.path.exists(python_executable):
+            raise ValueError('Python executable not existing: %s' % python_executable)
+        preload_modules()
+
+        env, cwd = self.get_launch_settings()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_end)
+            _run_forked_script(os.path.abspath(python_executable),
+                               project_info, env, cwd, write_end)
+        os.close(write_end)
+
+        status = self.follow(forked_process(pid, os.fdopen(read_end)),
+                             verbosity, exit_on_warning)
+        if status != 0:
+            raise nclExecuteError(self.lang + " ERROR (" + python_executable
+                                  + " exited with status " + str(status) + ")")
+
+
+# Modules imported once before forking python diagnostics (missing ones are
+# skipped)
+PRELOAD_MODULES = ['numpy', 'scipy', 'scipy.stats', 'scipy.interpolate',
+                   'matplotlib', 'matplotlib.pyplot', 'netCDF4',
+                   'mpl_toolkits.basemap', 'iris', 'cdo']
+
+_preloaded = set()
+
+
+def preload_modules(names=None):
+    """ @brief Import the heavy python modules into this process
+        @param names Module names (default: PRELOAD_MODULES)
+
+        matplotlib is switched to the non-interactive 'Agg' backend before
+        pyplot gets imported.
+    """
+    for name in PRELOAD_MODULES if names is None else names:
+        if name in _preloaded:
+            continue
+        _preloaded.add(name)
+        try:
+            __import__(name)
+        except Exception:
+            continue
+        if name == 'matplotlib':
+            sys.modules[name].use('Agg')
+
+
+class forked_process(object):
+    """ @brief Child process created by os.fork, with the part of the
+               subprocess.Popen interface used by launchers.follow
+    """
+    def __init__(self, pid, stdout):
+        self.pid = pid
+        self.stdout = stdout
+        self.returncode = None
+
+    def poll(self):
+        if self.returncode is None:
+            pid, status = os.waitpid(self.pid, os.WNOHANG)
+            if pid == self.pid:
+                self._set_returncode(status)
+        return self.returncode
+
+    def wait(self):
+        if self.returncode is None:
+            self._set_returncode(os.waitpid(self.pid, 0)[1])
+        return self.returncode
+
+    def kill(self):
+        os.kill(self.pid, signal.SIGKILL)
+
+    def _set_returncode(self, status):
+        self.returncode = _exit_status(status)
+
+
+def _exit_status(status):
+    """ @brief Return code (as in subprocess.Popen) of a wait status
+    """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def reap(process):
+    """ @brief Wait for a process started by a launcher and account its
+               own peak RSS to the measured stages (see resource_report)
+        @param process subprocess.Popen or forked_process instance
+        @return Exit status of the process
+    """
+    if process.returncode is None \
+            and isinstance(process, (subprocess.Popen, forked_process)):
+        try:
+            pid, status, usage = os.wait4(process.pid, 0)
+        except OSError:
+            # Reaped already
+            pass
+        else:
+            process.returncode = _exit_status(status)
+            resource_report.child_exited(usage)
+    return process.wait()
+
+
+def _run_forked_script(python_executable, project_info, env, cwd, fd):
+    """ @brief Body of a forked python diagnostic, never returns
+        @param fd Write end of the pipe taking stdout/stderr
+    """
+    status = 1
+    try:
+        os.setpgrp()
+        os.dup2(fd, 1)
+        os.dup2(fd, 2)
+        os.close(fd)
+        sys.stdout = os.fdopen(1, 'w', 1)
+        sys.stderr = os.fdopen(2, 'w', 0)
+        if env is not None:
+            os.environ.clear()
+            os.environ.update(env)
+        if cwd is not None:
+            os.chdir(cwd)
+        script_dir, script_name = os.path.split(python_executable)
+        sys.path.insert(0, script_dir)
+        sys.argv = [python_executable]
+        usr_script = __import__(os.path.splitext(script_name)[0])
+        usr_script.main(project_info)
+        status = 0
+    except SystemExit as exc:
+        if exc.code is None:
+            status = 0
+        elif isinstance(exc.code, int):
+            status = exc.code
+        else:
+            sys.stderr.write(str(exc.code) + '\n')
+    except:
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(status)
 
-        for key in [env for env in os.environ if re.search('^ESMValTool_*', env)]:
-            del(os.environ[key])
 
 class shell_launcher(launchers):                                                           
       """ @brief general unix shell launcher                                             
@@ -350,33 +789,41 @@ class shell_launcher(launchers):
                                                                                            
       def execute(self, executable, project_info, verbosity, exit_on_warning):             
               try:                                                                         
-                      with open(self.filename, "w") as f:                                  
-                              f.write("0")                                                 
-                              f.close()                                                    
+                      self.reset_trace_indent()
               except IOError:                                                              
-                      raise error("IOError while open/write: '{0}'".format(filename))      
+                      raise error("IOError while open/write: '{0}'".format(self.filename))
                                                                                            
               if not os.path.exists(executable):                                           
                       raise IOError("file to execute is missing: {0}".format(executable))  
                                                                                            
-              cmd = self.lang + " {0}".format(executable)                                  
-              run_application = subprocess.Popen(cmd, shell=True,                          
-                                           stdin=open(os.devnull),                         
-                                           stdout=subprocess.PIPE,                         
-                                           stderr=subprocess.PIPE)                         
-              run_application.wait()                                                       
-              output = run_application.communicate()                                       
-              std_out = filter(None,output[0].split('\n'))                                 
-              std_err = filter(None,output[1].split('\n'))                                 
-              for i in [self.lang.upper() + ' INFO : ' + item for item in std_out]:        
-                      print i                                                              
-              for i in [self.lang.upper() + ' ERROR: ' + item for item in std_err]:        
-                                                                                           
-                      print i                                                              
-                                                                                           
-              for key in [env for env in os.environ if re.search('^ESMValTool_*', env)]:   
-                      del(os.environ[key])                                                 
-                                                                                           
+              cmd = self.lang + " {0}".format(executable)
+              env, cwd = self.get_launch_settings()
+              run_application = subprocess.Popen(cmd, shell=True,
+                                           stdin=open(os.devnull),
+                                           stdout=subprocess.PIPE,
+                                           stderr=subprocess.PIPE,
+                                           env=env, cwd=cwd)
+              # stderr is forwarded by a second thread, so that neither
+              # pipe can fill up while the other one is read
+              err_thread = threading.Thread(
+                      target=self.forward_lines,
+                      args=(run_application.stderr, self.lang.upper() + ' ERROR: '))
+              err_thread.start()
+              self.forward_lines(run_application.stdout, self.lang.upper() + ' INFO : ')
+              err_thread.join()
+              reap(run_application)
+
+      def forward_lines(self, stream, prefix):
+              """ @brief Print the non-empty lines of stream as they arrive
+              """
+              for line in iter(stream.readline, ''):
+                      line = line.rstrip('\n')
+                      if line:
+                              sys.stdout.write(prefix + line + '\n')
+                              sys.stdout.flush()
+              stream.close()
+
+
 class csh_launcher(shell_launcher):                                                        
       """ @brief csh-shell script launcher                                               
       """                                                                                  
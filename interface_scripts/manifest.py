@@ -0,0 +1,283 @@
+# Per-launch job manifests and launch directories
+#
+# What it does:
+#  - A JobManifest is an immutable, self-contained description of one
+#    launch of an NCL/R/Python script: the 'ESMValTool_*' environment,
+#    the repackaged interface data and the files the interface was
+#    rendered from. It is written as JSON to the launch directory and its
+#    path is exported to the script as ESMValTool_manifest.
+#  - Every launch runs in its own launch directory, mirroring the
+#    ESMValTool root folder through symbolic links but with a private
+#    interface_data/-folder, so that any number of launches (and runs)
+#    can share one checkout.
+#  - The rendered interface files are cached per manifest digest, a
+#    launch with unchanged inputs reuses them instead of re-rendering.
+#    Rendered interface entries which are not JSON representable enter
+#    the digest by their text, as written by the templates.
+#  - The output folders of the namelist are made absolute (against the
+#    ESMValTool root folder) and created before any launch, so that no
+#    output ends up inside a launch directory. Only the links and the
+#    private interface_data/ of a launch directory are removed after the
+#    launch, anything else written there is kept.
+
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tempfile
+
+MANIFEST_FILE = "manifest.json"
+
+# Output folders of the GLOBAL section, relative to the ESMValTool root
+OUTPUT_DIRS = ['plot_dir', 'wrk_dir', 'climo_dir', 'regridding_dir']
+
+
+def make_output_dirs(global_section, source_dir=None):
+    """ @brief Make the output folders of the namelist absolute and
+               create them
+        @param global_section The 'GLOBAL' section of project_info
+        @param source_dir ESMValTool root folder (defaults to cwd)
+
+        The scripts run in their launch directory, a relative output folder
+        would otherwise be created inside the launch directory (or, with
+        '..', next to it). A trailing separator is kept.
+    """
+    if source_dir is None:
+        source_dir = os.getcwd()
+    for key in OUTPUT_DIRS:
+        if key not in global_section:
+            continue
+        path = global_section[key].strip()
+        absolute = os.path.abspath(os.path.join(source_dir, path))
+        if path.endswith(os.sep):
+            absolute = os.path.join(absolute, "")
+        global_section[key] = absolute
+        if not os.path.isdir(absolute):
+            try:
+                os.makedirs(absolute)
+            except OSError:
+                # Created concurrently
+                if not os.path.isdir(absolute):
+                    raise
+
+
+def create_launch_dir(parent_dir, prefix, source_dir=None):
+    """ @brief Create a private working directory for a launch
+        @param parent_dir Folder holding the launch directories
+        @param prefix Prefix for the launch directory name
+        @param source_dir ESMValTool root folder (defaults to cwd)
+        @return Path to the launch directory
+
+        All scripts refer to the interface files and to each other through
+        paths relative to the ESMValTool root folder. The launch directory
+        therefore links to every entry of the root folder, except for
+        interface_data/ which is private to the launch (only the templates
+        and the README are linked).
+    """
+    if source_dir is None:
+        source_dir = os.getcwd()
+    source_dir = os.path.abspath(source_dir)
+
+    if not os.path.isdir(parent_dir):
+        try:
+            os.makedirs(parent_dir)
+        except OSError:
+            if not os.path.isdir(parent_dir):
+                raise
+    launch_dir = tempfile.mkdtemp(prefix=prefix + "_", dir=parent_dir)
+    os.mkdir(os.path.join(launch_dir, "interface_data"))
+
+    for entry in os.listdir(source_dir):
+        if entry.startswith(".") or entry == "interface_data":
+            continue
+        os.symlink(os.path.join(source_dir, entry),
+                   os.path.join(launch_dir, entry))
+
+    interface_dir = os.path.join(source_dir, "interface_data")
+    for entry in os.listdir(interface_dir):
+        if entry == "README" or entry.endswith("_interface_templates"):
+            os.symlink(os.path.join(interface_dir, entry),
+                       os.path.join(launch_dir, "interface_data", entry))
+    return launch_dir
+
+
+def file_stamp(path):
+    """ @brief Identify the state of a file by its path, size and mtime
+    """
+    try:
+        status = os.stat(path)
+    except OSError:
+        return [os.path.abspath(path), None, None]
+    return [os.path.abspath(path), status.st_size, status.st_mtime]
+
+
+def serializable(value):
+    """ @brief Keep only the JSON representable part of an interface entry
+    """
+    simple_types = (basestring, bool, int, long, float, type(None))
+    if isinstance(value, simple_types):
+        return True
+    if isinstance(value, (list, tuple)):
+        return all([isinstance(item, simple_types) for item in value])
+    return False
+
+
+def entry_text(value):
+    """ @brief Text of an interface entry as rendered into the templates
+               (one string per item)
+    """
+    if not isinstance(value, (list, tuple)):
+        value = [value]
+    return ["%s" % (item,) for item in value]
+
+
+class JobManifest(object):
+    """ @brief Immutable description of a single script launch
+    """
+    def __init__(self, language, executable, environment, interface,
+                 sources, launch_dir=None, rendered=None):
+        """ @param language Interface language ('ncl', 'r', 'py')
+            @param executable The script to launch
+            @param environment Dictionary of environment variables
+            @param interface Dictionary of interface entries, only the JSON
+                             representable ones are kept
+            @param sources Files the rendered interface depends on
+                           (templates, variable definitions)
+            @param launch_dir Private working directory of the launch
+            @param rendered Names of the interface entries rendered into
+                            the interface files (default: all)
+        """
+        self.language = language
+        self.executable = executable
+        self.environment = dict(environment)
+        self.interface = dict((key, value)
+                              for key, value in interface.iteritems()
+                              if serializable(value))
+        # Text of the other rendered entries (for the digest only)
+        self.interface_text = dict(
+            (key, entry_text(value)) for key, value in interface.iteritems()
+            if not serializable(value) and (rendered is None
+                                            or key in rendered))
+        self.sources = sorted(set(sources))
+        self.launch_dir = launch_dir
+        self.digest = self.get_digest()
+
+    def get_digest(self):
+        """ @brief Hash of everything the rendered interface depends on
+
+            The environment and the launch directory are not part of the
+            rendered files, hence they do not enter the digest.
+        """
+        key = {'language': self.language,
+               'interface': self.interface,
+               'interface_text': self.interface_text,
+               'sources': [file_stamp(path) for path in self.sources]}
+        return hashlib.sha1(json.dumps(key, sort_keys=True)).hexdigest()
+
+    def get_environment(self, base_environment=None):
+        """ @brief Environment for the launched script
+            @param base_environment Environment to extend (default:
+                                    os.environ)
+        """
+        if base_environment is None:
+            base_environment = os.environ
+        environment = dict(base_environment)
+        environment.update(self.environment)
+        return environment
+
+    def get_interface_dir(self):
+        return os.path.join(self.launch_dir, "interface_data")
+
+    def get_path(self):
+        return os.path.join(self.get_interface_dir(), MANIFEST_FILE)
+
+    def as_dict(self):
+        return {'language': self.language,
+                'executable': self.executable,
+                'launch_dir': self.launch_dir,
+                'digest': self.digest,
+                'environment': self.environment,
+                'interface': self.interface,
+                'sources': self.sources}
+
+    def write(self):
+        """ @brief Write the manifest (read-only) to the launch directory
+        """
+        path = self.get_path()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.as_dict(), f, sort_keys=True, indent=1)
+        os.chmod(tmp_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        os.rename(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """ @brief Read a manifest written by JobManifest.write
+        """
+        with open(path) as f:
+            content = json.load(f)
+        manifest = cls(content['language'],
+                       content['executable'],
+                       content['environment'],
+                       content['interface'],
+                       content['sources'],
+                       launch_dir=content['launch_dir'])
+        manifest.digest = content['digest']
+        return manifest
+
+    def install_interface(self, cache_dir, render):
+        """ @brief Put the rendered interface files into the launch directory
+            @param cache_dir Folder holding the rendered interface files
+                             per manifest digest
+            @param render Callable rendering the interface files into the
+                          folder given as its argument
+            @return True if the files were taken from the cache
+
+            On a cache miss the files are rendered into a temporary folder
+            which is then moved in place atomically, so concurrent launches
+            never see partially written interface files.
+        """
+        cached = os.path.join(cache_dir, self.digest)
+        hit = os.path.isdir(cached)
+        if not hit:
+            if not os.path.isdir(cache_dir):
+                try:
+                    os.makedirs(cache_dir)
+                except OSError:
+                    if not os.path.isdir(cache_dir):
+                        raise
+            tmp_dir = tempfile.mkdtemp(prefix=self.digest + "_", dir=cache_dir)
+            render(tmp_dir)
+            try:
+                os.rename(tmp_dir, cached)
+            except OSError:
+                # Rendered concurrently by another launch
+                shutil.rmtree(tmp_dir)
+
+        for entry in os.listdir(cached):
+            shutil.copy(os.path.join(cached, entry),
+                        os.path.join(self.get_interface_dir(), entry))
+        return hit
+
+    def remove_launch_dir(self):
+        """ @brief Remove the links and the interface folder of the launch
+                   directory
+            @return List of the other entries, written by the script; the
+                    launch directory is kept if there are any
+        """
+        if self.launch_dir is None or not os.path.isdir(self.launch_dir):
+            return []
+        kept = []
+        for entry in sorted(os.listdir(self.launch_dir)):
+            path = os.path.join(self.launch_dir, entry)
+            if os.path.islink(path):
+                os.remove(path)
+            elif entry == "interface_data":
+                shutil.rmtree(path)
+            else:
+                kept.append(entry)
+        if not kept:
+            os.rmdir(self.launch_dir)
+        return kept
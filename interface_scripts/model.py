@@ -2,11 +2,26 @@ import pdb
 
 
 class Model(object):
+    """ @brief One <model>-tag of the namelist
+
+        The space separated entries of the model line are split once, the
+        Project-classes look them up by position (see
+        projects.Project.get_model_sections).
+    """
+    __slots__ = ('model_line', 'entries', 'diag_specific', 'attributes')
+
     def __init__(self, model_line, attributes, diag_specific_model):
         self.model_line = model_line
+        self.entries = tuple(model_line.split())
         self.diag_specific = diag_specific_model
         self.attributes = attributes
 
+    def __getstate__(self):
+        return (self.model_line, self.attributes, self.diag_specific)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
     def get_model_line(self):
         return self.model_line
 
@@ -17,7 +32,7 @@ class Model(object):
         return self.diag_specific
 
     def split_entries(self):
-        return self.model_line.split()
+        return list(self.entries)
 
     def __str__(self):
         model_line = self.get_model_line()
@@ -1,10 +1,45 @@
 from auxiliary import info
 import data_interface
 import exceptions
+import file_catalogue
 import os
 import launchers
 import pdb
 import re
+import resource_report
+import tracing
+import variable_registry
+
+
+def memoized(method):
+    """ @brief Memoize a file name/key method of a Project on its arguments
+        @param method Method taking <model>-tags and (optionally) the
+                      project_info-dictionary
+
+        The <model>-tag enters the key by its model line, project_info by
+        the 'climo_dir' (the only entry the memoized methods depend on).
+    """
+    def key_of(value):
+        if hasattr(value, 'model_line'):
+            return ('model', value.model_line)
+        if isinstance(value, dict):
+            return ('climo_dir', value.get('GLOBAL', {}).get('climo_dir'))
+        return value
+
+    def memoized_method(self, *args, **kwargs):
+        key = (method,
+               tuple([key_of(value) for value in args]),
+               tuple(sorted([(name, key_of(value))
+                             for name, value in kwargs.items()])))
+        try:
+            return self.path_cache[key]
+        except KeyError:
+            value = method(self, *args, **kwargs)
+            self.path_cache[key] = value
+            return value
+    memoized_method.__name__ = method.__name__
+    memoized_method.__doc__ = method.__doc__
+    return memoized_method
 
 
 class Project:
@@ -13,28 +48,41 @@ class Project:
     def __init__(self):
         self.add_specifier = {}
 
+        # Parsed <model>-tag lines (model line -> model section dictionary)
+        self.model_cache = {}
+
+        # Memoized file names and keys (see memoized)
+        self.path_cache = {}
+
     def get_model_subsection(self, model, model_section):
         """ @brief Retrieve a specific model entry from a <model> tag line
             @param model One of the <model>-tags in the XML namelist file
             @param model_section Which of the model entries to retrieve
         """
-        section = \
-            model.split_entries()[self.model_specifiers.index(model_section)]
+        section = model.entries[self.model_specifiers.index(model_section)]
         return section
 
-    def get_model_sections(self, model):
+    def get_model_sections(self, model, variable=None):
         """ @brief Retrieve all model entries from a <model> tag line
             @param model One of the <model>-tags in the XML namelist file
+            @param variable Base variable replacing the ${VARIABLE}-
+                            placeholder in the 'dir' entry (the placeholder
+                            is kept without a variable)
+            @return A new dictionary (model specifier -> entry)
         """
-        model_sections = [self.get_model_subsection(model, modelpart)
-                          for modelpart in self.model_specifiers]
-        model_sect_dict = dict(zip(self.model_specifiers, model_sections))
+        model_sect_dict = self.model_cache.get(model.model_line)
+        if model_sect_dict is None:
+            model_sect_dict = dict(
+                [(modelpart, model.entries[index])
+                 for index, modelpart in enumerate(self.model_specifiers)])
+            self.model_cache[model.model_line] = model_sect_dict
+        model_sect_dict = dict(model_sect_dict)
 
         # Replace the ${VARIABLE}-placeholder in infile dir with base var
-        if re.search("\$\{VARIABLE\}", model_sect_dict['dir']) is not None:
-            base_var = os.environ['__ESMValTool_base_var']
+        if variable is not None and 'dir' in model_sect_dict \
+                and "${VARIABLE}" in model_sect_dict['dir']:
             model_sect_dict['dir'] \
-                = re.sub("\$\{VARIABLE\}", base_var, model_sect_dict['dir'])
+                = model_sect_dict['dir'].replace("${VARIABLE}", variable)
         return model_sect_dict
 
     def get_cf_outpath(self, project_info, model):
@@ -51,6 +99,7 @@ class Project:
                               msd['project'])
         return outdir
 
+    @memoized
     def get_cf_fullpath(self, project_info, model, field, variable, mip, exp):
         """ @brief Returns the path (only) to the output file used in reformat
             @param project_info Current namelist in dictionary format
@@ -119,44 +168,52 @@ class Project:
 
         return fx_files[fx_ID]
 
-    def get_cf_areafile(self, project_info, model):
+    def get_cf_areafile(self, project_info, model, variable=None):
         """ @brief Returns the path to the areacello file used for
                    ocean variables
             @param project_info Current namelist in dictionary format
             @param model One of the <model>-tags in the XML namelist file
+            @param variable Base variable replacing ${VARIABLE} in the 'dir'
+                            entry
             @return A string (areafile path)
 
             This function looks for the areafile of the ocean grid
         """
         return None
 
-    def get_cf_porofile(self, project_info, model):
+    def get_cf_porofile(self, project_info, model, variable=None):
         """ @brief Returns the path to the mrsofc file used for
                    land variables
             @param project_info Current namelist in dictionary format
             @param model One of the <model>-tags in the XML namelist file
+            @param variable Base variable replacing ${VARIABLE} in the 'dir'
+                            entry
             @return A string (areafile path)
 
             This function looks for the porosity file
         """
         return None
 
-    def get_cf_lmaskfile(self, project_info, model):
+    def get_cf_lmaskfile(self, project_info, model, variable=None):
         """ @brief Returns the path to the sftlf file used for masking
                    land variables (regular grid)
             @param project_info Current namelist in dictionary format
             @param model One of the <model>-tags in the XML namelist file
+            @param variable Base variable replacing ${VARIABLE} in the 'dir'
+                            entry
             @return A string (maskfile path)
 
             This function looks for the maskfile of the ocean grid
         """
         return None
 
-    def get_cf_omaskfile(self, project_info, model):
+    def get_cf_omaskfile(self, project_info, model, variable=None):
         """ @brief Returns the path to the sftof file used for masking
                    ocean variables (irregular grid)
             @param project_info Current namelist in dictionary format
             @param model One of the <model>-tags in the XML namelist file
+            @param variable Base variable replacing ${VARIABLE} in the 'dir'
+                            entry
             @return A string (maskfile path)
 
             This function looks for the maskfile of the ocean grid
@@ -168,16 +225,18 @@ class Project:
         """
         return self.basename
 
-    def get_cf_sections(self, model):
+    def get_cf_sections(self, model, variable=None):
         """ @brief Return the sections from the <model> tag needed in reformat
             @param model One of the <model>-tags in the XML namelist file
+            @param variable Base variable replacing ${VARIABLE} in the 'dir'
+                            entry
             @return Six strings
 
             This function returns the sections from the <model> tag that
             are needed in the 'reformat'-routine.
         """
         # msd = model_section_dictionary
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
 
         return msd['project'],\
             msd['name'],\
@@ -222,25 +281,12 @@ class Project:
 
             This function looks for a project specific dictionary file
             to translate the standard (ESMValTool) variable name into
-            the corresponding variable name of the actual project.
+            the corresponding variable name of the actual project (parsed
+            once, see variable_registry.py).
         """
 
-        project = self.get_project_name(model)
-        names_file = 'reformat_scripts/fixes/names_' + project + '.dat'
-
-        project_var = variable
-
-        if os.path.isfile(names_file):
-            with open(names_file) as f:
-                for line in f:
-                    first_char = line[:1]
-                    if first_char != "#":
-                        names = line.split('|')
-                        std = names[0].strip()
-                        if std == variable:
-                            project_var = names[1].strip()
-
-        return project_var
+        return variable_registry.get_registry().get_project_name(
+            self.get_project_name(model), variable)
 
 
 class OBS(Project):
@@ -265,6 +311,7 @@ class OBS(Project):
         """
         self.basename = "OBS"
 
+    @memoized
     def get_dict_key(self, model, mip, exp):
         """ @brief Returns a unique key based on the model entries provided.
             @param model One of the <model>-tags in the XML namelist file
@@ -321,7 +368,7 @@ class OBS(Project):
         indata_root = self.get_data_root()
 
         # msd = model_section_dictionary
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
 
         indir = os.path.join(indata_root,
                              msd["dir"])
@@ -347,6 +394,7 @@ class OBS(Project):
 
         return indir, infile
 
+    @memoized
     def get_cf_outfile(self, project_info, model, field, variable, mip, exp):
         """ @brief Returns the path and output file used in reformat
             @param variable Current variable
@@ -395,11 +443,13 @@ class OBS_gridfile(OBS):
                                  "dir",
                                  "gridfile"]
 
-    def get_cf_areafile(self, project_info, model):
+    def get_cf_areafile(self, project_info, model, variable=None):
         """ @brief Returns the path to the areacello/areacella file
                    used for variables
             @param project_info Current namelist in dictionary format
             @param model One of the <model>-tags in the XML namelist file
+            @param variable Base variable replacing ${VARIABLE} in the 'dir'
+                            entry
             @return A string (areafile path)
 
             This function looks for the areafile of the grid
@@ -428,6 +478,7 @@ class obs4mips(Project):
         """
         self.basename = "obs4mips"
 
+    @memoized
     def get_dict_key(self, model, mip, exp):
         """ @brief Returns a unique key based on the model entries provided.
             @param model One of the <model>-tags in the XML namelist file
@@ -480,7 +531,7 @@ class obs4mips(Project):
             reformat routines
         """
         # msd = model_section_dictionary
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
 
         indir = os.path.join(msd["dir"],
                              msd["name"])
@@ -490,7 +541,8 @@ class obs4mips(Project):
                            msd['level'],
                            msd['ensemble']]) + '.nc'
 
-        if (not os.path.isfile(os.path.join(indir, infile))):
+        if (not file_catalogue.isfile(project_info,
+                                      os.path.join(indir, infile))):
             infile = '_'.join([variable,
                                msd['name'],
                                msd['level'],
@@ -498,6 +550,7 @@ class obs4mips(Project):
 
         return indir, infile
 
+    @memoized
     def get_cf_outfile(self, project_info, model, field, variable, mip, exp):
         """ @brief Returns the output file used in the reformat routines
             @param variable Current variable
@@ -546,6 +599,7 @@ class ana4mips(Project):
         """
         self.basename = "ana4mips"
 
+    @memoized
     def get_dict_key(self, model, mip, exp):
         """ @brief Returns a unique key based on the model entries provided.
             @param model One of the <model>-tags in the XML namelist file
@@ -602,7 +656,7 @@ class ana4mips(Project):
             reformat routines
         """
         # msd = model_section_dictionary
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
         msd = self.rewrite_mip_exp(msd, mip, exp)
 
         indir = os.path.join(msd['dir'],
@@ -615,7 +669,8 @@ class ana4mips(Project):
                            msd['ensemble'],
                            msd['name']]) + '.nc'
 
-        if (not os.path.isfile(os.path.join(indir, infile))):
+        if (not file_catalogue.isfile(project_info,
+                                      os.path.join(indir, infile))):
             infile = '_'.join([variable,
                                msd['mip'],
                                msd['ensemble'],
@@ -623,6 +678,7 @@ class ana4mips(Project):
 
         return indir, infile
 
+    @memoized
     def get_cf_outfile(self, project_info, model, field, variable, mip, exp):
         """ @brief Returns the output file used in the reformat routines
             @param variable Current variable
@@ -695,6 +751,7 @@ class CMIP5(Project):
     def get_model_dir(self, model):
         return self.get_model_subsection(model, "dir")
 
+    @memoized
     def get_dict_key(self, model, mip, exp):
         """ @brief Returns a unique key based on the model entries provided.
             @param model One of the <model>-tags in the XML namelist file
@@ -755,7 +812,7 @@ class CMIP5(Project):
         indata_root = self.get_data_root()
 
         # msd = model_section_dictionary
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
         msd = self.rewrite_mip_exp(msd, mip, exp)
 
         indir = os.path.join(indata_root, msd["dir"])
@@ -768,7 +825,8 @@ class CMIP5(Project):
                            msd['experiment'],
                            msd['ensemble']]) + '.nc'
 
-        if (not os.path.isfile(os.path.join(indir, infile))):
+        if (not file_catalogue.isfile(project_info,
+                                      os.path.join(indir, infile))):
             infile = '_'.join([variable,
                                msd['mip'],
                                msd['name'],
@@ -777,16 +835,18 @@ class CMIP5(Project):
 
         return indir, infile
 
-    def get_cf_areafile(self, project_info, model):
+    def get_cf_areafile(self, project_info, model, variable=None):
         """ @brief Returns the path to the areacello file
                    used for ocean variables
             @param project_info Current namelist in dictionary format
             @param model One of the <model>-tags in the XML namelist file
+            @param variable Base variable replacing ${VARIABLE} in the 'dir'
+                            entry
             @return A string (areafile path)
 
             This function looks for the areafile of the ocean grid
         """
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
 
         areadir = msd["dir"]
 
@@ -795,16 +855,18 @@ class CMIP5(Project):
 
         return os.path.join(areadir, areafile)
 
-    def get_cf_porofile(self, project_info, model):
+    def get_cf_porofile(self, project_info, model, variable=None):
         """ @brief Returns the path to the mrsofc file used for
                    land variables
             @param project_info Current namelist in dictionary format
             @param model One of the <model>-tags in the XML namelist file
+            @param variable Base variable replacing ${VARIABLE} in the 'dir'
+                            entry
             @return A string (areafile path)
 
             This function looks for the porosity file
         """
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
 
         maskdir = msd["dir"]
 
@@ -813,16 +875,18 @@ class CMIP5(Project):
 
         return os.path.join(maskdir, maskfile)
 
-    def get_cf_lmaskfile(self, project_info, model):
+    def get_cf_lmaskfile(self, project_info, model, variable=None):
         """ @brief Returns the path to the sftlf file used for masking
                    land variables (regular grid)
             @param project_info Current namelist in dictionary format
             @param model One of the <model>-tags in the XML namelist file
+            @param variable Base variable replacing ${VARIABLE} in the 'dir'
+                            entry
             @return A string (maskfile path)
 
             This function looks for the maskfile of the ocean grid
         """
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
 
         maskdir = msd["dir"]
 
@@ -831,16 +895,18 @@ class CMIP5(Project):
 
         return os.path.join(maskdir, maskfile)
 
-    def get_cf_omaskfile(self, project_info, model):
+    def get_cf_omaskfile(self, project_info, model, variable=None):
         """ @brief Returns the path to the sftof file used for masking
                    ocean variables (irregular grid)
             @param project_info Current namelist in dictionary format
             @param model One of the <model>-tags in the XML namelist file
+            @param variable Base variable replacing ${VARIABLE} in the 'dir'
+                            entry
             @return A string (maskfile path)
 
             This function looks for the maskfile of the ocean grid
         """
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
 
         maskdir = msd["dir"]
 
@@ -849,6 +915,7 @@ class CMIP5(Project):
 
         return os.path.join(maskdir, maskfile)
 
+    @memoized
     def get_cf_outfile(self, project_info, model, field, variable, mip, exp):
         """ @brief Returns the output file used in the reformat routines
             @param variable Current variable
@@ -898,11 +965,13 @@ class CMIP5_gridfile(CMIP5):
 
         self.add_specifier['case_name'] = 'experiment'
 
-    def get_cf_areafile(self, project_info, model):
+    def get_cf_areafile(self, project_info, model, variable=None):
         """ @brief Returns the path to the areacello file
                    used for ocean variables
             @param project_info Current namelist in dictionary format
             @param model One of the <model>-tags in the XML namelist file
+            @param variable Base variable replacing ${VARIABLE} in the 'dir'
+                            entry
             @return A string (areafile path)
 
             This function looks for the areafile of the ocean grid
@@ -929,11 +998,13 @@ class CMIP5_fx(CMIP5):
 
         self.add_specifier['case_name'] = 'fx_file_ID'
 
-    def get_cf_areafile(self, project_info, model):
+    def get_cf_areafile(self, project_info, model, variable=None):
         """ @brief Returns the path to the areacello file
                    used for ocean variables
             @param project_info Current namelist in dictionary format
             @param model One of the <model>-tags in the XML namelist file
+            @param variable Base variable replacing ${VARIABLE} in the 'dir'
+                            entry
             @return A string (areafile path)
 
             This function looks for the areafile of the ocean grid
@@ -971,16 +1042,18 @@ class CMIP5_SMHI(CMIP5):
 
         self.add_specifier['case_name'] = 'experiment'
 
-    def get_cf_areafile(self, project_info, model):
+    def get_cf_areafile(self, project_info, model, variable=None):
         """ @brief Returns the path to the areacello file
                    used for ocean variables
             @param project_info Current namelist in dictionary format
             @param model One of the <model>-tags in the XML namelist file
+            @param variable Base variable replacing ${VARIABLE} in the 'dir'
+                            entry
             @return A string (areafile path)
 
             This function looks for the areafile of the ocean grid
         """
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
 
         areadir = os.path.join(msd["dir"], msd["name"], "fx")
         areafile = 'areacello_fx_' + msd["name"] + "_" + "xxx" + "_r0i0p0.nc"
@@ -1001,7 +1074,7 @@ class CMIP5_SMHI(CMIP5):
             reformat routines
         """
         # msd = model_section_dictionary
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
         msd = self.rewrite_mip_exp(msd, mip, exp)
 
         indir = os.path.join(msd["dir"],
@@ -1016,7 +1089,8 @@ class CMIP5_SMHI(CMIP5):
                            msd["experiment"],
                            msd["ensemble"]]) + ".nc"
 
-        if (not os.path.isfile(os.path.join(indir, infile))):
+        if (not file_catalogue.isfile(project_info,
+                                      os.path.join(indir, infile))):
             infile = "_".join([variable,
                                msd["mip"],
                                msd["name"],
@@ -1047,7 +1121,7 @@ class CMIP5_ETHZ(CMIP5):
         """
 
         # msd = model_section_dictionary
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
         msd = self.rewrite_mip_exp(msd, mip, exp)
 
         indir = os.path.join(msd["dir"],
@@ -1063,7 +1137,8 @@ class CMIP5_ETHZ(CMIP5):
                            msd["experiment"],
                            msd["ensemble"]]) + ".nc"
 
-        if (not os.path.isfile(os.path.join(indir, infile))):
+        if (not file_catalogue.isfile(project_info,
+                                      os.path.join(indir, infile))):
             infile = "_".join([variable,
                                msd["mip"],
                                msd["name"],
@@ -1072,18 +1147,20 @@ class CMIP5_ETHZ(CMIP5):
 
         return indir, infile
 
-    def get_cf_areafile(self, project_info, model):
+    def get_cf_areafile(self, project_info, model, variable=None):
         """ @brief Returns the path to the areacello file
                    used for ocean variables
             @param project_info Current namelist in dictionary format
             @param model One of the <model>-tags in the XML namelist file
+            @param variable Base variable replacing ${VARIABLE} in the 'dir'
+                            entry
             @return A string (areafile path)
 
             This function looks for the areafile of the ocean grid
         """
 
         # msd = model_section_dictionary
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
 
         areadir = os.path.join(msd["dir"],
                                msd["experiment"],
@@ -1097,18 +1174,20 @@ class CMIP5_ETHZ(CMIP5):
 
         return os.path.join(areadir, areafile)
 
-    def get_cf_porofile(self, project_info, model):
+    def get_cf_porofile(self, project_info, model, variable=None):
         """ @brief Returns the path to the mrsofc file used for
                    land variables
             @param project_info Current namelist in dictionary format
             @param model One of the <model>-tags in the XML namelist file
+            @param variable Base variable replacing ${VARIABLE} in the 'dir'
+                            entry
             @return A string (areafile path)
 
             This function looks for the porosity file
         """
 
         # msd = model_section_dictionary
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
 
         maskdir = os.path.join(msd["dir"],
                                msd["experiment"],
@@ -1122,18 +1201,20 @@ class CMIP5_ETHZ(CMIP5):
 
         return os.path.join(maskdir, maskfile)
 
-    def get_cf_lmaskfile(self, project_info, model):
+    def get_cf_lmaskfile(self, project_info, model, variable=None):
         """ @brief Returns the path to the sftlf file used for masking
                    land variables (regular grid)
             @param project_info Current namelist in dictionary format
             @param model One of the <model>-tags in the XML namelist file
+            @param variable Base variable replacing ${VARIABLE} in the 'dir'
+                            entry
             @return A string (maskfile path)
 
             This function looks for the areafile of the ocean grid
         """
 
         # msd = model_section_dictionary
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
 
         maskdir = os.path.join(msd["dir"],
                                msd["experiment"],
@@ -1147,18 +1228,20 @@ class CMIP5_ETHZ(CMIP5):
 
         return os.path.join(maskdir, maskfile)
 
-    def get_cf_omaskfile(self, project_info, model):
+    def get_cf_omaskfile(self, project_info, model, variable=None):
         """ @brief Returns the path to the sftof file used for masking
                    ocean variables (irregular grid)
             @param project_info Current namelist in dictionary format
             @param model One of the <model>-tags in the XML namelist file
+            @param variable Base variable replacing ${VARIABLE} in the 'dir'
+                            entry
             @return A string (maskfile path)
 
             This function looks for the areafile of the ocean grid
         """
 
         # msd = model_section_dictionary
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
 
         maskdir = os.path.join(msd["dir"],
                                msd["experiment"],
@@ -1197,6 +1280,7 @@ class MiKlip(Project):
         """
         self.basename = "MiKlip"
 
+    @memoized
     def get_dict_key(self, model, mip, exp):
         """ @brief Returns a unique key based on the model entries provided.
             @param model One of the <model>-tags in the XML namelist file
@@ -1254,7 +1338,7 @@ class MiKlip(Project):
             reformat routines
         """
         # msd = model_section_dictionary
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
         msd = self.rewrite_mip_exp(msd, mip, exp)
 
         if ('6hr' in msd["mip"]):
@@ -1282,7 +1366,8 @@ class MiKlip(Project):
                            msd["experiment"],
                            msd["ensemble"]]) + ".nc"
 
-        if (not os.path.isfile(os.path.join(indir, infile))):
+        if (not file_catalogue.isfile(project_info,
+                                      os.path.join(indir, infile))):
             infile = "_".join([variable,
                                msd["mip"],
                                msd["name"],
@@ -1291,16 +1376,18 @@ class MiKlip(Project):
 
         return indir, infile
 
-    def get_cf_areafile(self, project_info, model):
+    def get_cf_areafile(self, project_info, model, variable=None):
         """ @brief Returns the path to the areacello file
                    used for ocean variables
             @param project_info Current namelist in dictionary format
             @param model One of the <model>-tags in the XML namelist file
+            @param variable Base variable replacing ${VARIABLE} in the 'dir'
+                            entry
             @return A string (areafile path)
 
             This function looks for the areafile of the ocean grid
         """
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
 
         areadir = os.path.join(msd["dir"],
                                msd["name"],
@@ -1315,6 +1402,7 @@ class MiKlip(Project):
 
         return os.path.join(areadir, areafile)
 
+    @memoized
     def get_cf_outfile(self, project_info, model, field, variable, mip, exp):
         """ @brief Returns the output file used in the reformat routines
             @param variable Current variable
@@ -1379,7 +1467,7 @@ class MiKlip_baseline0(MiKlip):
             reformat routines
         """
         # msd = model_section_dictionary
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
         msd = self.rewrite_mip_exp(msd, mip, exp)
 
         if ('6hr' in msd["mip"]):
@@ -1420,7 +1508,8 @@ class MiKlip_baseline0(MiKlip):
                            msd["experiment"],
                            msd["ensemble"]]) + ".nc"
 
-        if (not os.path.isfile(os.path.join(indir, infile))):
+        if (not file_catalogue.isfile(project_info,
+                                      os.path.join(indir, infile))):
             infile = "_".join([variable,
                                msd["mip"],
                                msd["name"],
@@ -1429,17 +1518,19 @@ class MiKlip_baseline0(MiKlip):
 
         return indir, infile
 
-    def get_cf_areafile(self, project_info, model):
+    def get_cf_areafile(self, project_info, model, variable=None):
         """ @brief Returns the path to the areacello file
                    used for ocean variables
             @param project_info Current namelist in dictionary format
             @param model One of the <model>-tags in the XML namelist file
+            @param variable Base variable replacing ${VARIABLE} in the 'dir'
+                            entry
             @return A string (areafile path)
 
             This function looks for the areafile of the ocean grid
         """
         # msd = model_section_dictionary
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
 
         areafile = 'areacello_fx_'\
                    + msd["name"]\
@@ -1480,6 +1571,7 @@ class O3_Cionni(Project):
         """
         self.basename = "O3_Cionni"
 
+    @memoized
     def get_dict_key(self, model, mip, exp):
         """ @brief Returns a unique key based on the model entries provided.
             @parjam model One of the <model>-tags in the XML namelist file
@@ -1536,7 +1628,7 @@ class O3_Cionni(Project):
             reformat routines
         """
         # msd = model_section_dictionary
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
         msd = self.rewrite_mip_exp(msd, mip, exp)
 
         indir = msd["dir"]+ 'final_' + msd['experiment']
@@ -1546,7 +1638,8 @@ class O3_Cionni(Project):
         infile = '_'.join([variable,
                            msd['experiment'],]) + '.nc'
 
-        if (not os.path.isfile(os.path.join(indir, infile))):
+        if (not file_catalogue.isfile(project_info,
+                                      os.path.join(indir, infile))):
             infile = '_'.join(['Ozone_CMIP5_ACC_SPARC_*',
                                msd['experiment'],
                                field,
@@ -1554,6 +1647,7 @@ class O3_Cionni(Project):
 
         return indir, infile
 
+    @memoized
     def get_cf_outfile(self, project_info, model, field, variable, mip, exp):
         """ @brief Returns the output file used in the reformat routines
             @param variable Current variable
@@ -1599,6 +1693,7 @@ class CCMVal(Project):
                                  "end_year",
                                  "dir"]
 
+    @memoized
     def get_dict_key(self, model, mip, exp):
         """ @brief Returns a unique key based on the model entries provided.
             @param model One of the <model>-tags in the XML namelist file
@@ -1652,7 +1747,7 @@ class CCMVal(Project):
             reformat routines
         """
         # msd = model_section_dictionary
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
 
         indir = msd['dir']
 
@@ -1662,7 +1757,8 @@ class CCMVal(Project):
                            msd['ensemble'],
                            field,
                            variable]) + '.nc'
-        if (os.path.isfile(os.path.join(indir, infile))):
+        if (file_catalogue.isfile(project_info,
+                                  os.path.join(indir, infile))):
             return indir, infile
 
         # Try alternative variable names
@@ -1673,7 +1769,8 @@ class CCMVal(Project):
                                msd['ensemble'],
                                field,
                                altvar]) + '.nc'
-            if (os.path.isfile(os.path.join(indir, infile))):
+            if (file_catalogue.isfile(project_info,
+                                      os.path.join(indir, infile))):
                 info("  No input files found, trying with the alternative "
                      + "variable name " + altvar,
                      project_info["GLOBAL"]["verbosity"], 1)
@@ -1681,6 +1778,7 @@ class CCMVal(Project):
 
         raise exceptions.IOError(2, "No input files found in", indir)
 
+    @memoized
     def get_cf_outfile(self, project_info, model, field, variable, mip, exp):
         """ @brief Returns the path and output file used in reformat
             @param project_info Current namelist in dictionary format
@@ -1742,6 +1840,7 @@ class EMAC(CCMVal):
 
         self.basename = "EMAC"
 
+    @memoized
     def get_dict_key(self, model, mip, exp):
         """ @brief Returns a unique key based on the model entries provided.
             @param model One of the <model>-tags in the XML namelist file
@@ -1794,13 +1893,14 @@ class EMAC(CCMVal):
             reformat routines
         """
         # msd = model_section_dictionary
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
 
         indir = msd['dir']
 
         # reformat_EMAC requires only indir, return empty infile
         return indir, ""
 
+    @memoized
     def get_cf_outfile(self, project_info, model, field, variable, mip, exp):
         """ @brief Returns the path and output file used in reformat
             @param project_info Current namelist in dictionary format
@@ -1849,6 +1949,7 @@ class ECEARTH(CMIP5):
         """
         self.basename = "ECEARTH"
 
+    @memoized
     def get_dict_key(self, model, mip, exp):
         """ @brief Returns a unique key based on the model entries provided.
             @param model One of the <model>-tags in the XML namelist file
@@ -1905,7 +2006,7 @@ class ECEARTH(CMIP5):
         indata_root = self.get_data_root()
 
         # msd = model_section_dictionary
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
         msd = self.rewrite_mip_exp(msd, mip, exp)
 
         indir = os.path.join(indata_root,
@@ -1926,6 +2027,7 @@ class ECEARTH(CMIP5):
 
         return indir, infile
 
+    @memoized
     def get_cf_outfile(self, project_info, model, field, variable, mip, exp):
         """ @brief Returns the output file used in the reformat routines
             @param variable Current variable
@@ -2003,16 +2105,18 @@ class ECEARTH(CMIP5):
 
         return os.path.join(indata_root, lsmfile_path)
 
-    def get_cf_sections(self, model):
+    def get_cf_sections(self, model, variable=None):
         """ @brief Return the sections from the <model> tag needed in reformat
             @param model One of the <model>-tags in the XML namelist file
+            @param variable Base variable replacing ${VARIABLE} in the 'dir'
+                            entry
             @return Six strings
 
             This function returns the sections from the <model> tag that
             are needed in the 'reformat'-routine.
         """
         # msd = model_section_dictionary
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
 
         # no support for ensemble in EC-Earth, yet
         return msd['project'],\
@@ -2042,6 +2146,7 @@ class GFDL(Project):
 
         self.basename = "GFDL"
 
+    @memoized
     def get_dict_key(self, model, mip, exp):
         """ @brief Returns a unique key based on the model entries provided.
             @param model One of the <model>-tags in the XML namelist file
@@ -2097,13 +2202,14 @@ class GFDL(Project):
             reformat routines
         """
         # msd = model_section_dictionary
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
 
         indir = msd['dir']
 
         # reformat_GFDL requires only indir, return empty infile
         return indir, ""
 
+    @memoized
     def get_cf_outfile(self, project_info, model, field, variable, mip, exp):
         """ @brief Returns the path and output file used in reformat
             @param project_info Current namelist in dictionary format
@@ -2152,6 +2258,7 @@ class GO(CCMVal):
         self.add_specifier['experiment'] = 'case_name'
         self.basename = "GO"
 
+    @memoized
     def get_dict_key(self, model, mip, exp):
         """ @brief Returns a unique key based on the model entries provided.
             @param model One of the <model>-tags in the XML namelist file
@@ -2174,16 +2281,18 @@ class GO(CCMVal):
                              msd['end_year']])
         return dict_key
 
-    def get_cf_sections(self, model):
+    def get_cf_sections(self, model, variable=None):
         """ @brief Return the sections from the <model> tag needed in reformat
             @param model One of the <model>-tags in the XML namelist file
+            @param variable Base variable replacing ${VARIABLE} in the 'dir'
+                            entry
             @return Six strings
 
             This function returns the sections from the <model> tag that
             are needed in the 'reformat'-routine.
         """
         # msd = model_section_dictionary
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
         return msd['project'],\
             msd['name'],\
             msd['resolution'],\
@@ -2222,7 +2331,7 @@ class GO(CCMVal):
             reformat routines
         """
         # msd = model_section_dictionary
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
         msd = self.rewrite_mip_exp(msd, mip, exp)
 
         indata_root = self.get_data_root()
@@ -2245,7 +2354,8 @@ class GO(CCMVal):
 
         info("file = " + infile, 1, 1)
 
-        if (not os.path.isfile(os.path.join(indir, infile))):
+        if (not file_catalogue.isfile(project_info,
+                                      os.path.join(indir, infile))):
             infile = '_'.join([msd['project'],
                                msd['case_name'],
                                msd['name'],
@@ -2253,11 +2363,13 @@ class GO(CCMVal):
                                field,
                                variable]) + '*.nc'
 
-        if (len(glob.glob(os.path.join(indir, infile))) == 0):
+        if (len(file_catalogue.glob(project_info,
+                                    os.path.join(indir, infile))) == 0):
             raise exceptions.IOError(2, "No input files found in", indir)
 
         return indir, infile
 
+    @memoized
     def get_cf_outfile(self, project_info, model, field, variable, mip, exp):
         """ @brief Returns the path + output file used in the reformat routines
             @param project_info Current namelist in dictionary format
@@ -2285,10 +2397,12 @@ class GO(CCMVal):
 
         return os.path.join(outdir, outfile)
 
-    def get_cf_areafile(self, project_info, model):
+    def get_cf_areafile(self, project_info, model, variable=None):
         """ @brief Returns the path to the areacello file
             @param project_info Current namelist in dictionary format
             @param model One of the <model>-tags in the XML namelist file
+            @param variable Base variable replacing ${VARIABLE} in the 'dir'
+                            entry
             @return A strings (areafile path)
             This function looks for the areafile of the ocean grid
         """
@@ -2313,11 +2427,13 @@ class GO_gridfile(GO):
 
  #       self.add_specifier['case_name'] = 'case_name'
 
-    def get_cf_areafile(self, project_info, model):
+    def get_cf_areafile(self, project_info, model, variable=None):
         """ @brief Returns the path to the areacello file
                    used for ocean variables
             @param project_info Current namelist in dictionary format
             @param model One of the <model>-tags in the XML namelist file
+            @param variable Base variable replacing ${VARIABLE} in the 'dir'
+                            entry
             @return A string (areafile path)
 
             This function looks for the areafile of the ocean grid
@@ -2382,7 +2498,7 @@ class JSBACH(Project):
         """
 
         # msd = model_section_dictionary
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
         #~ msd = self.rewrite_mip_exp(msd, mip, exp)
 
         indir = msd["dir"]
@@ -2396,6 +2512,7 @@ class JSBACH(Project):
 
         return indir, infile
 
+    @memoized
     def get_cf_outfile(self, project_info, model, field, variable, mip, exp):
         """ @brief Returns the output file used in the reformat routines
             @param variable Current variable
@@ -2428,14 +2545,14 @@ class JSBACH(Project):
 
         return outfile
 
-    def get_cf_sections(self, model):
+    def get_cf_sections(self, model, variable=None):
         """
         overwrites same function of master class
         """
         #~ project, name, ensemble, start_year, end_year, dir\
             #~ = currProject.get_cf_sections(model)
 
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
 
         project = msd["project"]
         name = None
@@ -2449,6 +2566,7 @@ class JSBACH(Project):
     def get_figure_file_names(self, project_info, model, mip, exp):
         return 'dummy_figure_filename'
 
+    @memoized
     def get_dict_key(self, model, mip, exp):
         return "dummy_key"
 
@@ -2471,6 +2589,7 @@ class CCMI(Project):
         """
         self.basename = "CCMI"
 
+    @memoized
     def get_dict_key(self, model, mip, exp):
         """ @brief Returns a unique key based on the model entries provided.
             @param model One of the <model>-tags in the XML namelist file
@@ -2529,7 +2648,7 @@ class CCMI(Project):
             reformat routines
         """
         # msd = model_section_dictionary
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
         msd = self.rewrite_mip_exp(msd, mip, exp)
 
         indir = msd["dir"]
@@ -2542,7 +2661,8 @@ class CCMI(Project):
                            msd['experiment'],
                            msd['ensemble']]) + '.nc'
 
-        if (not os.path.isfile(os.path.join(indir, infile))):
+        if (not file_catalogue.isfile(project_info,
+                                      os.path.join(indir, infile))):
             infile = '_'.join([variable,
                                msd['mip'],
                                msd['name'],
@@ -2551,16 +2671,18 @@ class CCMI(Project):
 
         return indir, infile
 
-    def get_cf_areafile(self, project_info, model):
+    def get_cf_areafile(self, project_info, model, variable=None):
         """ @brief Returns the path to the areacello file
                    used for ocean variables
             @param project_info Current namelist in dictionary format
             @param model One of the <model>-tags in the XML namelist file
+            @param variable Base variable replacing ${VARIABLE} in the 'dir'
+                            entry
             @return A string (areafile path)
 
             This function looks for the areafile of the ocean grid
         """
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
 
         areadir = msd["dir"]
 
@@ -2569,6 +2691,7 @@ class CCMI(Project):
 
         return os.path.join(areadir, areafile)
 
+    @memoized
     def get_cf_outfile(self, project_info, model, field, variable, mip, exp):
         """ @brief Returns the output file used in the reformat routines
             @param variable Current variable
@@ -2611,11 +2734,13 @@ class CCMI_gridfile(CCMI):
 
         self.add_specifier['case_name'] = 'experiment'
 
-    def get_cf_areafile(self, project_info, model):
+    def get_cf_areafile(self, project_info, model, variable=None):
         """ @brief Returns the path to the areacello file
                    used for ocean variables
             @param project_info Current namelist in dictionary format
             @param model One of the <model>-tags in the XML namelist file
+            @param variable Base variable replacing ${VARIABLE} in the 'dir'
+                            entry
             @return A string (areafile path)
 
             This function looks for the areafile of the ocean grid
@@ -2644,7 +2769,7 @@ class CCMI_DLR(CCMI):
         """
 
         # msd = model_section_dictionary
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
         msd = self.rewrite_mip_exp(msd, mip, exp)
 
         indir = os.path.join(msd["dir"],
@@ -2660,7 +2785,8 @@ class CCMI_DLR(CCMI):
                            msd["experiment"],
                            msd["ensemble"]]) + ".nc"
 
-        if (not os.path.isfile(os.path.join(indir, infile))):
+        if (not file_catalogue.isfile(project_info,
+                                      os.path.join(indir, infile))):
             infile = "_".join([variable,
                                msd["mip"],
                                msd["name"],
@@ -2669,18 +2795,20 @@ class CCMI_DLR(CCMI):
 
         return indir, infile
 
-    def get_cf_areafile(self, project_info, model):
+    def get_cf_areafile(self, project_info, model, variable=None):
         """ @brief Returns the path to the areacello file
                    used for ocean variables
             @param project_info Current namelist in dictionary format
             @param model One of the <model>-tags in the XML namelist file
+            @param variable Base variable replacing ${VARIABLE} in the 'dir'
+                            entry
             @return A string (areafile path)
 
             This function looks for the areafile of the ocean grid
         """
 
         # msd = model_section_dictionary
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
 
         areadir = os.path.join(msd["dir"],
                                msd["experiment"],
@@ -2730,7 +2858,7 @@ class OneFile(Project):
         """
 
         # msd = model_section_dictionary
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
         #~ msd = self.rewrite_mip_exp(msd, mip, exp)
 
         indir = msd["dir"]
@@ -2741,6 +2869,7 @@ class OneFile(Project):
 
         return indir, infile
 
+    @memoized
     def get_cf_outfile(self, project_info, model, field, variable, mip, exp):
         """ @brief Returns the output file used in the reformat routines
             @param variable Current variable
@@ -2756,7 +2885,7 @@ class OneFile(Project):
         """
 
         # msd = model_section_dictionary
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
 
         # Overide some model lines with settings from the variable attributes
         #~ msd = self.rewrite_mip_exp(msd, mip, exp)
@@ -2778,14 +2907,14 @@ class OneFile(Project):
         infile = msd['infile']
         return indir + infile
 
-    def get_cf_sections(self, model):
+    def get_cf_sections(self, model, variable=None):
         """
         overwrites same function of master class
         """
         #~ project, name, ensemble, start_year, end_year, dir\
             #~ = currProject.get_cf_sections(model)
 
-        msd = self.get_model_sections(model)
+        msd = self.get_model_sections(model, variable)
 
         project = msd["project"]
         name = None
@@ -2799,32 +2928,38 @@ class OneFile(Project):
     def get_figure_file_names(self, project_info, model, mip, exp):
         return 'dummy_figure_filename'
 
+    @memoized
     def get_dict_key(self, model, mip, exp):
         return "dummy_key"
 
 
+# Project instances of this process (project name -> instance)
+_projects = {}
+
+
+def get_project(name):
+    """ @brief The (shared) instance of a project class
+        @param name Name of the project class, i.e., the first entry of a
+                    <model>-tag line
+
+        The instances keep the parsed <model>-tags and the memoized file
+        names, hence they are shared by all callers of the process.
+    """
+    try:
+        return _projects[name]
+    except KeyError:
+        project = globals()[name]()
+        _projects[name] = project
+        return project
+
+
 def find_varname(var):
     """
     @brief Read and return alternative names for the given var
     @param var Variable name according to the CMOR standard
     """
 
-    fn = open("./reformat_scripts/recognized_vars.dat", "r")
-
-    lines = []
-    for ln in fn:
-        lines.append(ln.strip())
-
-    ii = 0
-    while ii < len(lines):
-        if ('std_name' in lines[ii] and var in lines[ii] and not '#' in lines[ii]):
-            altern = lines[ii + 1]
-            altern = altern.replace(" ", "")
-            altern = altern.split("=")[1].split(",")
-            return altern
-        ii += 1
-
-    return []
+    return variable_registry.get_registry().get_alternative_names(var)
 
 
 def add_model(project_info, models_to_add):
@@ -2851,13 +2986,15 @@ def write_data_interface(executable, project_info):
     """ @brief Write Python data structures to target script format interface
         @param executable String pointing to the script/binary to execute
         @param project_info Current namelist in dictionary format
+        @return The job manifest (manifest.JobManifest) of the launch
 
-        Data structures in Python are rewritten to the interface folder in
-        a format appropriate for the target script/binary
+        Data structures in Python are rewritten to the interface folder of
+        a private launch directory in a format appropriate for the target
+        script/binary
     """
     suffix = os.path.splitext(executable)[1][1:]
     currInterface = vars(data_interface)[suffix.title() + '_data_interface'](project_info)
-    currInterface.write_data_to_interface()
+    return currInterface.write_data_to_interface(executable)
 
 
 def run_executable(string_to_execute,
@@ -2873,17 +3010,40 @@ def run_executable(string_to_execute,
                                crash on warnings
 
         Check the type of script/binary from the executable string suffix and
-        execute the script/binary properly.
+        execute the script/binary properly. The launch directory is removed
+        after a successful execution (except for files the script wrote
+        there) and kept for inspection otherwise. The resources used and the
+        timeline are recorded in the run directory (see resource_report.py
+        and tracing.py).
     """
-    
+    job_manifest = None
     if write_di:
-	write_data_interface(string_to_execute, project_info)
+        job_manifest = write_data_interface(string_to_execute, project_info)
 
     suffix = os.path.splitext(string_to_execute)[1][1:]
     currLauncher = vars(launchers)[suffix + '_launcher']()
     if launcher_arguments is not None:
         currLauncher.arguments = launcher_arguments
-    currLauncher.execute(string_to_execute,
-                         project_info,
-                         verbosity,
-                         exit_on_warning)
+    currLauncher.manifest = job_manifest
+    try:
+        run_dir = project_info.get('RUNTIME', {}).get('run_dir')
+        with tracing.span(run_dir, os.path.basename(string_to_execute),
+                          "launch"), \
+                resource_report.measure(
+                    run_dir, os.path.basename(string_to_execute),
+                    **resource_report.labels_from(project_info)):
+            currLauncher.execute(string_to_execute,
+                                 project_info,
+                                 verbosity,
+                                 exit_on_warning)
+    except:
+        if job_manifest is not None:
+            info("Launch directory kept for inspection: "
+                 + job_manifest.launch_dir, verbosity, 0)
+        raise
+    if job_manifest is not None:
+        kept = job_manifest.remove_launch_dir()
+        if kept:
+            info("Launch directory kept, " + ", ".join(kept)
+                 + " written there by " + string_to_execute + ": "
+                 + job_manifest.launch_dir, verbosity, 0)
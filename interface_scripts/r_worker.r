@@ -0,0 +1,119 @@
+# #############################################################################
+# r_worker.r
+# #############################################################################
+# Description
+#    Persistent R session of the r_launcher (see launchers.py, launcher
+#    argument 'persistent_session'). Executes R diagnostics on request, such
+#    that R and the packages loaded by the diagnostics (ncdf4, ...) are only
+#    started/loaded once.
+#
+#    Requests are read from stdin, one field per line:
+#        call <token>
+#        cwd <working directory>
+#        env <NAME>=<VALUE>        (any number of lines)
+#        script <R script>         (executes the request)
+#    Each script is sourced into a cleared global environment, with the
+#    default options, the environment of the worker at its start (R_HOME,
+#    R_LIBS, ... set by Rscript) updated by the given environment variables
+#    and the given working directory. Errors and warnings are reported like Rscript does. After
+#    the script, a line "<token> <status>" is written (status 0: success,
+#    1: error).
+# #############################################################################
+
+local({
+    default_options <- options()
+    startup_env <- unclass(Sys.getenv())
+    input <- file("stdin")
+    open(input)
+
+    set_environment <- function(env) {
+        ## Back to the startup environment, then the one of the request
+        Sys.unsetenv(setdiff(names(Sys.getenv()), names(startup_env)))
+        do.call(Sys.setenv, as.list(startup_env))
+        if (length(env) == 0) {
+            return(invisible())
+        }
+        env_names <- sub("=.*$", "", env)
+        env_values <- substring(env, nchar(env_names) + 2)
+        do.call(Sys.setenv, as.list(setNames(env_values, env_names)))
+    }
+
+    print_warnings <- function(collected) {
+        if (length(collected) == 0) {
+            return(invisible())
+        }
+        if (length(collected) == 1) {
+            cat("Warning message:\n", file = stderr())
+        } else {
+            cat("Warning messages:\n", file = stderr())
+        }
+        for (w in collected) {
+            call <- conditionCall(w)
+            if (is.null(call)) {
+                cat(conditionMessage(w), "\n", sep = "", file = stderr())
+            } else {
+                cat("In ", deparse(call)[1], " : ", conditionMessage(w), "\n",
+                    sep = "", file = stderr())
+            }
+        }
+    }
+
+    run_script <- function(script, request) {
+        rm(list = ls(globalenv(), all.names = TRUE), envir = globalenv())
+        options(default_options)
+        set_environment(request$env)
+        if (!is.null(request$cwd)) {
+            setwd(request$cwd)
+        }
+
+        ## Deferred warnings (warn = 0) are printed after the script
+        collected <- list()
+        status <- tryCatch({
+            withCallingHandlers(
+                source(script, echo = FALSE),
+                warning = function(w) {
+                    if (getOption("warn") == 0) {
+                        collected[[length(collected) + 1]] <<- w
+                        invokeRestart("muffleWarning")
+                    }
+                })
+            0
+        }, error = function(e) {
+            flush(stdout())
+            call <- conditionCall(e)
+            if (is.null(call)) {
+                cat("Error: ", conditionMessage(e), "\n", sep = "",
+                    file = stderr())
+            } else {
+                cat("Error in ", deparse(call)[1], " : ", conditionMessage(e),
+                    "\n", sep = "", file = stderr())
+            }
+            1
+        })
+        flush(stdout())
+        print_warnings(collected)
+        flush(stderr())
+        status
+    }
+
+    request <- list()
+    repeat {
+        line <- readLines(input, n = 1)
+        if (length(line) == 0) {
+            break
+        }
+        key <- sub(" .*$", "", line)
+        value <- substring(line, nchar(key) + 2)
+        if (key == "call") {
+            request <- list(token = value, cwd = NULL, env = character(0))
+        } else if (key == "cwd") {
+            request$cwd <- value
+        } else if (key == "env") {
+            request$env <- c(request$env, value)
+        } else if (key == "script") {
+            status <- run_script(value, request)
+            cat("\n", request$token, " ", status, "\n", sep = "")
+            flush(stdout())
+        }
+    }
+})
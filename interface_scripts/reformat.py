@@ -29,10 +29,17 @@
 #
 
 from auxiliary import info
+import cmor_check
+import copy
 import exceptions
+import file_catalogue
+import glob
 import os
 import pdb
 import projects
+import reformat_cache
+import resource_report
+import tracing
 
 
 def infile(currProject, project_info, variable, model):
@@ -53,136 +60,378 @@ def infile(currProject, project_info, variable, model):
     return(os.path.join(indir, infile))
 
 
-def cmor_reformat(currProject, project_info, variable, model):
-    model_name = currProject.get_model_name(model)
-    project_name = currProject.get_project_name(model)
-    project_basename = currProject.get_project_basename()
-    project_info['RUNTIME']['model'] = model_name
-    project_info['RUNTIME']['project'] = project_name
-    project_info['RUNTIME']['project_basename'] = project_basename
-    verbosity = project_info["GLOBAL"]["verbosity"]
-    exit_on_warning = project_info['GLOBAL'].get('exit_on_warning', False)
+def input_files(project_info, infile_path):
+    """ @brief The input files of an 'infile_path' entry (a path, a
+               wildcard path or a space separated list of paths)
+    """
+    infiles = []
+    for pattern in infile_path.split():
+        infiles.extend(file_catalogue.glob(project_info, pattern))
+    return infiles
 
-    # Variable put in environment to be used for the (optional)
-    # wildcard syntax in the model path, ".../${VARIABLE}/..."
-    # in the namelist
-    os.environ['__ESMValTool_base_var'] = variable.var
 
-    # Build input and output file names
-    indir, infile = currProject.get_cf_infile(project_info,
-                                              model,
-                                              variable.fld,
-                                              variable.var,
-                                              variable.mip,
-                                              variable.exp)
+class ReformatJob(object):
+    """ @brief Self-contained description of one check/reformat job
+
+        A job holds everything needed to reformat one base variable of one
+        model: the reformat script, its private 'TEMPORARY' section and the
+        'RUNTIME' entries it relies on. Jobs do not touch the shared
+        project_info-dictionary or the environment, hence they can be
+        collected upfront, de-duplicated and run in any order or in
+        parallel worker processes.
+    """
+    def __init__(self, currProject, project_info, variable, model):
+        """ @param currProject Project instance of the model
+            @param project_info Current namelist in dictionary format
+            @param variable Base variable (diagdef.Var instance)
+            @param model One of the <model>-tags in the XML namelist file
+        """
+        self.model = model
+        self.variable = variable
+        self.verbosity = project_info["GLOBAL"]["verbosity"]
+
+        self.runtime = {}
+        self.runtime['model'] = currProject.get_model_name(model)
+        self.runtime['project'] = currProject.get_project_name(model)
+        self.runtime['project_basename'] = currProject.get_project_basename()
+
+        self.reformat_script = self.get_reformat_script(currProject, model)
+        self.temporary = self.get_temporary(currProject, project_info,
+                                            variable, model)
+        self.outfile = self.temporary['outfile_fullpath']
+        self.cache_dir = project_info['GLOBAL'].get(
+            'reformat_cache_dir',
+            os.path.join(project_info['GLOBAL']['climo_dir'],
+                         ".reformat_cache"))
+
+    def get_temporary(self, currProject, project_info, variable, model):
+        """ @brief Build the 'TEMPORARY' section used by the reformat script
+        """
+        verbosity = self.verbosity
+
+        # Build input and output file names
+        indir, infile = currProject.get_cf_infile(project_info,
+                                                  model,
+                                                  variable.fld,
+                                                  variable.var,
+                                                  variable.mip,
+                                                  variable.exp)
+
+        fullpath = currProject.get_cf_fullpath(project_info,
+                                               model,
+                                               variable.fld,
+                                               variable.var,
+                                               variable.mip,
+                                               variable.exp)
+
+        # Area file name for ocean grids
+        areafile_path = currProject.get_cf_areafile(project_info, model,
+                                                    variable.var)
+
+        # Land-mask file name for land variables
+        lmaskfile_path = currProject.get_cf_lmaskfile(project_info, model,
+                                                      variable.var)
+        omaskfile_path = currProject.get_cf_omaskfile(project_info, model,
+                                                      variable.var)
+
+        # Porosity file name for land variables
+        porofile_path = currProject.get_cf_porofile(project_info, model,
+                                                    variable.var)
+
+        # Additional grid file names for ocean grids, if available (ECEARTH)
+        hgridfile_path = False
+        zgridfile_path = False
+        lsmfile_path = False
+        if hasattr(currProject, "get_cf_hgridfile"):
+            hgridfile_path = currProject.get_cf_hgridfile(project_info, model)
+        if hasattr(currProject, "get_cf_zgridfile"):
+            zgridfile_path = currProject.get_cf_zgridfile(project_info, model)
+        if hasattr(currProject, "get_cf_lsmfile"):
+            lsmfile_path = \
+                currProject.get_cf_lsmfile(project_info, model, variable.fld)
+
+        # General fx file name entry
+        fx_file_path = False
+        if hasattr(currProject, "get_cf_fx_file"):
+            fx_file_path = currProject.get_cf_fx_file(project_info, model)
+
+        project, name, ensemble, start_year, end_year, dir\
+            = currProject.get_cf_sections(model, variable.var)
+        info("project is " + project, verbosity, required_verbosity=4)
+        info("ensemble is " + ensemble, verbosity, required_verbosity=4)
+        info("dir is " + dir, verbosity, required_verbosity=4)
 
-    fullpath = currProject.get_cf_fullpath(project_info,
-                                           model,
-                                           variable.fld,
-                                           variable.var,
-                                           variable.mip,
-                                           variable.exp)
-#    print "indir = %s" % indir
-#    print "infile = %s" % infile
-#    print "fullpath = %s" % fullpath
-
-    if (not os.path.isdir(os.path.dirname(fullpath))):
-        os.makedirs(os.path.dirname(fullpath))
-
-    # Area file name for ocean grids
-    areafile_path = currProject.get_cf_areafile(project_info, model)
-
-    # Land-mask file name for land variables
-    lmaskfile_path = currProject.get_cf_lmaskfile(project_info, model)
-    omaskfile_path = currProject.get_cf_omaskfile(project_info, model)
-
-    # Porosity file name for land variables
-    porofile_path = currProject.get_cf_porofile(project_info, model)
-
-    # Additional grid file names for ocean grids, if available (ECEARTH)
-    hgridfile_path = False
-    zgridfile_path = False
-    lsmfile_path = False
-    if hasattr(currProject, "get_cf_hgridfile"):
-        hgridfile_path = currProject.get_cf_hgridfile(project_info, model)
-    if hasattr(currProject, "get_cf_zgridfile"):
-        zgridfile_path = currProject.get_cf_zgridfile(project_info, model)
-    if hasattr(currProject, "get_cf_lsmfile"):
-        lsmfile_path = \
-            currProject.get_cf_lsmfile(project_info, model, variable.fld)
-
-    # General fx file name entry
-    fx_file_path = False
-    if hasattr(currProject, "get_cf_fx_file"):
-        fx_file_path = currProject.get_cf_fx_file(project_info, model)
-
-    project, name, ensemble, start_year, end_year, dir\
-        = currProject.get_cf_sections(model)
-    info("project is " + project, verbosity, required_verbosity=4)
-    info("ensemble is " + ensemble, verbosity, required_verbosity=4)
-    info("dir is " + dir, verbosity, required_verbosity=4)
-
-    # Check if the current project has a specific reformat routine,
-    # otherwise use default
-    if (os.path.isdir("reformat_scripts/" + project)):
-        which_reformat = project
-    else:
-        which_reformat = 'default'
-
-    reformat_script = os.path.join("reformat_scripts",
-                                   which_reformat,
-                                   "reformat_" + which_reformat + "_main.ncl")
-
-    # Set enviroment variables
-    project_info['TEMPORARY'] = {}
-    project_info['TEMPORARY']['indir_path'] = indir
-    project_info['TEMPORARY']['outfile_fullpath'] = fullpath
-    project_info['TEMPORARY']['infile_path'] = os.path.join(indir, infile)
-    project_info['TEMPORARY']['areafile_path'] = areafile_path
-    project_info['TEMPORARY']['lmaskfile_path'] = lmaskfile_path
-    project_info['TEMPORARY']['omaskfile_path'] = omaskfile_path
-    project_info['TEMPORARY']['porofile_path'] = porofile_path
-    project_info['TEMPORARY']['start_year'] = start_year
-    project_info['TEMPORARY']['end_year'] = end_year
-    project_info['TEMPORARY']['ensemble'] = ensemble
-    project_info['TEMPORARY']['variable'] = variable.var
-    project_info['TEMPORARY']['field'] = variable.fld
-
-    # FX file path
-    if fx_file_path:
-        project_info['TEMPORARY']['fx_file_path'] = fx_file_path
-
-    # Special cases
-    if 'realm' in currProject.get_model_sections(model):
-        project_info['TEMPORARY']['realm'] = \
-            currProject.get_model_sections(model)["realm"]
-    if 'shift_year' in currProject.get_model_sections(model):
-        project_info['TEMPORARY']['shift_year'] = \
-            currProject.get_model_sections(model)["shift_year"]
-    if 'case_name' in currProject.get_model_sections(model):
-        project_info['TEMPORARY']['case_name'] = \
-            currProject.get_model_sections(model)["case_name"]
-
-    if hgridfile_path and zgridfile_path:
-        project_info['TEMPORARY']['hgridfile_path'] = hgridfile_path
-        project_info['TEMPORARY']['zgridfile_path'] = zgridfile_path
-    if lsmfile_path:
-        project_info['TEMPORARY']['lsmfile_path'] = lsmfile_path
-
-    # Execute the ncl reformat script
-    if ((not os.path.isfile(project_info['TEMPORARY']['outfile_fullpath']))
-            or project_info['GLOBAL']['force_processing']):
-
-        info("  Calling " + reformat_script + " to check/reformat model data",
+        temporary = {}
+        temporary['indir_path'] = indir
+        temporary['outfile_fullpath'] = fullpath
+        temporary['infile_path'] = self.get_infile_path(project_info,
+                                                        indir, infile,
+                                                        start_year, end_year)
+        temporary['areafile_path'] = areafile_path
+        temporary['lmaskfile_path'] = lmaskfile_path
+        temporary['omaskfile_path'] = omaskfile_path
+        temporary['porofile_path'] = porofile_path
+        temporary['start_year'] = start_year
+        temporary['end_year'] = end_year
+        temporary['ensemble'] = ensemble
+        temporary['variable'] = variable.var
+        temporary['field'] = variable.fld
+
+        # FX file path
+        if fx_file_path:
+            temporary['fx_file_path'] = fx_file_path
+
+        # Special cases
+        model_sections = currProject.get_model_sections(model)
+        for key in ['realm', 'shift_year', 'case_name']:
+            if key in model_sections:
+                temporary[key] = model_sections[key]
+
+        if hgridfile_path and zgridfile_path:
+            temporary['hgridfile_path'] = hgridfile_path
+            temporary['zgridfile_path'] = zgridfile_path
+        if lsmfile_path:
+            temporary['lsmfile_path'] = lsmfile_path
+        return temporary
+
+    def get_infile_path(self, project_info, indir, infile, start_year,
+                        end_year):
+        """ @brief The input file(s) passed to the reformat script
+            @return The path of the input file, a wildcard path or a space
+                    separated list of the files needed for the time range
+
+            For the default reformat, a wildcard path is resolved to the
+            files covering start_year to end_year (see
+            file_catalogue.select_years), such that the files outside the
+            time range are not read.
+        """
+        infile_path = os.path.join(indir, infile)
+        if os.path.basename(os.path.dirname(self.reformat_script)) \
+                != "default" or not glob.has_magic(infile):
+            return infile_path
+        try:
+            start_year, end_year = int(start_year), int(end_year)
+        except ValueError:
+            return infile_path
+        if start_year == 0 and end_year == 0:
+            return infile_path
+        infiles = file_catalogue.select_years(project_info, infile_path,
+                                              start_year, end_year)
+        if infiles is None:
+            return infile_path
+        info("  Selected " + str(len(infiles)) + " input file(s) for "
+             + str(start_year) + "-" + str(end_year), self.verbosity,
+             required_verbosity=2)
+        return " ".join(infiles)
+
+    def get_reformat_script(self, currProject, model):
+        """ @brief Check if the current project has a specific reformat
+                   routine, otherwise use default
+        """
+        project = currProject.get_cf_sections(model)[0]
+        if (os.path.isdir("reformat_scripts/" + project)):
+            which_reformat = project
+        else:
+            which_reformat = 'default'
+
+        return os.path.join("reformat_scripts",
+                            which_reformat,
+                            "reformat_" + which_reformat + "_main.ncl")
+
+    def get_key(self):
+        """ @brief Jobs writing the same output file are identical
+        """
+        return self.outfile
+
+    def get_scripts(self):
+        """ @brief The scripts (and model fixes) the reformatted file
+                   depends on
+        """
+        script_dir = os.path.dirname(self.reformat_script)
+        fix_dir = os.path.join("reformat_scripts", "fixes")
+        which_reformat = os.path.basename(script_dir)
+        scripts = glob.glob(os.path.join(script_dir, "*.ncl"))
+        scripts += [os.path.join("reformat_scripts", "constants.ncl"),
+                    os.path.join("reformat_scripts", "recognized_units.dat"),
+                    os.path.join("reformat_scripts", "recognized_vars.dat"),
+                    os.path.join("interface_scripts", "auxiliary.ncl"),
+                    os.path.join(fix_dir, which_reformat + "_default.ncl"),
+                    os.path.join(fix_dir,
+                                 self.runtime['project_basename'] + "_"
+                                 + self.runtime['model'] + "_fix.ncl")]
+        return scripts
+
+    def get_provenance(self):
+        """ @brief Everything the reformatted file depends on
+            @return A JSON representable dictionary
+
+            Input files (including area/mask/grid files) are identified by
+            name, size and mtime, scripts and fixes by their content. The
+            location of the output file is not part of the provenance.
+        """
+        inputs = {}
+        settings = {}
+        for key, value in self.temporary.iteritems():
+            if key in ['outfile_fullpath', 'indir_path']:
+                continue
+            if key.endswith('_path'):
+                if value:
+                    inputs[key] = reformat_cache.input_stamps(value)
+            else:
+                settings[key] = value
+        settings.update(self.runtime)
+        settings['mip'] = self.variable.mip
+        settings['exp'] = self.variable.exp
+        settings['outfile'] = os.path.basename(self.outfile)
+        settings['reformat_script'] = self.reformat_script
+        return {'inputs': inputs,
+                'settings': settings,
+                'scripts': reformat_cache.script_digests(self.get_scripts())}
+
+    def get_job_info(self, project_info):
+        """ @brief Private copy of project_info for this job
+        """
+        job_info = copy.copy(project_info)
+        job_info['RUNTIME'] = dict(project_info['RUNTIME'])
+        job_info['RUNTIME'].update(self.runtime)
+        job_info['TEMPORARY'] = dict(self.temporary)
+        return job_info
+
+    def link_compliant_input(self, project_info):
+        """ @brief Link the input file as reformatted file if it is CMOR
+                   compliant already (see cmor_check.py)
+            @param project_info Current namelist in dictionary format
+            @return True if the input file was linked
+
+            The fast path is off unless the 'reformat_fast_path' entry of
+            the GLOBAL section is True: only files written by the default
+            reformat itself pass the check, CMIP5 input files never do
+            (see cmor_check.py).
+        """
+        verbosity = self.verbosity
+        if not project_info['GLOBAL'].get('reformat_fast_path', False):
+            return False
+        infiles = input_files(project_info, self.temporary['infile_path'])
+        problem = cmor_check.check_job(self.reformat_script, self.runtime,
+                                       self.temporary, infiles)
+        if problem is None:
+            problem = cmor_check.check_file(infiles[0],
+                                            self.variable.var,
+                                            self.variable.fld,
+                                            self.temporary['start_year'],
+                                            self.temporary['end_year'])
+        if problem is not None:
+            info("  Input needs reformatting: " + problem, verbosity,
+                 required_verbosity=2)
+            return False
+        try:
+            cmor_check.link(infiles[0], self.outfile)
+        except OSError as exc:
+            info("  Cannot link " + infiles[0] + " (" + str(exc) + ")",
+                 verbosity, required_verbosity=1)
+            return False
+        info("  Input file is CMOR compliant, linked " + infiles[0],
+             verbosity, required_verbosity=1)
+        return True
+
+    def run(self, project_info):
+        """ @brief Execute the reformat script (if needed)
+            @param project_info Current namelist in dictionary format
+
+            The resources used (including a cache lookup only) and the
+            timeline are recorded in the run directory (see
+            resource_report.py and tracing.py).
+        """
+        run_dir = project_info.get('RUNTIME', {}).get('run_dir')
+        with tracing.span(run_dir,
+                          "cmor_reformat " + self.runtime['model'] + " "
+                          + self.variable.var, "reformat"), \
+                resource_report.measure(run_dir, "cmor_reformat",
+                                        model=self.runtime['model'],
+                                        variable=self.variable.var):
+            self._run(project_info)
+
+    def _run(self, project_info):
+        verbosity = self.verbosity
+        exit_on_warning = project_info['GLOBAL'].get('exit_on_warning', False)
+
+        if (not os.path.isdir(os.path.dirname(self.outfile))):
+            try:
+                os.makedirs(os.path.dirname(self.outfile))
+            except OSError:
+                # Created concurrently by another job
+                if not os.path.isdir(os.path.dirname(self.outfile)):
+                    raise
+
+        # Reuse the reformatted file only if it was produced from the
+        # same inputs, scripts and fixes, either in place or from the cache
+        cache = reformat_cache.ReformatCache(self.cache_dir)
+        provenance = self.get_provenance()
+        key = reformat_cache.provenance_key(provenance)
+        force_processing = project_info['GLOBAL']['force_processing']
+        if not force_processing and cache.is_current(self.outfile, key):
+            info("  Reformatted file is up to date", verbosity,
+                 required_verbosity=2)
+            return
+        if not force_processing and cache.adopt(self.outfile, key,
+                                                provenance):
+            info("  Recorded provenance of existing reformatted file "
+                 + self.outfile, verbosity, required_verbosity=1)
+            return
+        if not force_processing and cache.fetch(key, self.outfile, provenance):
+            info("  Reusing cached reformatted file " + key, verbosity,
+                 required_verbosity=1)
+            return
+
+        # Link the input file if it is CMOR compliant already, otherwise
+        # execute the ncl reformat script
+        cache.invalidate(self.outfile)
+        if self.link_compliant_input(project_info):
+            cache.record(self.outfile, key, provenance)
+            return
+        info("  Calling " + self.reformat_script
+             + " to check/reformat model data",
              verbosity,
              required_verbosity=1)
 
-        projects.run_executable(reformat_script, project_info, verbosity,
+        projects.run_executable(self.reformat_script,
+                                self.get_job_info(project_info),
+                                verbosity,
                                 exit_on_warning)
-    if 'NO_REFORMAT' in reformat_script:
-        pass
-    else:
-        if (not os.path.isfile(project_info['TEMPORARY']['outfile_fullpath'])):
-            raise exceptions.IOError(2, "Expected reformatted file isn't available: ",
-                                     project_info['TEMPORARY']['outfile_fullpath'])
-    del(project_info['TEMPORARY'])
+        if 'NO_REFORMAT' in self.reformat_script:
+            pass
+        else:
+            if (not os.path.isfile(self.outfile)):
+                raise exceptions.IOError(2, "Expected reformatted file isn't available: ",
+                                         self.outfile)
+            cache.store(key, self.outfile, provenance)
+
+
+def collect_reformat_jobs(project_info, job_specs, jobs=None):
+    """ @brief Build ReformatJob instances and drop duplicates
+        @param project_info Current namelist in dictionary format
+        @param job_specs Iterable of (project, model, base variable)-tuples
+        @param jobs Dictionary (key -> ReformatJob) of already collected
+                    jobs, e.g., from previous diagnostics
+        @return Two lists, the jobs needed for job_specs (including those
+                already in 'jobs') and the newly collected jobs
+
+        Two jobs are identical if they write the same reformatted file.
+    """
+    if jobs is None:
+        jobs = {}
+    needed = []
+    new = []
+    for currProject, model, variable in job_specs:
+        job = ReformatJob(currProject, project_info, variable, model)
+        key = job.get_key()
+        if key not in jobs:
+            jobs[key] = job
+            new.append(job)
+        if jobs[key] not in needed:
+            needed.append(jobs[key])
+    return needed, new
+
+
+def cmor_reformat(currProject, project_info, variable, model):
+    ReformatJob(currProject, project_info, variable, model).run(project_info)
@@ -0,0 +1,212 @@
+# Content-addressed cache for the reformatted (climo) files
+#
+# What it does:
+#  - Identifies a check/reformat job by a provenance key, i.e., a hash of
+#    the input files (names, sizes, mtimes), the reformat scripts and
+#    model fixes (contents) and the variable/field/time range requested.
+#  - Records the key of every reformatted file next to it (in a hidden
+#    .provenance/-folder of the climo directory), a reformatted file is
+#    only reused if its recorded key matches exactly.
+#  - Keeps a copy of each reformatted file in a cache folder named by its
+#    key, such that identical jobs from other namelists, climo directories
+#    or users (on a shared file system) reuse it instead of reprocessing.
+#  - Reformatted files written before provenance records were introduced
+#    are adopted (their provenance is recorded) if they are newer than all
+#    their input files, scripts and fixes, as the earlier check of their
+#    existence would have reused them as well.
+#
+# Usage:
+#    cache = ReformatCache(cache_dir)
+#    if not cache.is_current(outfile, key)\
+#            and not cache.adopt(outfile, key, provenance)\
+#            and not cache.fetch(key, outfile, provenance):
+#        <run reformat script>
+#        cache.store(key, outfile, provenance)
+
+import errno
+import glob
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+PROVENANCE_DIR = ".provenance"
+
+# Content hashes of the scripts, by (path, size, mtime)
+_digests = {}
+
+
+def file_digest(path):
+    """ @brief sha1 of the content of a (small) file, None if missing
+    """
+    try:
+        status = os.stat(path)
+    except OSError:
+        return None
+    stamp = (os.path.abspath(path), status.st_size, status.st_mtime)
+    if stamp not in _digests:
+        sha = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), ""):
+                sha.update(block)
+        _digests[stamp] = sha.hexdigest()
+    return _digests[stamp]
+
+
+def input_stamps(pattern):
+    """ @brief Name, size and mtime of all files matching a (glob) path
+        @param pattern Path to an input file, may contain wildcards, or a
+                       space separated list of such paths
+        @return List of [path, size, mtime]-entries sorted by path
+    """
+    paths = set()
+    for part in pattern.split():
+        paths.update(glob.glob(part))
+    stamps = []
+    for path in sorted(paths):
+        try:
+            status = os.stat(path)
+        except OSError:
+            continue
+        stamps.append([os.path.abspath(path),
+                       status.st_size,
+                       int(status.st_mtime)])
+    return stamps
+
+
+def script_digests(paths):
+    """ @brief Content hash of each of the given scripts
+        @return Dictionary (path -> digest), paths relative to the
+                ESMValTool root folder
+
+        Scripts are hashed by content (not by mtime), such that checkouts
+        of the same version by different users produce the same key.
+    """
+    return dict((path, file_digest(path)) for path in sorted(set(paths)))
+
+
+def provenance_key(provenance):
+    """ @brief Hash of a JSON representable provenance dictionary
+    """
+    return hashlib.sha1(json.dumps(provenance, sort_keys=True)).hexdigest()
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as exc:
+        if exc.errno != errno.EEXIST or not os.path.isdir(path):
+            raise
+
+
+def _install(source, target):
+    """ @brief Atomically put a copy (or hard link) of source at target
+    """
+    _makedirs(os.path.dirname(target))
+    tmp_fd, tmp_path = tempfile.mkstemp(prefix=".tmp_",
+                                        dir=os.path.dirname(target))
+    os.close(tmp_fd)
+    os.remove(tmp_path)
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        # Different file systems or no hard links supported
+        shutil.copy2(source, tmp_path)
+    os.rename(tmp_path, target)
+
+
+class ReformatCache(object):
+    """ @brief Cache of reformatted files indexed by their provenance key
+    """
+    def __init__(self, cache_dir):
+        """ @param cache_dir Folder holding the cached files, may be shared
+                             between namelists and users
+        """
+        self.cache_dir = cache_dir
+
+    def get_entry(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get_record(self, outfile):
+        return os.path.join(os.path.dirname(outfile),
+                            PROVENANCE_DIR,
+                            os.path.basename(outfile) + ".json")
+
+    def recorded_key(self, outfile):
+        """ @brief Provenance key recorded for a reformatted file (or None)
+        """
+        try:
+            with open(self.get_record(outfile)) as f:
+                return json.load(f)['key']
+        except (IOError, ValueError, KeyError):
+            return None
+
+    def is_current(self, outfile, key):
+        """ @brief True if outfile exists and was produced for 'key'
+        """
+        return os.path.isfile(outfile) and self.recorded_key(outfile) == key
+
+    def record(self, outfile, key, provenance):
+        """ @brief Record the provenance of a reformatted file
+        """
+        record = self.get_record(outfile)
+        _makedirs(os.path.dirname(record))
+        tmp_path = record + ".tmp" + str(os.getpid())
+        with open(tmp_path, "w") as f:
+            json.dump({'key': key, 'provenance': provenance}, f,
+                      sort_keys=True, indent=1)
+        os.rename(tmp_path, record)
+
+    def adopt(self, outfile, key, provenance):
+        """ @brief Record the provenance of a reformatted file without a
+                   provenance record, if it is newer than everything it
+                   depends on
+            @return True if the file was adopted
+        """
+        if os.path.islink(outfile) or not os.path.isfile(outfile) \
+                or os.path.isfile(self.get_record(outfile)):
+            return False
+        mtime = os.stat(outfile).st_mtime
+        for stamps in provenance['inputs'].values():
+            for path, size, input_mtime in stamps:
+                if input_mtime > mtime:
+                    return False
+        for path in provenance['scripts']:
+            if os.path.isfile(path) and os.stat(path).st_mtime > mtime:
+                return False
+        self.record(outfile, key, provenance)
+        return True
+
+    def invalidate(self, outfile):
+        """ @brief Remove a reformatted file and its provenance record
+        """
+        for path in [outfile, self.get_record(outfile)]:
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def fetch(self, key, outfile, provenance):
+        """ @brief Install the cached file for 'key' as outfile
+            @return True if the cache held a file for 'key'
+        """
+        entry = os.path.join(self.get_entry(key), os.path.basename(outfile))
+        if not os.path.isfile(entry):
+            return False
+        _install(entry, outfile)
+        self.record(outfile, key, provenance)
+        return True
+
+    def store(self, key, outfile, provenance):
+        """ @brief Add a freshly reformatted file to the cache
+        """
+        self.record(outfile, key, provenance)
+        entry_dir = self.get_entry(key)
+        entry = os.path.join(entry_dir, os.path.basename(outfile))
+        if os.path.isfile(entry):
+            return
+        _install(outfile, entry)
+        tmp_path = os.path.join(entry_dir, "provenance.json.tmp"
+                                + str(os.getpid()))
+        with open(tmp_path, "w") as f:
+            json.dump(provenance, f, sort_keys=True, indent=1)
+        os.rename(tmp_path, os.path.join(entry_dir, "provenance.json"))
@@ -0,0 +1,283 @@
+# Run-wide resource accounting of the launched stages
+#
+# What it does:
+#  - Measures wall time, CPU time (this process and its children), the
+#    peak RSS of the launched children and the bytes read/written (from
+#    /proc/self/io, which includes the reaped children) of every launched
+#    stage (projects.run_executable, reformat.ReformatJob.run).
+#  - Appends one JSON record per stage, labelled with the model, variable
+#    and diagnostic, to <run_dir>/resources.jsonl. Appending keeps the
+#    records of concurrently running scheduler tasks apart.
+#  - Summarizes the records of a run in resources.json and resources.html,
+#    ranking the stages by wall time.
+#
+# The peak RSS of a stage is the largest one of the children reaped by the
+# launchers during the stage (their own ru_maxrss from os.wait4, see
+# child_exited). For other children the high-water mark of all children of
+# the process (getrusage) is used only if it rose during the stage, the
+# peak RSS is unknown (None) otherwise.
+#
+# Usage:
+#    start_run(run_dir)
+#    with measure(run_dir, "derive_var.ncl", variable="tas"):
+#        <launch>
+#    json_file, html_file = write_report(run_dir)
+
+import cgi
+import contextlib
+import json
+import os
+import resource
+import time
+
+RECORDS_FILE = "resources.jsonl"
+
+# Stages currently measured in this process (outermost first): name,
+# labels and the peak RSS of the children reaped during the stage
+_active = []
+
+
+def io_counters():
+    """ @brief I/O counters of this process and its reaped children
+        @return Dictionary (empty if /proc/self/io is not available)
+    """
+    counters = {}
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                name, value = line.split(":")
+                counters[name.strip()] = int(value)
+    except (IOError, ValueError):
+        pass
+    return counters
+
+
+def snapshot():
+    """ @brief Current resource counters of this process
+    """
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {'wall': time.time(),
+            'cpu': own.ru_utime + own.ru_stime,
+            'children_cpu': children.ru_utime + children.ru_stime,
+            'children_maxrss': children.ru_maxrss,
+            'io': io_counters()}
+
+
+def child_exited(usage):
+    """ @brief Account a reaped child to the stages measured in this
+               process
+        @param usage Resource usage of the child (as returned by os.wait4)
+    """
+    for stage, labels, peaks in _active:
+        peaks.append(usage.ru_maxrss)
+
+
+def _max_known(values):
+    """ @brief Maximum of the values which are not None (None if none)
+    """
+    known = [value for value in values if value is not None]
+    return max(known) if known else None
+
+
+def labels_from(project_info):
+    """ @brief Model/variable/diagnostic labels of a launch
+        @param project_info Current namelist in dictionary format
+    """
+    runtime = project_info.get('RUNTIME', {})
+    labels = {}
+    if 'currDiag' in runtime:
+        labels['diagnostic'] = runtime['currDiag'].get_diag_script()
+    elif 'model' in runtime:
+        labels['model'] = runtime['model']
+    if runtime.get('derived_var', "Undefined") != "Undefined":
+        labels['variable'] = runtime['derived_var']
+    return labels
+
+
+@contextlib.contextmanager
+def measure(run_dir, stage, **labels):
+    """ @brief Record the resources used by the enclosed block
+        @param run_dir Folder of the records (nothing is recorded if None)
+        @param stage Name of the stage (e.g. the executable)
+        @param labels model/variable/diagnostic; labels of an enclosing
+                      stage are inherited
+
+        The record is also written if the block fails (with 'failed' set).
+    """
+    if run_dir is None:
+        yield
+        return
+    merged = dict(_active[-1][1]) if _active else {}
+    merged.update((key, value) for key, value in labels.items()
+                  if value is not None)
+    parent = _active[-1][0] if _active else None
+    peaks = []
+    _active.append((stage, merged, peaks))
+    before = snapshot()
+    failed = True
+    try:
+        yield
+        failed = False
+    finally:
+        _active.pop()
+        after = snapshot()
+        peak_rss = _max_known(peaks)
+        if peak_rss is None \
+                and after['children_maxrss'] > before['children_maxrss']:
+            peak_rss = after['children_maxrss']
+        record = {'stage': stage,
+                  'parent': parent,
+                  'depth': len(_active),
+                  'labels': merged,
+                  'failed': failed,
+                  'pid': os.getpid(),
+                  'start': before['wall'],
+                  'wall_time': after['wall'] - before['wall'],
+                  'cpu_time': (after['cpu'] - before['cpu']
+                               + after['children_cpu']
+                               - before['children_cpu']),
+                  'peak_rss_kb': peak_rss}
+        for name in ['rchar', 'wchar', 'read_bytes', 'write_bytes']:
+            if name in before['io'] and name in after['io']:
+                record[name] = after['io'][name] - before['io'][name]
+        append_record(run_dir, record)
+
+
+def append_record(run_dir, record):
+    if not os.path.isdir(run_dir):
+        os.makedirs(run_dir)
+    with open(os.path.join(run_dir, RECORDS_FILE), "a") as f:
+        f.write(json.dumps(record, sort_keys=True) + "\n")
+
+
+def start_run(run_dir):
+    """ @brief Remove the records of an earlier run in run_dir
+    """
+    path = os.path.join(run_dir, RECORDS_FILE)
+    if os.path.isfile(path):
+        os.remove(path)
+
+
+def read_records(run_dir):
+    path = os.path.join(run_dir, RECORDS_FILE)
+    if not os.path.isfile(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(records, top=25):
+    """ @brief Totals per stage and the hottest single launches
+        @param records Records as written by measure
+        @param top Number of single launches to list
+        @return Dictionary with the entries 'total', 'stages' and 'hottest'
+    """
+    counters = ['wall_time', 'cpu_time', 'rchar', 'wchar',
+                'read_bytes', 'write_bytes']
+    stages = {}
+    for record in records:
+        stage = stages.setdefault(record['stage'], dict(
+            [('stage', record['stage']), ('count', 0), ('failed', 0),
+             ('peak_rss_kb', None)] + [(name, 0) for name in counters]))
+        stage['count'] += 1
+        stage['failed'] += int(record['failed'])
+        stage['peak_rss_kb'] = _max_known([stage['peak_rss_kb'],
+                                           record['peak_rss_kb']])
+        for name in counters:
+            stage[name] += record.get(name, 0)
+
+    # Nested stages are part of their parent, only the outermost count
+    # towards the total
+    total = dict((name, sum([record.get(name, 0) for record in records
+                             if record['depth'] == 0]))
+                 for name in counters)
+    total['count'] = len(records)
+    total['peak_rss_kb'] = _max_known([record['peak_rss_kb']
+                                       for record in records])
+
+    ranked = sorted(stages.values(), key=lambda stage: -stage['wall_time'])
+    for stage in ranked:
+        stage['share'] = stage['wall_time'] / total['wall_time'] \
+            if total['wall_time'] > 0 else 0.
+    hottest = sorted(records, key=lambda record: -record['wall_time'])[:top]
+    return {'total': total, 'stages': ranked, 'hottest': hottest}
+
+
+def _html_table(header, rows):
+    lines = ["<table>",
+             "<tr>" + "".join(["<th>" + cgi.escape(name) + "</th>"
+                               for name in header]) + "</tr>"]
+    for row in rows:
+        lines.append("<tr>" + "".join(["<td>" + cgi.escape(str(value))
+                                       + "</td>" for value in row])
+                     + "</tr>")
+    lines.append("</table>")
+    return "\n".join(lines)
+
+
+def _mb(value):
+    return "%.1f" % (value / 1048576.)
+
+
+def _rss_mb(value):
+    """ @brief Peak RSS (kB) in MB, '?' if unknown
+    """
+    return "?" if value is None else _mb(value * 1024)
+
+
+def html_report(summary, title):
+    """ @brief The summary as a self-contained HTML page
+    """
+    total = summary['total']
+    stages = _html_table(
+        ["stage", "launches", "failed", "wall time [s]", "share",
+         "CPU time [s]", "peak RSS [MB]", "read [MB]", "written [MB]"],
+        [[stage['stage'], stage['count'], stage['failed'],
+          "%.1f" % stage['wall_time'], "%.1f%%" % (100 * stage['share']),
+          "%.1f" % stage['cpu_time'], _rss_mb(stage['peak_rss_kb']),
+          _mb(stage['rchar']), _mb(stage['wchar'])]
+         for stage in summary['stages']])
+    hottest = _html_table(
+        ["stage", "model", "variable", "diagnostic", "wall time [s]",
+         "CPU time [s]", "peak RSS [MB]", "read [MB]", "written [MB]"],
+        [[record['stage'], record['labels'].get('model', ''),
+          record['labels'].get('variable', ''),
+          record['labels'].get('diagnostic', ''),
+          "%.1f" % record['wall_time'], "%.1f" % record['cpu_time'],
+          _rss_mb(record['peak_rss_kb']), _mb(record.get('rchar', 0)),
+          _mb(record.get('wchar', 0))]
+         for record in summary['hottest']])
+    return "\n".join([
+        "<!DOCTYPE html>",
+        "<html><head><meta charset=\"utf-8\">",
+        "<title>" + cgi.escape(title) + "</title>",
+        "<style>table {border-collapse: collapse} "
+        "td, th {border: 1px solid #999; padding: 2px 6px} "
+        "td {text-align: right}</style>",
+        "</head><body>",
+        "<h1>" + cgi.escape(title) + "</h1>",
+        "<p>%d launches, wall time %.1f s, CPU time %.1f s, "
+        "peak RSS %s MB, read %s MB, written %s MB</p>" % (
+            total['count'], total['wall_time'], total['cpu_time'],
+            _rss_mb(total['peak_rss_kb']), _mb(total['rchar']),
+            _mb(total['wchar'])),
+        "<h2>Stages by wall time</h2>", stages,
+        "<h2>Hottest launches</h2>", hottest,
+        "</body></html>", ""])
+
+
+def write_report(run_dir, title="ESMValTool resource report"):
+    """ @brief Write resources.json and resources.html for the run
+        @return Paths of the two files
+    """
+    summary = summarize(read_records(run_dir))
+    if not os.path.isdir(run_dir):
+        os.makedirs(run_dir)
+    json_file = os.path.join(run_dir, "resources.json")
+    html_file = os.path.join(run_dir, "resources.html")
+    with open(json_file, "w") as f:
+        json.dump(summary, f, indent=1, sort_keys=True)
+    with open(html_file, "w") as f:
+        f.write(html_report(summary, title))
+    return json_file, html_file
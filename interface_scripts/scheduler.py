@@ -0,0 +1,462 @@
+# Dependency aware scheduling of the namelist processing stages
+#
+# What it does:
+#  - Turns the <DIAGNOSTICS> of a namelist into a graph of tasks
+#    (reformat -> derive_var -> diag_script) and runs independent
+#    tasks concurrently in a bounded number of worker processes.
+#    The reformat jobs (one per model and base variable) of all
+#    diagnostics are de-duplicated and form the first stage.
+#  - The python modules of diagnostics run in a forked worker
+#    (execute_in_worker) are imported before the task processes are
+#    forked, so that every task shares them.
+#  - Every concurrently running task writes its stdout/stderr to a
+#    per-task log file. The scripts launched by a task run in their own
+#    launch directory (see manifest.py), hence tasks do not interfere
+#    through the interface_data/-folder.
+#
+# Usage:
+#    graph = build_namelist_graph(project_info)
+#    run_tasks(graph, jobs=8, run_dir=run_dir, verbosity=verbosity,
+#              preload=uses_python_worker(project_info))
+
+from auxiliary import info, taskExecuteError
+import copy
+import datetime
+import heapq
+import launchers
+import multiprocessing
+import os
+import projects
+import reformat
+import sys
+import time
+import traceback
+import tracing
+
+
+class Task(object):
+    """ @brief A single unit of work in the namelist processing graph
+    """
+    def __init__(self, name, function, args=(), requires=None):
+        """ @param name Unique task name (also used for the log file name)
+            @param function Callable executing the task
+            @param args Arguments passed on to 'function'
+            @param requires Names of the tasks that must finish first
+        """
+        self.name = name
+        self.function = function
+        self.args = args
+        self.requires = []
+        for name in requires or []:
+            self.add_requirement(name)
+
+    def add_requirement(self, name):
+        if name != self.name and name not in self.requires:
+            self.requires.append(name)
+
+    def run(self):
+        return self.function(*self.args)
+
+    def __str__(self):
+        return self.name
+
+
+class TaskGraph(object):
+    """ @brief Directed acyclic graph of Task instances
+    """
+    def __init__(self):
+        self.tasks = {}
+        self.insertion_order = []
+
+    def add_task(self, task):
+        if task.name in self.tasks:
+            raise taskExecuteError("Task '" + task.name + "' defined twice")
+        self.tasks[task.name] = task
+        self.insertion_order.append(task.name)
+        return task
+
+    def __contains__(self, name):
+        return name in self.tasks
+
+    def __getitem__(self, name):
+        return self.tasks[name]
+
+    def __len__(self):
+        return len(self.insertion_order)
+
+    def __iter__(self):
+        for name in self.insertion_order:
+            yield self.tasks[name]
+
+    def topological_order(self):
+        """ @brief Return the tasks sorted such that requirements come first
+            @return A list of Task instances
+
+            Among the tasks that are ready to run, the one defined first is
+            preferred, hence a namelist processed with a single job runs its
+            stages in the same order as the serial loop in main.py.
+        """
+        position = dict((name, idx)
+                        for idx, name in enumerate(self.insertion_order))
+        n_missing = {}
+        dependants = dict((name, []) for name in self.insertion_order)
+        for task in self:
+            for req in task.requires:
+                if req not in self.tasks:
+                    raise taskExecuteError("Task '" + task.name
+                                           + "' requires unknown task '"
+                                           + req + "'")
+                dependants[req].append(task.name)
+            n_missing[task.name] = len(task.requires)
+
+        ready = [position[name] for name in self.insertion_order
+                 if n_missing[name] == 0]
+        heapq.heapify(ready)
+        ordered = []
+        while ready:
+            name = self.insertion_order[heapq.heappop(ready)]
+            ordered.append(self.tasks[name])
+            for dependant in dependants[name]:
+                n_missing[dependant] -= 1
+                if n_missing[dependant] == 0:
+                    heapq.heappush(ready, position[dependant])
+
+        if len(ordered) != len(self.insertion_order):
+            cyclic = [name for name in self.insertion_order
+                      if n_missing[name] > 0]
+            raise taskExecuteError("Cyclic task dependencies between: "
+                                   + ", ".join(cyclic))
+        return ordered
+
+
+def _execute_with_log(task, log_file):
+    """ @brief Entry point of the worker process running a single task
+
+        Redirects stdout/stderr (including the output of any subprocess
+        started by the task) to the task log file and runs the task.
+    """
+    log = open(log_file, "w", 0)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.dup2(log.fileno(), 1)
+    os.dup2(log.fileno(), 2)
+    sys.stdout = sys.stderr = log
+
+    exit_code = 0
+    try:
+        task.run()
+    except SystemExit as exc:
+        if exc.code not in [None, 0]:
+            exit_code = 1
+    except BaseException:
+        traceback.print_exc()
+        exit_code = 1
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(exit_code)
+
+
+def run_tasks(graph, jobs=1, run_dir=None, verbosity=1, poll_interval=0.2,
+              preload=False):
+    """ @brief Execute all tasks of a TaskGraph
+        @param graph TaskGraph instance
+        @param jobs Maximum number of tasks running at the same time
+        @param run_dir Folder for the per-task logs (required if jobs > 1)
+        @param verbosity The requested verbosity level
+        @param poll_interval Seconds between checks of the running tasks
+        @param preload Import the python modules of the forked diagnostics
+                       (launchers.preload_modules) before forking the worker
+                       processes of the tasks
+
+        With jobs = 1 the tasks are run one after another in the current
+        process (identical to the classic serial processing). Otherwise each
+        task is run in a worker process logging to its own file. Tasks depending on a failed task are skipped,
+        independent tasks are still completed before taskExecuteError is
+        raised.
+    """
+    ordered = graph.topological_order()
+
+    if jobs <= 1:
+        for task in ordered:
+            info("Running task " + task.name, verbosity, 2)
+            task.run()
+        return
+
+    log_dir = os.path.join(run_dir, "logs")
+    if not os.path.isdir(log_dir):
+        os.makedirs(log_dir)
+    if preload:
+        info("Preloading the python modules of the diagnostics", verbosity, 2)
+        launchers.preload_modules()
+
+    pending = list(ordered)
+    running = {}
+    finished = set()
+    failed = []
+    skipped = []
+
+    while pending or running:
+        for task in list(pending):
+            if len(running) >= jobs:
+                break
+            if any([req in failed or req in skipped for req in task.requires]):
+                pending.remove(task)
+                skipped.append(task.name)
+                info("Skipping task " + task.name
+                     + " (a required task failed)", verbosity, 1)
+                continue
+            if not all([req in finished for req in task.requires]):
+                continue
+
+            pending.remove(task)
+            log_file = os.path.join(log_dir, task.name + ".log")
+            worker = multiprocessing.Process(target=_execute_with_log,
+                                             args=(task, log_file))
+            worker.start()
+            running[task.name] = (worker, log_file,
+                                  datetime.datetime.now())
+            info("Started task " + task.name + " (log: " + log_file + ")",
+                 verbosity, 1)
+
+        time.sleep(poll_interval)
+
+        for name in list(running):
+            worker, log_file, start = running[name]
+            if worker.is_alive():
+                continue
+            worker.join()
+            del(running[name])
+            elapsed = str(datetime.datetime.now() - start)
+            if worker.exitcode == 0:
+                finished.add(name)
+                info("Finished task " + name + " in " + elapsed,
+                     verbosity, 1)
+            else:
+                failed.append(name)
+                info("Task " + name + " FAILED after " + elapsed
+                     + ", see " + log_file, verbosity, 0)
+
+    if failed:
+        raise taskExecuteError(str(len(failed)) + " task(s) failed ("
+                               + ", ".join(failed) + "), "
+                               + str(len(skipped)) + " skipped; logs in "
+                               + log_dir)
+
+
+def uses_python_worker(project_info):
+    """ @brief Whether any python diagnostic of the namelist runs in a
+               forked worker (launcher argument 'execute_in_worker')
+        @param project_info Current namelist in dictionary format
+    """
+    for currDiag in project_info['DIAGNOSTICS']:
+        if os.path.splitext(currDiag.get_diag_script())[1] != ".py":
+            continue
+        launcher = launchers.py_launcher()
+        if currDiag.get_launcher_arguments() is not None:
+            launcher.arguments = currDiag.get_launcher_arguments()
+        launcher.convert_arguments()
+        if launcher.launch_args is not None \
+                and launcher.launch_args.get('execute_in_worker', False):
+            return True
+    return False
+
+
+def diagnostic_project_info(project_info, currDiag):
+    """ @brief Return a copy of project_info prepared for one diagnostic
+        @param project_info Current namelist in dictionary format
+        @param currDiag The Diagnostic instance
+
+        The copy holds the diagnostic specific model list and a private
+        'RUNTIME' section, such that tasks of different diagnostics do not
+        see each others settings.
+    """
+    diag_info = copy.copy(project_info)
+    diag_info['MODELS'] = \
+        projects.remove_diag_specific_models(project_info['MODELS'])
+    projects.add_model(diag_info, currDiag.get_diag_models())
+    diag_info['RUNTIME'] = dict(project_info['RUNTIME'])
+    for key in ['currDiag', 'derived_var', 'derived_field_type']:
+        if key in diag_info['RUNTIME']:
+            del(diag_info['RUNTIME'][key])
+    return diag_info
+
+
+def _copy_runtime(project_info, **runtime):
+    task_info = copy.copy(project_info)
+    task_info['RUNTIME'] = dict(project_info['RUNTIME'])
+    task_info['RUNTIME'].update(runtime)
+    return task_info
+
+
+def reformat_stage(project_info, reformat_job):
+    """ @brief Task: check/reformat one base variable of one model
+        @param project_info project_info copy of the (first) diagnostic
+                            requesting the job
+        @param reformat_job reformat.ReformatJob instance
+    """
+    verbosity = project_info['GLOBAL']['verbosity']
+
+    info("", verbosity, 1)
+    info("MODEL = " + reformat_job.runtime['model'] + " ("
+         + reformat_job.runtime['project'] + ")", verbosity, 1)
+    info("VARIABLE = " + reformat_job.variable.var + " ("
+         + reformat_job.variable.fld + ")", verbosity, 1)
+
+    # Rewrite netcdf to expected input format.
+    info("Calling cmor_reformat.py to check/reformat model data",
+         verbosity, 2)
+    reformat_job.run(project_info)
+
+
+def derive_stage(project_info):
+    """ @brief Task: run derive_var.ncl for one variable of a diagnostic
+        @param project_info project_info copy with 'currDiag',
+                            'derived_var' and 'derived_field_type' set
+    """
+    verbosity = project_info['GLOBAL']['verbosity']
+    exit_on_warning = project_info['GLOBAL'].get('exit_on_warning', False)
+
+    executable = "./interface_scripts/derive_var.ncl"
+    info("", verbosity, required_verbosity=1)
+    info("Calling " + executable + " for '"
+         + project_info['RUNTIME']['derived_var'] + "'",
+         verbosity, required_verbosity=1)
+    with tracing.span(project_info['RUNTIME'].get('run_dir'),
+                      "derive_var " + project_info['RUNTIME']['derived_var'],
+                      "derive_var"):
+        projects.run_executable(executable, project_info, verbosity,
+                                exit_on_warning)
+
+
+def diag_stage(project_info):
+    """ @brief Task: run the diag_script of a diagnostic
+        @param project_info project_info copy with 'currDiag' set
+    """
+    verbosity = project_info['GLOBAL']['verbosity']
+    exit_on_warning = project_info['GLOBAL'].get('exit_on_warning', False)
+    currDiag = project_info['RUNTIME']['currDiag']
+
+    executable = "./diag_scripts/" + currDiag.get_diag_script()
+    configfile = currDiag.get_diag_script_cfg()
+    info("", verbosity, required_verbosity=1)
+    info("Running diag_script: " + executable, verbosity, required_verbosity=1)
+    info("with configuration file: " + configfile, verbosity,
+         required_verbosity=1)
+
+    with tracing.span(project_info['RUNTIME'].get('run_dir'),
+                      "diag_script " + currDiag.get_diag_script(),
+                      "diag_script"):
+        projects.run_executable(executable,
+                                project_info,
+                                verbosity,
+                                exit_on_warning,
+                                launcher_arguments=currDiag.get_launcher_arguments())
+
+
+def build_namelist_graph(project_info):
+    """ @brief Turn project_info['DIAGNOSTICS'] into a TaskGraph
+        @param project_info Current namelist in dictionary format
+        @return A TaskGraph instance
+
+        The check/reformat jobs of all diagnostics are collected first and
+        de-duplicated, each unique job (one base variable of one model)
+        becomes a reformat task. Each diagnostic then contributes one derive
+        task per variable and a diag_script task, depending on the reformat
+        tasks of its models/variables. A derive task also waits for the
+        derive task of any earlier diagnostic deriving the same
+        variable/field, so that no two tasks write the same file
+        concurrently.
+
+        The base variables are resolved before any task has run. The files
+        the reformat and derive tasks of earlier diagnostics will write
+        count as present (as they would when running the diagnostics one
+        after the other), a task reading such a file waits for the task
+        writing it.
+    """
+    verbosity = project_info['GLOBAL']['verbosity']
+    graph = TaskGraph()
+    reformat_jobs = {}
+    reformat_names = {}
+    derived_owner = {}
+    planned = {}
+
+    for diag_idx, currDiag in enumerate(project_info['DIAGNOSTICS']):
+        diag_info = diagnostic_project_info(project_info, currDiag)
+        script_name = os.path.splitext(
+            os.path.basename(currDiag.get_diag_script()))[0]
+        label = "%03d_%s" % (diag_idx, script_name)
+
+        # Resolve the base variables to reformat for each model
+        requested_vars = currDiag.get_variables_list()
+        job_specs = []
+        for model in diag_info['MODELS']:
+            currProject = projects.get_project(model.entries[0])
+            variable_defs_base_vars = \
+                currDiag.add_base_vars_fields(requested_vars, model)
+            base_vars = currDiag.select_base_vars(variable_defs_base_vars,
+                                                  model,
+                                                  currProject,
+                                                  diag_info,
+                                                  planned)
+            for base_var in base_vars:
+                if currDiag.id_is_explicitly_excluded(base_var, model):
+                    continue
+                job_specs.append((currProject, model, base_var))
+
+        needed_jobs, new_jobs = reformat.collect_reformat_jobs(diag_info,
+                                                               job_specs,
+                                                               reformat_jobs)
+        for job in new_jobs:
+            name = "reformat_%04d_%s" % (
+                len(reformat_names),
+                os.path.splitext(os.path.basename(job.outfile))[0])
+            # A precomputed file still to be written by a derive task
+            requires = [planned[job.outfile]] if job.outfile in planned \
+                else []
+            graph.add_task(Task(name, reformat_stage,
+                                (_copy_runtime(diag_info), job),
+                                requires=requires))
+            reformat_names[job.get_key()] = name
+            planned[job.outfile] = name
+        reformat_requires = [reformat_names[job.get_key()]
+                             for job in needed_jobs]
+        info("Diagnostic " + label + ": " + str(len(needed_jobs))
+             + " reformat job(s), " + str(len(new_jobs)) + " new",
+             verbosity, 2)
+
+        # Derive the requested variables
+        diag_info['RUNTIME']['currDiag'] = currDiag
+        derive_names = []
+        field_types = currDiag.get_field_types()
+        for variable, derived_var, derived_field in zip(
+                requested_vars, currDiag.get_variables(), field_types):
+            derive_name = "derive_" + label + "_" + derived_var \
+                          + "_" + derived_field
+            task_info = _copy_runtime(diag_info,
+                                      derived_var=derived_var,
+                                      derived_field_type=derived_field)
+            derive_task = Task(derive_name, derive_stage, (task_info,),
+                               requires=reformat_requires)
+            key = (derived_var, derived_field)
+            if key in derived_owner:
+                derive_task.add_requirement(derived_owner[key])
+            derived_owner[key] = derive_name
+            graph.add_task(derive_task)
+            derive_names.append(derive_name)
+            for model in diag_info['MODELS']:
+                if currDiag.id_is_explicitly_excluded(variable, model):
+                    continue
+                path = projects.get_project(model.entries[0]) \
+                    .get_cf_fullpath(diag_info, model, derived_field,
+                                     derived_var, variable.mip, variable.exp)
+                if path not in reformat_names:
+                    planned[path] = derive_name
+
+        # Run the diagnostic script
+        runtime = {'derived_var': "Undefined"}
+        if field_types:
+            runtime['derived_field_type'] = field_types[-1]
+        graph.add_task(Task("diag_" + label, diag_stage,
+                            (_copy_runtime(diag_info, **runtime),),
+                            requires=reformat_requires + derive_names))
+    return graph
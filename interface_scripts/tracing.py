@@ -0,0 +1,154 @@
+# Timeline of a namelist run in the Chrome trace event format
+#
+# What it does:
+#  - Records the Python side stage boundaries (parse, reformat, derive_var,
+#    diag_script and the launched executables) as complete ('X') events.
+#    Each event is appended as one JSON line to <run_dir>/trace.jsonl,
+#    hence the events of concurrently running scheduler tasks (separate
+#    processes) end up in the same file.
+#  - Turns the enter_msg/leave_msg trace of the NCL scripts into nested
+#    events below the span of their launch. With ESMValTool_trace set, the
+#    two procedures print a 'ESMValTool-trace:' line carrying the CPU time
+#    of the NCL process, which the launcher takes out of the output (see
+#    launchers.write_stdouterr). NCL has no cheap wall clock, the NCL spans
+#    are therefore placed at launch start + CPU time of the NCL process.
+#  - Writes trace.json, to be opened in chrome://tracing or Perfetto.
+#
+# Usage:
+#    with span(run_dir, "derive_var tas", "derive_var"):
+#        <work>
+#    write_trace(run_dir)
+
+import contextlib
+import json
+import os
+import re
+import threading
+import time
+
+EVENTS_FILE = "trace.jsonl"
+TRACE_FILE = "trace.json"
+NCL_TRACE_MARKER = "ESMValTool-trace: "
+
+_ncl_trace_pattern = re.compile(NCL_TRACE_MARKER + r"([BE]) (\S+) (.*?)\s*$")
+
+
+def _microseconds(seconds):
+    return int(round(seconds * 1e6))
+
+
+def add_event(run_dir, name, category, start, end, **args):
+    """ @brief Append a complete event to the events of the run
+        @param start Start in seconds since the epoch
+        @param end End in seconds since the epoch
+        @param args Additional (JSON serializable) information on the event
+    """
+    if run_dir is None:
+        return
+    event = {'name': name, 'cat': category, 'ph': 'X',
+             'ts': _microseconds(start),
+             'dur': _microseconds(max(end - start, 0.)),
+             'pid': os.getpid(),
+             'tid': threading.current_thread().ident % 2**31}
+    if args:
+        event['args'] = args
+    _append(run_dir, [event])
+
+
+def _append(run_dir, events):
+    if not os.path.isdir(run_dir):
+        os.makedirs(run_dir)
+    with open(os.path.join(run_dir, EVENTS_FILE), "a") as f:
+        f.write("".join([json.dumps(event, sort_keys=True) + "\n"
+                         for event in events]))
+
+
+@contextlib.contextmanager
+def span(run_dir, name, category, **args):
+    """ @brief Record the enclosed block as an event (also if it fails)
+        @param run_dir Folder of the events (nothing is recorded if None)
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        add_event(run_dir, name, category, start, time.time(), **args)
+
+
+class ncl_trace(object):
+    """ @brief Collects the enter/leave trace of one NCL launch
+    """
+    def __init__(self, run_dir, start=None):
+        self.run_dir = run_dir
+        self.start = time.time() if start is None else start
+        self.stack = []
+        self.events = []
+
+    def add(self, line):
+        """ @brief Take a trace line of the NCL output
+            @return True if line was a trace line
+        """
+        match = _ncl_trace_pattern.search(line)
+        if match is None:
+            return False
+        phase, cpu_time, name = match.groups()
+        try:
+            ts = self.start + float(cpu_time)
+        except ValueError:
+            return True
+        if phase == 'B':
+            self.stack.append((name, ts))
+        elif any([entered == name for entered, start in self.stack]):
+            # leave_msg is skipped by early returns, such spans are closed
+            # together with their caller
+            while self.stack:
+                entered, start = self.stack.pop()
+                self._close(entered, start, ts)
+                if entered == name:
+                    break
+        return True
+
+    def _close(self, name, start, end):
+        self.events.append({'name': name, 'cat': 'ncl', 'ph': 'X',
+                            'ts': _microseconds(start),
+                            'dur': _microseconds(max(end - start, 0.)),
+                            'pid': os.getpid(),
+                            'tid': threading.current_thread().ident % 2**31,
+                            'args': {'clock': 'ncl cpu time'}})
+
+    def finish(self):
+        """ @brief Close the open spans and append the events of the launch
+        """
+        end = max([time.time()] + [start for name, start in self.stack])
+        while self.stack:
+            name, start = self.stack.pop()
+            self._close(name, start, end)
+        if self.run_dir is not None and self.events:
+            _append(self.run_dir, self.events)
+        self.events = []
+
+
+def start_run(run_dir):
+    """ @brief Remove the events of an earlier run in run_dir
+    """
+    path = os.path.join(run_dir, EVENTS_FILE)
+    if os.path.isfile(path):
+        os.remove(path)
+
+
+def write_trace(run_dir):
+    """ @brief Write the events of the run to trace.json
+        @return Path of the trace file
+    """
+    events = []
+    path = os.path.join(run_dir, EVENTS_FILE)
+    if os.path.isfile(path):
+        with open(path) as f:
+            events = [json.loads(line) for line in f if line.strip()]
+    events.sort(key=lambda event: (event['ts'], -event['dur']))
+    if not os.path.isdir(run_dir):
+        os.makedirs(run_dir)
+    trace_file = os.path.join(run_dir, TRACE_FILE)
+    with open(trace_file, "w") as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    return trace_file
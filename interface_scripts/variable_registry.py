@@ -0,0 +1,229 @@
+# Registry of the variable definitions and variable name tables
+#
+# What it does:
+#  - Parses the variable definitions (variable_defs/<var>.ncl: the
+#    'Requires:' line and the 'variable_info' attributes), the alternative
+#    names (reformat_scripts/recognized_vars.dat) and the project specific
+#    names (reformat_scripts/fixes/names_<project>.dat) once into
+#    dictionaries, queried by diagdef.Diagnostic.add_base_vars_fields,
+#    Data_interface.reparse_variable_info, projects.find_varname and
+#    Project.get_project_variable_name.
+#  - Keeps the parsed content in a cache file (interface_data/
+#    variable_registry.pkl, written at the exit of the process). Each
+#    source file is validated by its mtime (and size) once per process,
+#    only new or modified files are parsed again.
+#
+# Usage:
+#    registry = get_registry()
+#    registry.get_variable_def("./variable_defs/", "ta")['requires']
+#    registry.get_alternative_names("lat")
+#    registry.get_project_name("OBS", "tas")
+
+import atexit
+import cPickle
+import os
+import re
+import tempfile
+
+CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "..", "interface_data", "variable_registry.pkl")
+RECOGNIZED_VARS = os.path.join("reformat_scripts", "recognized_vars.dat")
+NAMES_FILE = os.path.join("reformat_scripts", "fixes", "names_%s.dat")
+
+# Version of the cached content, to be increased if the parsers change
+FORMAT = 1
+
+_remove_comments = re.compile('(.*?);.*')
+_variable_info_true = re.compile("variable_info\s*=\s*True")
+_variable_info_entry = re.compile("variable_info@.*=.*")
+_equal = re.compile("\s*=\s*")
+
+
+def parse_variable_def(path):
+    """ @brief Parse a variable definition file
+        @param path Path to variable_defs/<var>.ncl
+        @return Dictionary with the entries
+                'requires': list of the entries of the 'Requires:' lines
+                            (e.g. ['none'] or ['ua:T3M,va:T3M'])
+                'variable_info_true': whether 'variable_info = True'
+                'variable_info': list of [key, value]-lists of the
+                                 'variable_info' attributes
+                'units': value of variable_info@units (None if missing)
+    """
+    with open(path) as f:
+        content = f.read()
+    var_def = content.split('\n')
+
+    requires = []
+    for line in var_def:
+        tokens = line.split()
+        if "Requires:" in tokens:
+            requires.append(tokens[2])
+
+    # Remove comments and the lines without 'variable_info'-attribute
+    variable_info = [_remove_comments.sub(r'\1', entry) for entry in var_def]
+    variable_info = [entry for entry in variable_info
+                     if _variable_info_entry.search(entry) is not None]
+    variable_info = [re.sub("variable_info@", "", entry)
+                     for entry in variable_info]
+
+    # Split variable_info attribute strings to a [key, value]-list
+    variable_info = [_equal.split(entry) for entry in variable_info]
+
+    units = None
+    for entry in variable_info:
+        if entry[0].strip() == "units" and len(entry) > 1:
+            units = entry[1].strip().strip('"')
+
+    return {'requires': requires,
+            'variable_info_true': _variable_info_true.search(content)
+            is not None,
+            'variable_info': variable_info,
+            'units': units}
+
+
+def parse_recognized_vars(path):
+    """ @brief Parse the alternative names of recognized_vars.dat
+        @return Dictionary (standard name -> list of alternative names)
+
+        An 'alt_name' line follows the 'std_name' line of each variable.
+    """
+    with open(path) as f:
+        lines = [line.strip() for line in f]
+    names = {}
+    for ii, line in enumerate(lines[:-1]):
+        if 'std_name' in line and '#' not in line and '=' in line:
+            std_name = line.split("=")[1].strip()
+            altern = lines[ii + 1].replace(" ", "").split("=")
+            if std_name not in names and len(altern) > 1:
+                names[std_name] = [name for name in altern[1].split(",")
+                                   if name != ""]
+    return names
+
+
+def parse_names_file(path):
+    """ @brief Parse a fixes/names_<project>.dat file
+        @return Dictionary (standard name -> project variable name), the
+                last entry of a standard name wins
+    """
+    names = {}
+    with open(path) as f:
+        for line in f:
+            if line[:1] != "#":
+                columns = line.split('|')
+                if len(columns) > 1:
+                    names[columns[0].strip()] = columns[1].strip()
+    return names
+
+
+def _file_state(path):
+    """ @brief (mtime, size) of a file, None if it does not exist
+    """
+    try:
+        status = os.stat(path)
+    except OSError:
+        return None
+    return (status.st_mtime, status.st_size)
+
+
+class VariableRegistry(object):
+    """ @brief Parsed variable definitions and name tables
+    """
+    def __init__(self, cache_file=CACHE_FILE):
+        """ @param cache_file File keeping the parsed content between runs
+                              (None: no persistence)
+        """
+        self.cache_file = cache_file
+        # Parsed content, by the absolute path of the source:
+        # path -> (file state, content)
+        self.sources = {}
+        # Sources validated by this process
+        self.validated = set()
+        self.modified = False
+        self.load()
+
+    def load(self):
+        if self.cache_file is None or not os.path.isfile(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, "rb") as f:
+                cached = cPickle.load(f)
+        except Exception:
+            return
+        if isinstance(cached, dict) and cached.get('format') == FORMAT:
+            self.sources = cached['sources']
+
+    def save(self):
+        """ @brief Write the parsed content to the cache file (if modified)
+        """
+        if self.cache_file is None or not self.modified:
+            return
+        cache_dir = os.path.dirname(os.path.abspath(self.cache_file))
+        try:
+            fd, tmp_file = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                cPickle.dump({'format': FORMAT, 'sources': self.sources}, f,
+                             cPickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_file, self.cache_file)
+        except (IOError, OSError):
+            # Not writable, the registry still works for this process
+            return
+        self.modified = False
+
+    def get(self, path, parser):
+        """ @brief Parsed content of a source file
+            @param path Path of the source file
+            @param parser Function parsing the file
+            @return The content, None if the file does not exist
+        """
+        path = os.path.abspath(path)
+        if path not in self.validated:
+            state = _file_state(path)
+            if state is None:
+                content = None
+            elif path in self.sources and self.sources[path][0] == state:
+                content = self.sources[path][1]
+            else:
+                content = parser(path)
+            if self.sources.get(path) != (state, content):
+                self.sources[path] = (state, content)
+                self.modified = True
+            self.validated.add(path)
+        return self.sources[path][1]
+
+    def get_variable_def(self, variable_def_dir, variable):
+        """ @brief Parsed variable_defs/<variable>.ncl (see
+                   parse_variable_def)
+        """
+        path = os.path.join(variable_def_dir, variable + ".ncl")
+        content = self.get(path, parse_variable_def)
+        if content is None:
+            raise IOError(2, "No such variable definition", path)
+        return content
+
+    def get_alternative_names(self, variable):
+        """ @brief Alternative names of a variable (see recognized_vars.dat)
+        """
+        names = self.get(RECOGNIZED_VARS, parse_recognized_vars) or {}
+        return list(names.get(variable, []))
+
+    def get_project_name(self, project, variable):
+        """ @brief Project specific name of a variable (see
+                   fixes/names_<project>.dat)
+        """
+        names = self.get(NAMES_FILE % project, parse_names_file) or {}
+        return names.get(variable, variable)
+
+
+# Registry of this process
+_registry = None
+
+
+def get_registry():
+    """ @brief The registry of this process, saved when the process exits
+    """
+    global _registry
+    if _registry is None:
+        _registry = VariableRegistry()
+        atexit.register(_registry.save)
+    return _registry
@@ -38,9 +38,14 @@ from auxiliary import info, error, print_header, ncl_version_check
 from optparse import OptionParser
 import datetime
 import projects
+import manifest
 import os
 import pdb
 import reformat
+import resource_report
+import scheduler
+import time
+import tracing
 import xml.sax
 import xml_parsers
 
@@ -60,6 +65,11 @@ parser = OptionParser(usage=usage, description=description)
 parser.add_option("-r", "--reformat",
                   action="store_true", dest="reformat", default=False,
                   help="run reformat scripts for the observations according to namelist")
+parser.add_option("-j", "--jobs",
+                  action="store", type="int", dest="jobs", default=1,
+                  help="number of namelist tasks (reformat, derive_var, "
+                       "diag_script) to run in parallel, the output of each "
+                       "task is then written to a separate log file")
 options, args = parser.parse_args()
 if len(args) == 0:
     parser.print_help()
@@ -69,14 +79,21 @@ if len(args) == 0:
 input_xml_full_path = args[0]
 
 # Parse input namelist into project_info-dictionary.
+parse_start = time.time()
 Project = xml_parsers.namelistHandler()
 parser = xml.sax.make_parser()
 parser.setContentHandler(Project)
 parser.parse(input_xml_full_path)
+parse_end = time.time()
 
 # Project_info is a dictionary with all info from the namelist.
 project_info = Project.project_info
 
+# Output folders relative to the ESMValTool root, the scripts run in
+# private launch directories
+if 'GLOBAL' in project_info:
+    manifest.make_output_dirs(project_info['GLOBAL'])
+
 if options.reformat:
 	if 'REFORMAT' not in project_info.keys():
 		error('No REFORMAT tag specified in {0}'.format(input_xml_full_path))
@@ -137,76 +154,39 @@ print_header(project_info, options.reformat)
 info("Starting the Earth System Model Evaluation Tool v" + version + " at time: "
      + timestamp1.strftime(timestamp_format) + "...", verbosity, 1)
 
-# Loop over all diagnostics defined in project_info and
-# create/prepare netCDF files for each variable
-for currDiag in project_info['DIAGNOSTICS']:
-
-    # Are the requested variables derived from other, more basic, variables?
-    requested_vars = currDiag.get_variables_list()
-
-    # Update currDiag-specific models
-    project_info['MODELS'] = projects.remove_diag_specific_models(
-        project_info['MODELS'])
-    diag_specific_models = currDiag.get_diag_models()
-    projects.add_model(project_info, diag_specific_models)
-
-    # Prepare/reformat model data for each model
-    for model in project_info['MODELS']:
-        currProject = getattr(vars()['projects'], model.split_entries()[0])()
-        model_name = currProject.get_model_name(model)
-        project_name = currProject.get_project_name(model)
-        info("", verbosity, 1)
-        info("MODEL = " + model_name + " (" + project_name + ")", verbosity, 1)
-
-        # variables needed for target variable, according to variable_defs
-        variable_defs_base_vars = currDiag.add_base_vars_fields(requested_vars, model)
-        # if not all variable_defs_base_vars are available, try to fetch
-        # the target variable directly (relevant for derived variables)
-        base_vars = currDiag.select_base_vars(variable_defs_base_vars,
-                                              model,
-                                              currProject,
-                                              project_info)
-
-        # process base variables
-        for base_var in base_vars:
-            if currDiag.id_is_explicitly_excluded(base_var, model):
-                continue
-            info("VARIABLE = " + base_var.var + " (" + base_var.fld + ")",
-                 verbosity, 1)
-
-            # Rewrite netcdf to expected input format.
-            info("Calling cmor_reformat.py to check/reformat model data",
-                 verbosity, 2)
-            reformat.cmor_reformat(currProject, project_info, base_var, model)
-
-    variables = currDiag.get_variables()
-    field_types = currDiag.get_field_types()
-
-    project_info['RUNTIME']['currDiag'] = currDiag
-    for derived_var, derived_field in zip(variables, field_types):
-        project_info['RUNTIME']['derived_var'] = derived_var
-        project_info['RUNTIME']['derived_field_type'] = derived_field
-
-        executable = "./interface_scripts/derive_var.ncl"
-        info("", verbosity, required_verbosity=1)
-        info("Calling " + executable + " for '" + derived_var + "'",
-             verbosity, required_verbosity=1)
-        projects.run_executable(executable, project_info, verbosity,
-                                exit_on_warning)
-    project_info['RUNTIME']['derived_var'] = "Undefined"
-
-    executable = "./diag_scripts/" + currDiag.get_diag_script()
-    configfile = currDiag.get_diag_script_cfg()
-    info("", verbosity, required_verbosity=1)
-    info("Running diag_script: " + executable, verbosity, required_verbosity=1)
-    info("with configuration file: " + configfile, verbosity,
-         required_verbosity=1)
-
-    projects.run_executable(executable,
-                            project_info,
-                            verbosity,
-                            exit_on_warning,
-                            launcher_arguments=currDiag.get_launcher_arguments())
+# Turn the diagnostics defined in project_info into a graph of
+# reformat -> derive_var -> diag_script tasks and run it; independent
+# tasks run concurrently if more than one job is requested
+task_run_dir = os.path.join(wrk_dir,
+                            os.path.splitext(input_xml_file)[0] + "_tasks")
+project_info['RUNTIME']['run_dir'] = task_run_dir
+project_info['RUNTIME']['jobs'] = options.jobs
+task_graph = scheduler.build_namelist_graph(project_info)
+if options.jobs > 1:
+    info("Running " + str(len(task_graph)) + " tasks with up to "
+         + str(options.jobs) + " parallel jobs, logs in "
+         + os.path.join(task_run_dir, "logs"), verbosity, 1)
+# Resources used by the launched stages and the timeline of the run,
+# summarized at the end
+resource_report.start_run(task_run_dir)
+tracing.start_run(task_run_dir)
+tracing.add_event(task_run_dir, "parse " + input_xml_file, "parse",
+                  parse_start, parse_end)
+try:
+    with tracing.span(task_run_dir, "run " + input_xml_file, "run"):
+        scheduler.run_tasks(task_graph,
+                            jobs=options.jobs,
+                            run_dir=task_run_dir,
+                            verbosity=verbosity,
+                            preload=scheduler.uses_python_worker(
+                                project_info))
+finally:
+    report_files = resource_report.write_report(
+        task_run_dir,
+        title="ESMValTool resource report: " + input_xml_file)
+    info("Resource report: " + " and ".join(report_files), verbosity, 1)
+    info("Timeline (chrome://tracing, Perfetto): "
+         + tracing.write_trace(task_run_dir), verbosity, 1)
 
 # delete environment variable
 del(os.environ['0_ESMValTool_version'])
@@ -20,6 +20,7 @@ mima_globmeandiff_r=[-1,1]
 trend = True
 anomalytrend = False
 trend_p=False
+#cores = 4 #processes for the pixelwise Kendall's tau
 
 # flags for specific diagnostics
 percentile = True
@@ -18,6 +18,7 @@ mima_globmeandiff_r=[-0.03,0.03]
 trend = False# True
 anomalytrend =False#True
 trend_p=False
+#preprocessing_workers = 4 #processes for the preprocessing of the observations (per year)
 
 # flags for specific diagnostics
 percentile = False#True
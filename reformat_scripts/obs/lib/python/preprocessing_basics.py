@@ -5,11 +5,147 @@ scripts in python.
 
 Most functions will write temporary files in a subdirectory "temp" that has to 
 be written beforehand and deleted afterwards 
+
+Chains of cdo operators should be built with CdoPipeline, which runs them as
+a single cdo call (one read and one write) instead of one call and one
+temporary file per operator.
 """
 
-import os, glob, tempfile, math, subprocess
+import os, glob, tempfile, math, subprocess, hashlib, json
 from cdo import Cdo
 
+
+class CdoPipeline(object):
+    """
+    lazy chain of cdo operators
+
+    Operators are only recorded; run() fuses them into a single chained cdo
+    command (operators with several inputs need a call of their own, unless
+    they are the last one). If an output file is given, run() records the
+    fused command and the state (size, mtime) of all input files next to it
+    and skips the execution if neither has changed since.
+
+    Example
+    -------
+    CdoPipeline(infile).then("monmean").then("remapcon", "t63grid").run(work_dir)
+    """
+
+    def __init__(self, source, operator=None, args=(), inputs=(),
+                 multi_input=False):
+        """
+        source : input file (or None for a combination of pipelines)
+        operator, args : last operator and its arguments
+        inputs : pipelines the operator is applied to
+        multi_input : whether the operator takes several inputs (see combine),
+                      even if it is given a single one
+        """
+        self.source = source
+        self.operator = operator
+        self.args = [str(a) for a in args]
+        self.inputs = list(inputs)
+        self.multi_input = multi_input
+
+    def then(self, operator, *args):
+        """ returns a new pipeline applying operator to the result """
+        return CdoPipeline(None, operator, args, [self])
+
+    @classmethod
+    def combine(cls, operator, pipelines, *args):
+        """ returns a pipeline applying a multi-input operator (e.g. enssum,
+        merge) to the results of several pipelines or files """
+        pipelines = [p if isinstance(p, CdoPipeline) else cls(p)
+                     for p in pipelines]
+        return cls(None, operator, args, pipelines, multi_input=True)
+
+    def files(self):
+        """ all input files of the pipeline """
+        if self.operator is None:
+            return [self.source]
+        return sum([p.files() for p in self.inputs], [])
+
+    def _input_string(self):
+        return " ".join([p.chain() for p in self.inputs])
+
+    def chain(self):
+        """ the pipeline as (nested) cdo input string """
+        if self.operator is None:
+            return self.source
+        return "-" + ",".join([self.operator] + self.args) + " " + \
+            self._input_string()
+
+    def recipe(self, options):
+        """ the fused command and the state of its inputs """
+        stamps = []
+        for f in self.files():
+            st = os.stat(f)
+            stamps.append([os.path.abspath(f), st.st_size, st.st_mtime])
+        return {'command': self.chain(), 'options': options, 'inputs': stamps}
+
+    def _execute(self, output, options):
+        cdo = Cdo()
+        getattr(cdo, self.operator)(*self.args,
+                                    input=self._input_string(),
+                                    output=output,
+                                    options=options)
+
+    def _materialize(self, tmp_dir, options, temps):
+        """
+        cdo accepts operators with several inputs (enssum, merge, ...) only
+        as the outermost operator, nested ones (built by combine, also with a
+        single input) are run on their own into temporary files (appended to
+        temps)
+        """
+        inputs = []
+        for p in self.inputs:
+            p = p._materialize(tmp_dir, options, temps)
+            if p.multi_input:
+                fd, path = tempfile.mkstemp(suffix=".nc", dir=tmp_dir)
+                os.close(fd)
+                temps.append(path)
+                p._execute(path, options)
+                p = CdoPipeline(path)
+            inputs.append(p)
+        return CdoPipeline(self.source, self.operator, self.args, inputs,
+                           self.multi_input)
+
+    def run(self, work_dir=None, output=None, options='-f nc4 -b F32'):
+        """
+        execute the pipeline as a single cdo call
+
+        work_dir : the output is written to a new file in work_dir/temp if
+                   no output is given
+        output : output file, kept if the recipe is unchanged
+        options : cdo options
+        """
+        assert self.operator is not None, "Nothing to run in the pipeline!"
+
+        stamp = None
+        if output is None:
+            output = work_dir + os.sep + "temp" + os.sep + \
+                tempfile.NamedTemporaryFile().name.split('/')[-1]
+        else:
+            key = hashlib.sha1(json.dumps(self.recipe(options),
+                                          sort_keys=True)).hexdigest()
+            stamp = output + ".recipe"
+            if os.path.isfile(output) and os.path.isfile(stamp):
+                with open(stamp) as f:
+                    if f.read().strip() == key:
+                        return output
+            if os.path.isfile(stamp):
+                os.remove(stamp)
+
+        temps = []
+        try:
+            pipeline = self._materialize(os.path.dirname(output), options, temps)
+            pipeline._execute(output, options)
+        finally:
+            for f in temps:
+                os.remove(f)
+        if stamp is not None:
+            with open(stamp, "w") as f:
+                f.write(key)
+        return output
+
         
 def _get_files_in_directory(directory, pattern, asstring=True):
     """ returns list and number of files with pattern in directory """
@@ -59,10 +195,8 @@ def _aggregate_obs_from_files(work_dir,file_list):
 def _aggregate_timestep(work_dir,infile,timestep,remove=True):
     """ aggregate infile to timestep """
     """ currenty only monthly """
-    cdo=Cdo()
-    oname=work_dir + os.sep + "temp" + os.sep + tempfile.NamedTemporaryFile().name.split('/')[-1]
     if timestep=="monthly":
-        cdo.monmean(input=infile,output=oname,options='-f nc4 -b F32')
+        oname=_timestep_pipeline(infile,timestep).run(work_dir)
         if remove:
             os.remove(infile)
     else:
@@ -74,35 +208,21 @@ def _aggregate_specific_years(work_dir,infile,times,remove=True):
     """ aggregate infile to times with mean and sd"""
     
     cdo=Cdo()
-    onameM=work_dir + os.sep + "temp" + os.sep + tempfile.NamedTemporaryFile().name.split('/')[-1]
-    onameS=work_dir + os.sep + "temp" + os.sep + tempfile.NamedTemporaryFile().name.split('/')[-1]
-    oname=work_dir + os.sep + "temp" + os.sep + tempfile.NamedTemporaryFile().name.split('/')[-1]
-    tmpname=work_dir + os.sep + "temp" + os.sep + tempfile.NamedTemporaryFile().name.split('/')[-1]
-    cdo.selyear(",".join([str(t) for t in times]),input=infile,output=tmpname,options='-f nc4 -b F32')
-    cdo.timselmean(12,input=tmpname,output=onameM,options='-f nc4 -b F32')
-    #cdo.timselstd(12,input=tmpname,output=onameS,options='-f nc4 -b F32')
-    name=cdo.showname(input=onameM)
-    cdo.setname(name[0] + "_std -timselstd,12",input=tmpname,output=onameS,options='-L -f nc4 -b F32')
-    cdo.merge(input=[onameM,onameS],output=oname)
+    name=cdo.showname(input=infile)
+    years=CdoPipeline(infile).then("selyear",*times)
+    oname=CdoPipeline.combine("merge",
+                              [years.then("timselmean",12),
+                               years.then("timselstd",12).then("setname",name[0] + "_std")]
+                              ).run(work_dir,options='-L -f nc4 -b F32')
     if remove:
         os.remove(infile)
-    os.remove(tmpname)
-    os.remove(onameM)
-    os.remove(onameS)
         
     return oname
     
 def _aggregate_resolution(work_dir,infile,resolution,remove=True):
     """ aggregate infile to resolution """
     """ currenty only T63, T85 """
-    cdo=Cdo()
-    oname=work_dir + os.sep + "temp" + os.sep + tempfile.NamedTemporaryFile().name.split('/')[-1]
-    if resolution=="T63":
-        cdo.remapcon('t63grid',input=infile,output=oname,options='-f nc4 -b F32')
-    elif resolution=="T85":
-        cdo.remapcon('t85grid',input=infile,output=oname,options='-f nc4 -b F32')
-    else:
-        assert False, "This resolution cannot be handled yet."
+    oname=_resolution_pipeline(infile,resolution).run(work_dir)
         
     if remove:
         os.remove(infile)   
@@ -111,18 +231,14 @@ def _aggregate_resolution(work_dir,infile,resolution,remove=True):
     
 def _select_variable(work_dir,infile,variablename,remove=False):
     """ select variables from infile """
-    cdo=Cdo()
-    oname=work_dir + os.sep + "temp" + os.sep + tempfile.NamedTemporaryFile().name.split('/')[-1]
-    cdo.selname(variablename,input=infile,output=oname,options='-f nc4 -b F32')
+    oname=CdoPipeline(infile).then("selname",variablename).run(work_dir)
     if remove:
         os.remove(infile)
     return oname
     
 def _sum_files(work_dir,infiles,remove=True):
     """ sum up all infiles """
-    cdo=Cdo()
-    oname=work_dir + os.sep + "temp" + os.sep + tempfile.NamedTemporaryFile().name.split('/')[-1]
-    cdo.enssum(input=" ".join(infiles),output=oname,options='-f nc4 -b F32')
+    oname=CdoPipeline.combine("enssum",infiles).run(work_dir)
     if remove:
         for ifi in infiles:
             os.remove(ifi)
@@ -131,31 +247,31 @@ def _sum_files(work_dir,infiles,remove=True):
 def _extract_variables(work_dir,infile,variablenames,newvarname,remove=True):
     """ select, sum up and rename variable(s) from infile """
     
-    tmpname=work_dir + os.sep + "temp" + os.sep + tempfile.NamedTemporaryFile().name.split('/')[-1]
-    oname=work_dir + os.sep + "temp" + os.sep + tempfile.NamedTemporaryFile().name.split('/')[-1]
-    selfilenames=[]
-    
-    stop=0
-    
-    varnames=list(variablenames)
+    newname='_'.join(newvarname.split(" "))
     
-    while len(varnames)>stop:
-        
-        v=varnames[0]
-        thisfile=_select_variable(infile,v)
-        selfilenames.insert(0,thisfile)
-        varnames.remove(v)
-        
-    thisfile=_sum_files(selfilenames)
-    
-    # adjust variable name and time axis
-    cdo=Cdo()
-    cdo.setname('_'.join(newvarname.split(" ")),input=thisfile,output=tmpname,options='-f nc4 -b F32')
-    cdo.settaxis(infile.split("-")[-2]+"-01-01","00:00",input=tmpname,output=oname,options='-f nc4 -b F32')
-    subprocess.call(['ncatted', '-O', '-a', 'units,' + '_'.join(newvarname.split(" ")) + ',c,c,%', oname])
+    # select and sum up the variables, rename and adjust the time axis in one go
+    oname=CdoPipeline.combine("enssum",
+                              [CdoPipeline(infile).then("selname",v) for v in variablenames]
+                              ).then("setname",newname
+                              ).then("settaxis",infile.split("-")[-2]+"-01-01","00:00"
+                              ).run(work_dir)
+    subprocess.call(['ncatted', '-O', '-a', 'units,' + newname + ',c,c,%', oname])
     
-    if remove:
-        os.remove(thisfile)
-        os.remove(tmpname)
+    # no intermediate files left to remove
     return oname
-    
+
+def _timestep_pipeline(infile,timestep):
+    """ pipeline aggregating infile to timestep (currently only monthly) """
+    source=infile if isinstance(infile,CdoPipeline) else CdoPipeline(infile)
+    if timestep=="monthly":
+        return source.then("monmean")
+    assert False, "This timestep cannot be handled yet."
+
+def _resolution_pipeline(infile,resolution):
+    """ pipeline aggregating infile to resolution (currently only T63, T85) """
+    source=infile if isinstance(infile,CdoPipeline) else CdoPipeline(infile)
+    if resolution=="T63":
+        return source.then("remapcon","t63grid")
+    elif resolution=="T85":
+        return source.then("remapcon","t85grid")
+    assert False, "This resolution cannot be handled yet."
@@ -76,7 +76,7 @@ pathname = os.path.dirname(sys.argv[0])
 os.chdir(os.path.abspath(pathname))
 sys.path.append(basicpath)
 
-from preprocessing_basics import _get_files_in_directory
+from preprocessing_basics import _get_files_in_directory, CdoPipeline
 
 
 
@@ -153,53 +153,31 @@ def _preprocess_observations(mainfile,outpath,translist,timestep,var,year,check_
         
     elif ((mf_bool or of_bool) and force) or not check_folder is None:
 
-        tmpfile1=outpath + os.sep + "temp" + os.sep + tempfile.NamedTemporaryFile().name.split('/')[-1]
-        tmpfile2=outpath + os.sep + "temp" + os.sep + tempfile.NamedTemporaryFile().name.split('/')[-1]
-
-
-        cdo=Cdo() 
-
-        #select data depending on translatorlist
-        files=_select_given_names(outpath,file_list[0],translist[var],remove=False)
-
-        #sum data
-        cdo.enssum(input=files,output=tmpfile1,options='-f nc4 -b F32')
-        [os.remove(f) for f in files]
+        #select data depending on translatorlist and sum data
+        summed=CdoPipeline.combine("enssum",_select_given_names(file_list[0],translist[var]))
 
         #chain: change name, multiply by 100 for "%", setunit to "%", duplicate for length of time range, set time axis, set day to 15, set reference time, calender and time units 
+        #all in a single cdo call, skipped if inputs and chain did not change
         
-        cdo.settunits("seconds",input="-setcalendar,standard -setreftime,1970-01-01,00:00:00 -settaxis," + str(start_year) + "-01-15,12:00:00,1month -duplicate," + str((stop_year-start_year+1)*12) + " -mulc,100 -setunit,% -setmissval,1e20 -setctomiss,0 -setname," + var + " " + tmpfile1,output=tmpfile2,options='-f nc4 -b F32')
-
-        subprocess.call(['cp',tmpfile2,ofile])
-        
-        os.remove(tmpfile1)        
-        os.remove(tmpfile2)
+        summed.then("setname",var
+             ).then("setctomiss",0
+             ).then("setmissval","1e20"
+             ).then("setunit","%"
+             ).then("mulc",100
+             ).then("duplicate",(stop_year-start_year+1)*12
+             ).then("settaxis",str(start_year) + "-01-15","12:00:00","1month"
+             ).then("setreftime","1970-01-01","00:00:00"
+             ).then("setcalendar","standard"
+             ).then("settunits","seconds"
+             ).run(output=ofile)
         
     else:
         print mainfile
         assert False, "cannot find any files!" 
         
-def _select_given_names(work_dir,infile,translist,remove=True):
-    """ select names by list """
-    cdo=Cdo()
-    
-    tmplist=[]
-
-    if not (os.path.exists(work_dir + os.sep + "temp")):
-        os.makedirs(work_dir + os.sep + "temp")
-
-    for element in translist:
-        tmpfile=work_dir + os.sep + "temp" + os.sep + tempfile.NamedTemporaryFile().name.split('/')[-1]
-#        cdo.selname(element,input=infile,output=tmpfile,options='-f nc4 -b F32')
-        cdo.setmisstoc(0,input = "-selvar," + element + " " + infile, output = tmpfile, options = '-f nc4 -b F32')
-        
-        tmplist.append(tmpfile)
-    
-    if remove:
-        os.remove(infile)
-            
-        
-    return tmplist
+def _select_given_names(infile,translist):
+    """ pipelines selecting the names in the list (missing values set to 0) """
+    return [CdoPipeline(infile).then("selvar",element).then("setmisstoc",0) for element in translist]
     
 if __name__ == "__main__":
     main()
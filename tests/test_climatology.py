@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of ESMValTool
+
+
+"""
+Tests are implemented using *assert* statements
+"""
+
+import sys
+import os
+
+import unittest
+import numpy as np
+
+
+class TestClimatology(unittest.TestCase):
+
+    def setUp(self):
+        # to allow that test find the ESMValTool modules, we add here pathes to the system path
+        esmval_path = os.path.dirname(os.path.realpath(__file__)) + os.sep + '..' + os.sep
+        sys.path.append(os.path.join(esmval_path, "diag_scripts", "lib",
+                                     "python"))
+        self.data = np.random.RandomState(0).rand(36, 4, 5)
+
+    def test_days_per_month(self):
+        from climatology import days_per_month
+        self.assertEqual(days_per_month(14, 2000).tolist(),
+                         [31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31,
+                          31, 28])
+        self.assertEqual(days_per_month(2, 1999, start_month=12,
+                                        calendar='noleap').tolist(),
+                         [31, 31])
+        self.assertEqual(days_per_month(3, 2000, calendar='360_day').tolist(),
+                         [30, 30, 30])
+        with self.assertRaises(ValueError):
+            days_per_month(1, 2000, calendar='no-such-calendar')
+
+    def test_monthly_climatology(self):
+        from climatology import monthly_climatology, _loop_monthly
+        np.testing.assert_allclose(monthly_climatology(self.data),
+                                   _loop_monthly(self.data))
+        # incomplete last year, time series starting in July
+        climatology = monthly_climatology(self.data[:30], start_month=7)
+        np.testing.assert_allclose(climatology[0],
+                                   self.data[6:30:12].mean(axis=0))
+
+    def test_seasonal_mean(self):
+        from climatology import seasonal_mean, _loop_seasonal
+        np.testing.assert_allclose(seasonal_mean(self.data, [12, 1, 2]),
+                                   _loop_seasonal(self.data, [12, 1, 2]))
+        # weights along the time axis
+        weights = np.arange(1., 37.)
+        select = [0, 1, 11, 12, 13, 23, 24, 25, 35]
+        np.testing.assert_allclose(
+            seasonal_mean(self.data, [12, 1, 2], weights=weights),
+            np.average(self.data[select], axis=0, weights=weights[select]))
+
+    def test_masked_values(self):
+        from climatology import time_mean
+        data = np.ma.masked_array(self.data, self.data > 0.5)
+        data[:, 0, 0] = np.ma.masked
+        means = time_mean(data)
+        self.assertTrue(means.mask[0, 0])
+        valid = self.data[:, 1, 1][self.data[:, 1, 1] <= 0.5]
+        self.assertAlmostEqual(means[1, 1], valid.mean())
+
+    def test_seasonal_series(self):
+        from climatology import seasonal_series, annual_means
+        # December counts to the following year for DJF
+        series = seasonal_series(self.data, [12, 1, 2])
+        self.assertEqual(len(series), 4)
+        np.testing.assert_allclose(series[1],
+                                   self.data[[11, 12, 13]].mean(axis=0))
+        np.testing.assert_allclose(series[3], self.data[35])
+        np.testing.assert_allclose(annual_means(self.data)[2],
+                                   self.data[24:36].mean(axis=0))
+
+    def test_dimension_means(self):
+        from climatology import dimension_means
+        np.testing.assert_allclose(dimension_means(self.data, 1),
+                                   self.data.mean(axis=(0, 2)))
+
+
+if __name__ == "__main__":
+    unittest.main()
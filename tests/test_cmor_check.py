@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of ESMValTool
+
+
+"""
+Tests are implemented using *assert* statements
+"""
+
+import sys
+import os
+import shutil
+import tempfile
+
+import unittest
+
+try:
+    import netCDF4
+except ImportError:
+    netCDF4 = None
+
+
+class TestCmorCheck(unittest.TestCase):
+
+    def setUp(self):
+        # to allow that test find the ESMValTool modules, we add here pathes to the system path
+        esmval_path = os.path.dirname(os.path.realpath(__file__)) + os.sep + '..' + os.sep
+        sys.path.append(esmval_path)
+        sys.path.append(os.path.join(esmval_path, "interface_scripts"))
+
+        self.cwd = os.getcwd()
+        os.chdir(esmval_path)
+        self.tmpdir = tempfile.mkdtemp()
+        self.runtime = {'project_basename': 'CMIP5', 'model': 'ACCESS1-0'}
+        self.temporary = {'infile_path': '/data/tas_Amon_ACCESS1-0_*.nc',
+                          'variable': 'tas',
+                          'field': 'T2Ms',
+                          'start_year': '2000',
+                          'end_year': '2001'}
+        self.script = os.path.join('reformat_scripts', 'default',
+                                   'reformat_default_main.ncl')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+    def test_cmor_units(self):
+        import cmor_check
+        self.assertEqual(cmor_check.get_cmor_units('tas'), 'K')
+        self.assertEqual(cmor_check.get_cmor_units('no-such-variable'), None)
+        # values as read by read_cmor (second ':'-separated field)
+        attributes = cmor_check.get_cmor_attributes('tas')
+        self.assertEqual(attributes['cell_methods'], 'time')
+        self.assertEqual(attributes['long_name'],
+                         'Near-Surface Air Temperature')
+        self.assertEqual(sorted(attributes),
+                         ['cell_measures', 'cell_methods', 'long_name',
+                          'standard_name', 'units'])
+
+    def test_check_job(self):
+        import cmor_check
+        self.assertEqual(cmor_check.check_job(self.script, self.runtime,
+                                              self.temporary, ['a.nc']),
+                         None)
+        self.assertNotEqual(cmor_check.check_job(self.script, self.runtime,
+                                                 self.temporary,
+                                                 ['a.nc', 'b.nc']), None)
+        self.assertNotEqual(cmor_check.check_job(
+            os.path.join('reformat_scripts', 'EMAC', 'reformat_EMAC_main.ncl'),
+            self.runtime, self.temporary, ['a.nc']), None)
+        # model fixes need the reformat script
+        runtime = dict(self.runtime, model='CanESM2')
+        self.assertNotEqual(cmor_check.check_job(self.script, runtime,
+                                                 self.temporary, ['a.nc']),
+                            None)
+        temporary = dict(self.temporary, field='T2Ds')
+        self.assertNotEqual(cmor_check.check_job(self.script, self.runtime,
+                                                 temporary, ['a.nc']), None)
+
+    def test_link(self):
+        import cmor_check
+        source = os.path.join(self.tmpdir, 'source.nc')
+        target = os.path.join(self.tmpdir, 'climo', 'target.nc')
+        os.mkdir(os.path.dirname(target))
+        with open(source, 'w') as f:
+            f.write('data')
+        cmor_check.link(source, target)
+        cmor_check.link(source, target)
+        self.assertTrue(os.path.islink(target))
+        with open(target) as f:
+            self.assertEqual(f.read(), 'data')
+
+    def write_file(self, path, months=24, units='K', lat=(-45., 45.),
+                   time_units='days since 1950-01-01 00:00:00', day=15,
+                   cell_methods='time'):
+        import cmor_check
+        dataset = netCDF4.Dataset(path, 'w')
+        dataset.createDimension('time', None)
+        dataset.createDimension('lat', len(lat))
+        dataset.createDimension('lon', 3)
+        time = dataset.createVariable('time', 'f8', ('time',))
+        time.setncatts(cmor_check.COORDINATE_ATTRIBUTES['time'])
+        time.units = time_units
+        time.calendar = '360_day'
+        time[:] = [(2000 - 1950) * 360. + day - 1 + 30 * month
+                   for month in range(months)]
+        for name, values in [('lat', lat), ('lon', [0., 120., 240.])]:
+            coord = dataset.createVariable(name, 'f8', (name,))
+            coord.setncatts(cmor_check.COORDINATE_ATTRIBUTES[name])
+            coord[:] = values
+        tas = dataset.createVariable('tas', 'f4', ('time', 'lat', 'lon'),
+                                     fill_value=1.e20)
+        tas.setncatts(cmor_check.get_cmor_attributes('tas'))
+        tas.units = units
+        tas.cell_methods = cell_methods
+        tas[:] = 280.
+        dataset.close()
+
+    @unittest.skipIf(netCDF4 is None, "netCDF4 is not available")
+    def test_check_file(self):
+        import cmor_check
+        path = os.path.join(self.tmpdir, 'tas.nc')
+        self.write_file(path)
+        self.assertEqual(cmor_check.check_file(path, 'tas', 'T2Ms',
+                                               2000, 2001), None)
+        self.assertNotEqual(cmor_check.check_file(path, 'tas', 'T2Ms',
+                                                  2000, 2002), None)
+        self.assertNotEqual(cmor_check.check_file(path, 'tas', 'T3M',
+                                                  2000, 2001), None)
+        self.write_file(path, units='degC')
+        self.assertNotEqual(cmor_check.check_file(path, 'tas', 'T2Ms',
+                                                  2000, 2001), None)
+        self.write_file(path, lat=(45., -45.))
+        self.assertNotEqual(cmor_check.check_file(path, 'tas', 'T2Ms',
+                                                  2000, 2001), None)
+        # what time_attrib, check_time_range and var_attrib would change
+        self.write_file(path, time_units='days since 2000-01-01')
+        self.assertNotEqual(cmor_check.check_file(path, 'tas', 'T2Ms',
+                                                  2000, 2001), None)
+        self.write_file(path, day=16)
+        self.assertNotEqual(cmor_check.check_file(path, 'tas', 'T2Ms',
+                                                  2000, 2001), None)
+        self.write_file(path, cell_methods='time: mean')
+        self.assertNotEqual(cmor_check.check_file(path, 'tas', 'T2Ms',
+                                                  2000, 2001), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of ESMValTool
+
+
+"""
+Tests are implemented using *assert* statements
+"""
+
+import sys
+import os
+import ConfigParser
+
+import unittest
+import numpy as np
+
+try:
+    import netCDF4
+except ImportError:
+    netCDF4 = None
+
+
+class RecordingVariable(object):
+    """ (time, lat, lon) array recording the slices read from it """
+    def __init__(self, data):
+        self.data = data
+        self.shape = data.shape
+        self.reads = []
+
+    def __getitem__(self, key):
+        self.reads.append(key)
+        return self.data[key]
+
+
+class Diagnostic(object):
+    def get_diag_script_cfg(self):
+        return 'cfg_test.py'
+
+
+class Dataset(object):
+    def __init__(self, data, lats, lons):
+        self.variables = {'lat': lats, 'lon': lons,
+                          'tas': RecordingVariable(data)}
+
+
+@unittest.skipIf(netCDF4 is None, "netCDF4 is not available")
+class TestESMValProject(unittest.TestCase):
+
+    def setUp(self):
+        # to allow that test find the ESMValTool modules, we add here pathes to the system path
+        esmval_path = os.path.dirname(os.path.realpath(__file__)) + os.sep + '..' + os.sep
+        sys.path.append(os.path.join(esmval_path, "interface_scripts"))
+        sys.path.append(os.path.join(esmval_path, "diag_scripts", "lib",
+                                     "python"))
+
+        from esmval_lib import ESMValProject
+        self.E = ESMValProject({'GLOBAL': {},
+                                'RUNTIME': {'currDiag': Diagnostic()}})
+        self.lats = np.arange(-85., 90., 10.)
+        self.lons = np.arange(0., 360., 10.)
+        self.data = np.random.rand(24, len(self.lats), len(self.lons))
+        self.datafile = Dataset(self.data, self.lats, self.lons)
+
+    def get_config(self, lon_min, lon_max, lat_min=-25, lat_max=25):
+        modelconfig = ConfigParser.ConfigParser()
+        modelconfig.add_section('general')
+        modelconfig.set('general', 'mask_unwanted_values', 'False')
+        modelconfig.add_section('equatorial_test')
+        for key, value in [('lat_min', lat_min), ('lat_max', lat_max),
+                           ('lon_min', lon_min), ('lon_max', lon_max)]:
+            modelconfig.set('equatorial_test', key, str(value))
+        return modelconfig
+
+    def get_model_data(self, modelconfig, extend=''):
+        return self.E.get_model_data(modelconfig, 'equatorial', 'test',
+                                     'tas', self.datafile, extend)
+
+    def test_region(self):
+        lats, lons, data = self.get_model_data(self.get_config(100, 200))
+        np.testing.assert_equal(lons, np.arange(100., 210., 10.))
+        np.testing.assert_equal(data, self.data[:, 6:12, 10:21])
+        self.assertEqual(len(self.datafile.variables['tas'].reads), 1)
+
+    def test_region_across_end_of_longitudes(self):
+        lats, lons, data = self.get_model_data(self.get_config(340, 20))
+        np.testing.assert_equal(lons, [340., 350., 0., 10., 20.])
+        np.testing.assert_equal(data, self.data[:, 6:12, [34, 35, 0, 1, 2]])
+        # two slices, nothing outside the area is read
+        reads = self.datafile.variables['tas'].reads
+        self.assertEqual([key[2] for key in reads],
+                         [slice(34, 36), slice(0, 3)])
+
+    def test_ghost_layers(self):
+        lats, lons, data = self.get_model_data(self.get_config(0, 20),
+                                               extend='lons')
+        np.testing.assert_equal(lons, [350., 0., 10., 20., 30.])
+        np.testing.assert_equal(data[:, :, 0], self.data[:, 6:12, 35])
+        self.assertEqual([key[2] for key in
+                          self.datafile.variables['tas'].reads],
+                         [slice(35, 36), slice(0, 4)])
+
+        # global longitudes
+        lats, lons, data = self.get_model_data(self.get_config(0, 350),
+                                               extend='both')
+        np.testing.assert_equal(lons, np.arange(-10., 370., 10.))
+        self.assertEqual(len(lats), 8)
+        np.testing.assert_equal(data[:, 1:-1, -1], self.data[:, 6:12, 0])
+
+    def test_iter_model_data(self):
+        modelconfig = self.get_config(340, 20)
+        blocks = list(self.E.iter_model_data(modelconfig, 'equatorial',
+                                             'test', 'tas', self.datafile,
+                                             block_size=10))
+        self.assertEqual([times for times, block in blocks],
+                         [slice(0, 10), slice(10, 20), slice(20, 24)])
+        np.testing.assert_equal(
+            np.concatenate([block for times, block in blocks]),
+            self.get_model_data(modelconfig)[2])
+
+    def test_get_jobs(self):
+        self.assertEqual(self.E.get_jobs(), 1)
+        self.E.project_info['RUNTIME']['jobs'] = 4
+        self.assertEqual(self.E.get_jobs(), 4)
+
+    def test_average_data(self):
+        data = np.ma.masked_array(self.data, self.data > 0.9)
+        np.testing.assert_allclose(
+            self.E.average_data(data, 'annual')[1],
+            data[1::12].mean(axis=0).filled(np.nan))
+        np.testing.assert_allclose(self.E.average_data(data, 1),
+                                   data.mean(axis=(0, 2)))
+
+    def test_extract_seasonal_mean_values(self):
+        modelconfig = ConfigParser.ConfigParser()
+        modelconfig.add_section('equatorial_season_DJF')
+        modelconfig.set('equatorial_season_DJF', 'season_months', '12 1 2')
+        means = self.E.extract_seasonal_mean_values(modelconfig, self.data,
+                                                    'equatorial', 'DJF')
+        np.testing.assert_allclose(
+            means, self.data[[0, 1, 11, 12, 13, 23]].mean(axis=0))
+        monthly = self.E.extract_seasonal_mean_values(
+            modelconfig, self.data, 'equatorial', 'DJF', monthly=True)
+        self.assertEqual(monthly.mask[:, 0, 0].tolist(),
+                         ([False] * 2 + [True] * 9 + [False]) * 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of ESMValTool
+
+
+"""
+Tests are implemented using *assert* statements
+"""
+
+import sys
+import os
+import shutil
+import tempfile
+import time
+
+import unittest
+
+
+class TestFileCatalogue(unittest.TestCase):
+
+    def setUp(self):
+        # to allow that test find the ESMValTool modules, we add here pathes to the system path
+        esmval_path = os.path.dirname(os.path.realpath(__file__)) + os.sep + '..' + os.sep
+        sys.path.append(esmval_path)
+        sys.path.append(os.path.join(esmval_path, "interface_scripts"))
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.datadir = os.path.join(self.tmpdir, 'data')
+        os.makedirs(self.datadir)
+        for name in ['tas_Amon_MPI-ESM-LR_historical_r1i1p1_185001-194912.nc',
+                     'tas_Amon_MPI-ESM-LR_historical_r1i1p1_195001-200512.nc',
+                     'pr_Amon_MPI-ESM-LR_historical_r1i1p1_185001-200512.nc']:
+            self.touch(name)
+        self.db_path = os.path.join(self.tmpdir, 'catalogue.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def touch(self, name):
+        with open(os.path.join(self.datadir, name), 'w') as f:
+            f.write('')
+
+    def test_drs_facets(self):
+        from interface_scripts.file_catalogue import drs_facets
+        self.assertEqual(drs_facets('tas_Amon_MPI-ESM-LR_historical_r1i1p1_185001-200512.nc'),
+                         ['tas', 'Amon', 'MPI-ESM-LR', 'historical', 'r1i1p1', 1850, 2005])
+        self.assertEqual(drs_facets('tas_Amon_MPI-ESM-LR_historical_r1i1p1.nc'),
+                         ['tas', 'Amon', 'MPI-ESM-LR', 'historical', 'r1i1p1', None, None])
+
+    def test_lookups(self):
+        from interface_scripts.file_catalogue import FileCatalogue
+        catalogue = FileCatalogue(self.db_path)
+        pattern = os.path.join(self.datadir, 'tas_Amon_MPI-ESM-LR_historical_r1i1p1*.nc')
+        self.assertEqual(len(catalogue.glob(pattern)), 2)
+        self.assertTrue(catalogue.isfile(os.path.join(
+            self.datadir, 'pr_Amon_MPI-ESM-LR_historical_r1i1p1_185001-200512.nc')))
+        self.assertFalse(catalogue.isfile(os.path.join(self.datadir, 'missing.nc')))
+        found = catalogue.find(self.datadir, var='tas', model='MPI-ESM-LR')
+        self.assertEqual([(start, end) for path, start, end in found],
+                         [(1850, 1949), (1950, 2005)])
+
+    def test_incremental_refresh(self):
+        from interface_scripts.file_catalogue import FileCatalogue
+        FileCatalogue(self.db_path).scan(self.tmpdir)
+
+        # a new file changes the directory mtime, a new process rescans
+        time.sleep(0.01)
+        self.touch('tas_Amon_MPI-ESM-LR_historical_r1i1p1_200601-201012.nc')
+        catalogue = FileCatalogue(self.db_path)
+        pattern = os.path.join(self.datadir, 'tas_*.nc')
+        self.assertEqual(len(catalogue.glob(pattern)), 3)
+
+    def test_scan_without_stat(self):
+        from interface_scripts import file_catalogue
+        isfile = os.path.isfile
+
+        def no_stat(path):
+            raise AssertionError("stat of " + path)
+        os.path.isfile = no_stat
+        try:
+            file_catalogue.FileCatalogue(self.db_path).scan(self.tmpdir)
+        finally:
+            os.path.isfile = isfile
+        catalogue = file_catalogue.FileCatalogue(self.db_path)
+        self.assertEqual(len(catalogue.glob(os.path.join(self.datadir,
+                                                         '*.nc'))), 3)
+
+    def test_default_catalogue(self):
+        # shared by the (forked) tasks of a run
+        from interface_scripts.file_catalogue import get_catalogue, \
+            CATALOGUE_FILE
+        run_dir = os.path.join(self.tmpdir, 'run')
+        catalogue = get_catalogue({'RUNTIME': {'run_dir': run_dir}})
+        self.assertEqual(catalogue.db_path,
+                         os.path.join(run_dir, CATALOGUE_FILE))
+        self.assertTrue(os.path.isfile(catalogue.db_path))
+        self.assertEqual(get_catalogue({}).db_path, ':memory:')
+
+    def test_covering(self):
+        from interface_scripts.file_catalogue import covering
+        ranges = [('a', 1850, 1899), ('b', 1900, 1949), ('c', 1950, 2005),
+                  ('d', 1850, 2005)]
+        self.assertEqual(covering(ranges[:3], 1920, 1930), ['b'])
+        self.assertEqual(covering(ranges[:3], 1940, 1960), ['b', 'c'])
+        self.assertEqual(covering(ranges, 1890, 1960), ['d'])
+        # not covered completely: all overlapping files
+        self.assertEqual(covering(ranges[:1] + ranges[2:3], 1890, 1960),
+                         ['a', 'c'])
+        self.assertEqual(covering(ranges, 2010, 2020), [])
+
+    def test_select_years(self):
+        from interface_scripts.file_catalogue import select_years
+        project_info = {'GLOBAL': {'file_catalogue': self.db_path}}
+        pattern = os.path.join(self.datadir, 'tas_Amon_MPI-ESM-LR_historical_r1i1p1*.nc')
+        self.assertEqual(select_years(project_info, pattern, 1990, 1999),
+                         [os.path.join(self.datadir, 'tas_Amon_MPI-ESM-LR_'
+                                       'historical_r1i1p1_195001-200512.nc')])
+        self.assertEqual(len(select_years(project_info, pattern, 1900, 2000)), 2)
+        self.assertEqual(select_years(project_info, pattern, 2010, 2020), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -110,6 +110,164 @@ class TestPythonLauncher(TestLauncher):
         with self.assertRaises(ValueError):
             L.execute(script, project_info, 0, False)
 
+    def test_python_launcher_abort_on_fatal(self):
+        # the subprocess is stopped at the first fatal line
+        import time
+        from interface_scripts.launchers import py_launcher
+        from interface_scripts.auxiliary import nclExecuteError
+
+        script = self.tmpdir + 'testscript_fatal.py'
+        o = open(script, 'w')
+        o.write('import sys, time\n')
+        o.write("sys.stdout.write('fatal: something went wrong\\n')\n")
+        o.write('sys.stdout.flush()\n')
+        o.write('time.sleep(30)\n')
+        o.close()
+
+        L = py_launcher(execute_as_shell=True)
+        start = time.time()
+        with self.assertRaises(nclExecuteError):
+            L.execute(script, {}, 0, False)
+        self.assertLess(time.time() - start, 20)
+
+    def test_python_launcher_execute_worker(self):
+        # execute launcher in a forked WORKER, the script module must not
+        # be imported in this process
+        from interface_scripts.launchers import py_launcher
+        from interface_scripts.auxiliary import nclExecuteError
+
+        testoutput = self.tmpdir + 'test_result_worker.json'
+        script = self.tmpdir + 'testscript_worker.py'
+        o = open(script, 'w')
+        o.write('import json\n')
+        o.write('def main(project_info):\n')
+        o.write("    json.dump(project_info, open('" + testoutput + "', 'w'))\n")
+        o.close()
+
+        L = py_launcher(execute_in_worker=True)
+        L.execute(script, {'A': 1}, 0, False)
+        self.assertTrue(os.path.exists(testoutput))
+        self.assertNotIn('testscript_worker', sys.modules)
+
+        o = open(script, 'w')
+        o.write('def main(project_info):\n')
+        o.write("    raise ValueError('failing diagnostic')\n")
+        o.close()
+        with self.assertRaises(nclExecuteError):
+            L.execute(script, {}, 0, False)
+
+class TestOutputFilter(TestLauncher):
+
+    def test_classifier(self):
+        from interface_scripts.launchers import ncl_launcher
+        classify = ncl_launcher().get_classifier().match
+        self.assertIsNotNone(classify('FATAL: x').group('fatal'))
+        self.assertIsNotNone(classify('fatal: error: x').group('error'))
+        self.assertIsNotNone(classify('a warning: x').group('warning'))
+        self.assertIsNone(classify('a warning: x').group('error'))
+        self.assertEqual(classify('info: x').groupdict().values(),
+                         [None, None, None])
+
+    def test_write_stdouterr(self):
+        from interface_scripts.launchers import ncl_launcher
+        from interface_scripts.auxiliary import nclExecuteWarning
+        L = ncl_launcher()
+        L.write_stdouterr(['info: a', 'error: b', 'warning: c'], 0, False)
+        with self.assertRaises(nclExecuteWarning):
+            L.write_stdouterr(['info: a', 'warning: c'], 0, True)
+
+    def test_write_stdouterr_ignore_file(self):
+        # the diagnostic script writes the ignore file while it is running
+        from interface_scripts.launchers import ncl_launcher
+        from interface_scripts.auxiliary import nclExecuteWarning
+        L = ncl_launcher()
+        L.get_interface_dir = lambda: self.tmpdir
+
+        def output():
+            yield 'info: a'
+            with open(os.path.join(self.tmpdir, 'warnings_to_ignore.txt'),
+                      'w') as f:
+                f.write('warning: c\n')
+            yield 'warning: c'
+        L.write_stdouterr(output(), 0, True)
+        with self.assertRaises(nclExecuteWarning):
+            L.write_stdouterr(['info: a', 'warning: d'], 0, True)
+
+# Stand-in for r_worker.r speaking the same request protocol: prints the
+# script name and the variable A, quits on 'quit.r' and hangs after a
+# fatal message on 'fatal.r'
+STUB_WORKER = """
+import os, sys, time
+request = {}
+for line in iter(sys.stdin.readline, ''):
+    key, value = line.rstrip('\\n').split(' ', 1)
+    if key == 'call':
+        request = {'token': value, 'env': {}}
+    elif key == 'env':
+        name, value = value.split('=', 1)
+        request['env'][name] = value
+    elif key == 'script':
+        if value == 'quit.r':
+            sys.exit(3)
+        sys.stdout.write(value + ' A=' + request['env'].get('A', '') + '\\n')
+        if value == 'fatal.r':
+            sys.stdout.write('fatal: stop\\n')
+            sys.stdout.flush()
+            time.sleep(60)
+        sys.stdout.write('\\n' + request['token'] + ' 0\\n')
+        sys.stdout.flush()
+"""
+
+class TestRSession(TestLauncher):
+
+    def setUp(self):
+        TestLauncher.setUp(self)
+        stub = os.path.join(self.tmpdir, 'stub_worker.py')
+        with open(stub, 'w') as f:
+            f.write(STUB_WORKER)
+        self.r_command = sys.executable + ' ' + stub
+
+    def run_script(self, session, script, env):
+        session.call(script, env)
+        lines = list(iter(session.stdout.readline, ''))
+        return [line for line in lines if line.strip()], session.wait()
+
+    def test_session_reuse(self):
+        from interface_scripts.launchers import r_session
+        session = r_session.get(self.r_command)
+        self.assertEqual(self.run_script(session, 'a.r', {'A': '1'}),
+                         (['a.r A=1\n'], 0))
+        session.release()
+        # the idle session runs the next script, with its own environment
+        self.assertTrue(r_session.get(self.r_command) is session)
+        self.assertEqual(self.run_script(session, 'b.r', {}),
+                         (['b.r A=\n'], 0))
+        session.shutdown()
+
+    def test_session_quit(self):
+        from interface_scripts.launchers import r_session
+        session = r_session.get(self.r_command)
+        self.assertEqual(self.run_script(session, 'quit.r', {}), ([], 3))
+        session.release()
+        replacement = r_session.get(self.r_command)
+        self.assertFalse(replacement is session)
+        self.assertEqual(self.run_script(replacement, 'a.r', {'A': '2'}),
+                         (['a.r A=2\n'], 0))
+        replacement.shutdown()
+
+    def test_session_abort(self):
+        from interface_scripts.launchers import r_session, r_launcher
+        from interface_scripts.auxiliary import nclExecuteError
+        session = r_session.get(self.r_command)
+        with self.assertRaises(nclExecuteError):
+            r_launcher().follow(session.call('fatal.r', {}), 0, False)
+        self.assertIsNotNone(session.process.poll())
+        replacement = r_session.get(self.r_command)
+        self.assertFalse(replacement is session)
+        self.assertEqual(self.run_script(replacement, 'a.r', {'A': '3'}),
+                         (['a.r A=3\n'], 0))
+        replacement.shutdown()
+
 class TestCSHLauncher(TestLauncher):
 
         def setUp(self):
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of ESMValTool
+
+
+"""
+Tests are implemented using *assert* statements
+"""
+
+import sys
+import os
+import shutil
+import stat
+import tempfile
+
+import unittest
+
+
+class TestManifest(unittest.TestCase):
+
+    def setUp(self):
+        # to allow that test find the ESMValTool modules, we add here pathes to the system path
+        esmval_path = os.path.dirname(os.path.realpath(__file__)) + os.sep + '..' + os.sep
+        sys.path.append(esmval_path)
+        sys.path.append(os.path.join(esmval_path, "interface_scripts"))
+
+        self.tmpdir = tempfile.mkdtemp()
+
+        # minimal ESMValTool-like root folder for the launch directories
+        self.root = os.path.join(self.tmpdir, 'root')
+        os.makedirs(os.path.join(self.root, 'interface_data', 'ncl_interface_templates'))
+        os.makedirs(os.path.join(self.root, 'diag_scripts'))
+        self.template = os.path.join(self.root, 'interface_data',
+                                     'ncl_interface_templates', 'ncl.tmpl')
+        with open(self.template, 'w') as f:
+            f.write('template')
+        self.n_render = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def render(self, target_dir):
+        self.n_render += 1
+        with open(os.path.join(target_dir, 'ncl.interface'), 'w') as f:
+            f.write('rendered')
+
+    def get_manifest(self, interface, rendered=None):
+        from interface_scripts.manifest import JobManifest, create_launch_dir
+        launch_dir = create_launch_dir(os.path.join(self.tmpdir, 'launches'),
+                                       'test', source_dir=self.root)
+        return JobManifest('ncl', 'diag_scripts/test.ncl',
+                           {'ESMValTool_cwd': launch_dir},
+                           interface, [self.template], launch_dir=launch_dir,
+                           rendered=rendered)
+
+    def test_launch_dir(self):
+        job = self.get_manifest({})
+        self.assertTrue(os.path.islink(os.path.join(job.launch_dir, 'diag_scripts')))
+        self.assertFalse(os.path.islink(job.get_interface_dir()))
+        self.assertTrue(os.path.islink(os.path.join(job.get_interface_dir(),
+                                                    'ncl_interface_templates')))
+        self.assertEqual(job.remove_launch_dir(), [])
+        self.assertFalse(os.path.exists(job.launch_dir))
+        self.assertTrue(os.path.isdir(os.path.join(self.root, 'diag_scripts')))
+
+        # output written into the launch directory is kept
+        job = self.get_manifest({})
+        os.mkdir(os.path.join(job.launch_dir, 'plots'))
+        self.assertEqual(job.remove_launch_dir(), ['plots'])
+        self.assertEqual(os.listdir(job.launch_dir), ['plots'])
+
+    def test_output_dirs(self):
+        from interface_scripts.manifest import make_output_dirs
+        global_section = {'plot_dir': ' ./plots_test/ ', 'wrk_dir': '../work',
+                          'climo_dir': os.path.join(self.tmpdir, 'climo'),
+                          'verbosity': 1}
+        make_output_dirs(global_section, source_dir=self.root)
+        self.assertEqual(global_section,
+                         {'plot_dir': os.path.join(self.root, 'plots_test', ''),
+                          'wrk_dir': os.path.join(self.tmpdir, 'work'),
+                          'climo_dir': os.path.join(self.tmpdir, 'climo'),
+                          'verbosity': 1})
+        for key in ['plot_dir', 'wrk_dir', 'climo_dir']:
+            self.assertTrue(os.path.isdir(global_section[key]))
+
+    def test_interface_cache(self):
+        from interface_scripts.manifest import JobManifest
+        cache_dir = os.path.join(self.tmpdir, 'cache')
+        first = self.get_manifest({'variables': ['tas'], 'currDiag': object()},
+                                  rendered=['variables'])
+        second = self.get_manifest({'variables': ['tas']})
+        other = self.get_manifest({'variables': ['pr']})
+        self.assertEqual(first.digest, second.digest)
+        self.assertNotEqual(first.digest, other.digest)
+
+        # rendered entries which are not JSON representable by their text
+        nested = self.get_manifest({'variables': [['tas', 'pr']]})
+        self.assertNotEqual(nested.digest, second.digest)
+        self.assertNotEqual(nested.digest, self.get_manifest(
+            {'variables': [['tas', 'ua']]}).digest)
+        self.assertEqual(nested.digest, self.get_manifest(
+            {'variables': [['tas', 'pr']]}).digest)
+
+        self.assertFalse(first.install_interface(cache_dir, self.render))
+        self.assertTrue(second.install_interface(cache_dir, self.render))
+        self.assertEqual(self.n_render, 1)
+        self.assertEqual(open(os.path.join(second.get_interface_dir(),
+                                           'ncl.interface')).read(), 'rendered')
+
+        path = second.write()
+        self.assertFalse(os.stat(path).st_mode & stat.S_IWUSR)
+        self.assertEqual(JobManifest.load(path).as_dict(), second.as_dict())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -36,6 +36,45 @@ class Test(unittest.TestCase):
         P = CMIP5()
         self.assertEqual(P.basename, 'CMIP5')
 
+    def test_model_sections_variable(self):
+        from interface_scripts.projects import CMIP5
+        from interface_scripts.model import Model
+        P = CMIP5()
+        M = Model('CMIP5 MPI-ESM-LR Amon historical r1i1p1 2000 2001 '
+                  '/data/${VARIABLE}', {}, False)
+        self.assertEqual(P.get_model_sections(M, 'tas')['dir'], '/data/tas')
+        self.assertEqual(P.get_model_sections(M, 'pr')['dir'], '/data/pr')
+        self.assertEqual(P.get_cf_sections(M, 'pr')[5], '/data/pr')
+        self.assertEqual(P.get_cf_areafile({}, M, 'tos'),
+                         '/data/tos/areacello_fx_MPI-ESM-LR_historical_'
+                         'r0i0p0.nc')
+        # no variable, no (environment) default
+        self.assertEqual(P.get_model_sections(M)['dir'], '/data/${VARIABLE}')
+        # the returned dictionary is a copy
+        P.get_model_sections(M, 'tas')['mip'] = 'day'
+        self.assertEqual(P.get_model_sections(M, 'tas')['mip'], 'Amon')
+
+    def test_memoized_outfile(self):
+        from interface_scripts.projects import get_project
+        from interface_scripts.model import Model
+        P = get_project('CMIP5')
+        self.assertTrue(get_project('CMIP5') is P)
+        M = Model('CMIP5 MPI-ESM-LR Amon historical r1i1p1 2000 2001 /data',
+                  {}, False)
+        project_info = {'GLOBAL': {'climo_dir': '/climo'}}
+        fullpath = P.get_cf_fullpath(project_info, M, 'T2Ms', 'tas',
+                                     'None', 'None')
+        self.assertEqual(fullpath, '/climo/CMIP5/CMIP5_Amon_historical_'
+                         'MPI-ESM-LR_r1i1p1_T2Ms_tas_2000-2001.nc')
+        self.assertEqual(P.get_cf_fullpath(project_info, M, 'T2Ms', 'tas',
+                                           'None', 'None'), fullpath)
+        self.assertEqual(P.get_cf_fullpath({'GLOBAL': {'climo_dir': '/c2'}},
+                                           M, 'T2Ms', 'tas', 'day', 'None'),
+                         '/c2/CMIP5/CMIP5_day_historical_'
+                         'MPI-ESM-LR_r1i1p1_T2Ms_tas_2000-2001.nc')
+        self.assertEqual(P.get_dict_key(M, 'None', 'rcp45'),
+                         'CMIP5_MPI-ESM-LR_Amon_rcp45_r1i1p1_2000_2001')
+
 
 if __name__ == "__main__":
     unittest.main()
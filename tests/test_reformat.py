@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of ESMValTool
+
+
+"""
+Tests are implemented using *assert* statements
+"""
+
+import sys
+import os
+import shutil
+import tempfile
+
+import unittest
+
+
+class TestReformatJobs(unittest.TestCase):
+
+    def setUp(self):
+        # to allow that test find the ESMValTool modules, we add here pathes to the system path
+        esmval_path = os.path.dirname(os.path.realpath(__file__)) + os.sep + '..' + os.sep
+        sys.path.append(esmval_path)
+        sys.path.append(os.path.join(esmval_path, "interface_scripts"))
+
+        self.variable_def_dir = os.path.join(esmval_path, "variable_defs")
+        self.tmpdir = tempfile.mkdtemp()
+        self.project_info = {'GLOBAL': {'verbosity': 0,
+                                        'climo_dir': self.tmpdir,
+                                        'force_processing': False},
+                             'RUNTIME': {}}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def get_job_spec(self, var, model_name='MPI-ESM-LR'):
+        from interface_scripts.projects import CMIP5
+        from interface_scripts.model import Model
+        from interface_scripts.diagdef import Var
+        model = Model('CMIP5 ' + model_name + ' Amon historical r1i1p1 2000 2001 '
+                      + self.tmpdir, {}, False)
+        variable = Var({'var': var, 'fld': 'T2Ms', 'mip': 'None',
+                        'exp': 'None'}, 'none', 'none')
+        return CMIP5(), model, variable
+
+    def test_job_temporary_section(self):
+        from interface_scripts.reformat import ReformatJob
+        currProject, model, variable = self.get_job_spec('tas')
+        job = ReformatJob(currProject, self.project_info, variable, model)
+        self.assertEqual(job.temporary['variable'], 'tas')
+        self.assertEqual(job.temporary['start_year'], '2000')
+        self.assertEqual(job.reformat_script,
+                         os.path.join('reformat_scripts', 'default',
+                                      'reformat_default_main.ncl'))
+        # the shared project_info is left untouched
+        self.assertFalse('TEMPORARY' in self.project_info)
+        job_info = job.get_job_info(self.project_info)
+        self.assertEqual(job_info['RUNTIME']['model'], 'MPI-ESM-LR')
+        self.assertEqual(self.project_info['RUNTIME'], {})
+
+    def test_collect_removes_duplicates(self):
+        from interface_scripts.reformat import collect_reformat_jobs
+        jobs = {}
+        needed, new = collect_reformat_jobs(self.project_info,
+                                            [self.get_job_spec('tas'),
+                                             self.get_job_spec('pr'),
+                                             self.get_job_spec('tas')],
+                                            jobs)
+        self.assertEqual(len(needed), 2)
+        self.assertEqual(len(new), 2)
+
+        needed, new = collect_reformat_jobs(self.project_info,
+                                            [self.get_job_spec('pr'),
+                                             self.get_job_spec('pr', 'CanESM2')],
+                                            jobs)
+        self.assertEqual(len(needed), 2)
+        self.assertEqual(len(new), 1)
+        self.assertEqual(len(jobs), 3)
+
+    def test_provenance_key(self):
+        from interface_scripts.reformat import ReformatJob
+        from interface_scripts.reformat_cache import provenance_key
+        currProject, model, variable = self.get_job_spec('tas')
+        job = ReformatJob(currProject, self.project_info, variable, model)
+        infile = os.path.join(self.tmpdir,
+                              'tas_Amon_MPI-ESM-LR_historical_r1i1p1_200001-200112.nc')
+        with open(infile, 'w') as f:
+            f.write('data')
+        key = provenance_key(job.get_provenance())
+        self.assertEqual(key, provenance_key(job.get_provenance()))
+
+        # a modified input file changes the key
+        with open(infile, 'a') as f:
+            f.write('more data')
+        self.assertNotEqual(key, provenance_key(job.get_provenance()))
+
+    def test_infile_selection(self):
+        from interface_scripts.reformat import ReformatJob
+        for period in ['199001-199912', '200001-200912', '201001-201912']:
+            with open(os.path.join(self.tmpdir, 'tas_Amon_MPI-ESM-LR_historical_'
+                                   'r1i1p1_' + period + '.nc'), 'w') as f:
+                f.write('data')
+        currProject, model, variable = self.get_job_spec('tas')
+        job = ReformatJob(currProject, self.project_info, variable, model)
+        # only the file covering 2000-2001 is passed to the reformat script
+        self.assertEqual(job.temporary['infile_path'],
+                         os.path.join(self.tmpdir, 'tas_Amon_MPI-ESM-LR_'
+                                      'historical_r1i1p1_200001-200912.nc'))
+        inputs = job.get_provenance()['inputs']['infile_path']
+        self.assertEqual(len(inputs), 1)
+
+    def test_cache_store_and_fetch(self):
+        from interface_scripts.reformat_cache import ReformatCache
+        cache = ReformatCache(os.path.join(self.tmpdir, 'cache'))
+        outfile = os.path.join(self.tmpdir, 'climo', 'CMIP5', 'tas.nc')
+        os.makedirs(os.path.dirname(outfile))
+        with open(outfile, 'w') as f:
+            f.write('reformatted')
+        cache.store('abc123', outfile, {'settings': {}})
+        self.assertTrue(cache.is_current(outfile, 'abc123'))
+        self.assertFalse(cache.is_current(outfile, 'def456'))
+
+        # another climo directory reuses the cached file
+        other = os.path.join(self.tmpdir, 'other_climo', 'CMIP5', 'tas.nc')
+        self.assertFalse(cache.fetch('def456', other, {}))
+        self.assertTrue(cache.fetch('abc123', other, {}))
+        self.assertEqual(open(other).read(), 'reformatted')
+        self.assertTrue(cache.is_current(other, 'abc123'))
+
+    def test_cache_adopt(self):
+        # reformatted files written before the provenance records
+        from interface_scripts.reformat_cache import ReformatCache
+        cache = ReformatCache(os.path.join(self.tmpdir, 'cache'))
+        infile = os.path.join(self.tmpdir, 'tas_input.nc')
+        outfile = os.path.join(self.tmpdir, 'climo', 'CMIP5', 'tas.nc')
+        os.makedirs(os.path.dirname(outfile))
+        for path in [infile, outfile]:
+            with open(path, 'w') as f:
+                f.write('data')
+        provenance = {'inputs': {'infile_path': [[infile, 4, 1000]]},
+                      'scripts': {}}
+        os.utime(outfile, (2000, 2000))
+        self.assertTrue(cache.adopt(outfile, 'abc123', provenance))
+        self.assertTrue(cache.is_current(outfile, 'abc123'))
+        # recorded already
+        self.assertFalse(cache.adopt(outfile, 'def456', provenance))
+
+        # older than its input
+        cache.invalidate(outfile)
+        with open(outfile, 'w') as f:
+            f.write('data')
+        os.utime(outfile, (500, 500))
+        self.assertFalse(cache.adopt(outfile, 'abc123', provenance))
+
+    def test_select_planned_base_vars(self):
+        # files written by earlier tasks of the graph count as precomputed
+        from interface_scripts.diagdef import Diagnostic
+        currProject, model, variable = self.get_job_spec('LAI')
+        diag = Diagnostic('LAI', self.variable_def_dir, 'T2Ms', [{}],
+                          'test.ncl', 'cfg_test', [], '')
+
+        def select(planned):
+            variables = diag.add_base_vars_fields(diag.get_variables_list(),
+                                                  model)
+            return [base_var.var for base_var in diag.select_base_vars(
+                variables, model, currProject, self.project_info, planned)]
+
+        def fullpath(var):
+            return currProject.get_cf_fullpath(self.project_info, model,
+                                               'T2Ms', var, 'None', 'None')
+
+        with self.assertRaises(IOError):
+            select({})
+        self.assertEqual(select({fullpath('lai'): 'reformat_0000_lai'}),
+                         ['lai'])
+        self.assertEqual(select({fullpath('LAI'): 'derive_000_test_LAI'}),
+                         ['LAI'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of ESMValTool
+
+
+"""
+Tests are implemented using *assert* statements
+"""
+
+import sys
+import os
+import json
+import shutil
+import subprocess
+import tempfile
+
+import unittest
+
+
+class TestResourceReport(unittest.TestCase):
+
+    def setUp(self):
+        # to allow that test find the ESMValTool modules, we add here pathes to the system path
+        esmval_path = os.path.dirname(os.path.realpath(__file__)) + os.sep + '..' + os.sep
+        sys.path.append(esmval_path)
+        sys.path.append(os.path.join(esmval_path, "interface_scripts"))
+
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_measure_nested(self):
+        import resource_report
+        from launchers import ncl_launcher
+        with resource_report.measure(self.tmpdir, "cmor_reformat",
+                                     model="MPI-ESM-LR", variable="tas"):
+            with resource_report.measure(self.tmpdir, "reformat_default_main.ncl"):
+                ncl_launcher().launch("dd if=/dev/zero of=/dev/null "
+                                      "bs=1024 count=1024", 0, False)
+        records = resource_report.read_records(self.tmpdir)
+        self.assertEqual([r['stage'] for r in records],
+                         ["reformat_default_main.ncl", "cmor_reformat"])
+        self.assertEqual(records[0]['parent'], "cmor_reformat")
+        self.assertEqual(records[0]['labels'],
+                         {'model': 'MPI-ESM-LR', 'variable': 'tas'})
+        self.assertEqual([r['depth'] for r in records], [1, 0])
+        self.assertGreater(records[0]['peak_rss_kb'], 0)
+
+    def test_peak_rss_per_child(self):
+        # a small child after a large one reports its own peak RSS
+        import resource_report
+        from launchers import ncl_launcher
+        for stage, size in [("large", 200), ("small", 1)]:
+            with resource_report.measure(self.tmpdir, stage):
+                ncl_launcher().launch(
+                    sys.executable + " -c \"x = ' ' * %d * 1048576\"" % size,
+                    0, False)
+        large, small = resource_report.read_records(self.tmpdir)
+        self.assertGreater(large['peak_rss_kb'], 200 * 1024)
+        self.assertLess(small['peak_rss_kb'], 100 * 1024)
+
+        # children not reaped by a launcher, no rise of the high-water mark
+        with resource_report.measure(self.tmpdir, "unknown"):
+            subprocess.call(["true"])
+        self.assertEqual(resource_report.read_records(self.tmpdir)[-1]
+                         ['peak_rss_kb'], None)
+        json_file, html_file = resource_report.write_report(self.tmpdir)
+        self.assertEqual(json.load(open(json_file))['total']['peak_rss_kb'],
+                         large['peak_rss_kb'])
+
+    def test_failed_stage_and_report(self):
+        import resource_report
+        with self.assertRaises(ValueError):
+            with resource_report.measure(self.tmpdir, "diag.py",
+                                         diagnostic="diag.py"):
+                raise ValueError()
+        json_file, html_file = resource_report.write_report(self.tmpdir)
+        summary = json.load(open(json_file))
+        self.assertEqual(summary['stages'][0]['failed'], 1)
+        self.assertEqual(summary['total']['count'], 1)
+        self.assertIn("diag.py", open(html_file).read())
+
+    def test_no_run_dir(self):
+        import resource_report
+        with resource_report.measure(None, "diag.py"):
+            pass
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
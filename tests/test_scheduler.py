@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of ESMValTool
+
+
+"""
+Tests are implemented using *assert* statements
+"""
+
+import sys
+import os
+import shutil
+import tempfile
+
+import unittest
+
+
+def write_marker(path, text):
+    with open(path, 'a') as f:
+        f.write(text + '\n')
+
+
+def fail_task():
+    raise ValueError('this task fails on purpose')
+
+
+def write_preloaded(path):
+    from interface_scripts.scheduler import launchers
+    write_marker(path, ' '.join(sorted(launchers._preloaded)))
+
+
+class Diagnostic(object):
+    def __init__(self, diag_script, launcher_arguments=None):
+        self.diag_script = diag_script
+        self.launcher_arguments = launcher_arguments
+
+    def get_diag_script(self):
+        return self.diag_script
+
+    def get_launcher_arguments(self):
+        return self.launcher_arguments
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        # to allow that test find the ESMValTool modules, we add here pathes to the system path
+        esmval_path = os.path.dirname(os.path.realpath(__file__)) + os.sep + '..' + os.sep
+        sys.path.append(esmval_path)
+        sys.path.append(os.path.join(esmval_path, "interface_scripts"))
+
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_topological_order_keeps_definition_order(self):
+        from interface_scripts.scheduler import Task, TaskGraph
+        G = TaskGraph()
+        G.add_task(Task('diag_b', None, requires=['reformat_b']))
+        G.add_task(Task('reformat_a', None))
+        G.add_task(Task('reformat_b', None, requires=['reformat_a']))
+        G.add_task(Task('diag_a', None, requires=['reformat_a']))
+        order = [task.name for task in G.topological_order()]
+        self.assertEqual(order, ['reformat_a', 'reformat_b', 'diag_b', 'diag_a'])
+
+    def test_cycle_and_unknown_requirement(self):
+        from interface_scripts.scheduler import Task, TaskGraph
+        from interface_scripts.auxiliary import taskExecuteError
+        G = TaskGraph()
+        G.add_task(Task('a', None, requires=['b']))
+        G.add_task(Task('b', None, requires=['a']))
+        with self.assertRaises(taskExecuteError):
+            G.topological_order()
+
+        G = TaskGraph()
+        G.add_task(Task('a', None, requires=['missing']))
+        with self.assertRaises(taskExecuteError):
+            G.topological_order()
+
+    def test_parallel_run(self):
+        from interface_scripts.scheduler import Task, TaskGraph, run_tasks
+        from interface_scripts.auxiliary import taskExecuteError
+        marker = os.path.join(self.tmpdir, 'marker.txt')
+        run_dir = os.path.join(self.tmpdir, 'run')
+
+        G = TaskGraph()
+        G.add_task(Task('first', write_marker, (marker, 'first')))
+        G.add_task(Task('second', write_marker, (marker, 'second'),
+                        requires=['first']))
+        G.add_task(Task('broken', fail_task))
+        G.add_task(Task('after_broken', write_marker, (marker, 'never'),
+                        requires=['broken']))
+
+        with self.assertRaises(taskExecuteError):
+            run_tasks(G, jobs=2, run_dir=run_dir, verbosity=0,
+                      poll_interval=0.01)
+
+        self.assertEqual(open(marker).read().split(), ['first', 'second'])
+        log = open(os.path.join(run_dir, 'logs', 'broken.log')).read()
+        self.assertTrue('this task fails on purpose' in log)
+        self.assertFalse(os.path.exists(os.path.join(run_dir, 'logs',
+                                                     'after_broken.log')))
+
+    def test_preload_before_fork(self):
+        from interface_scripts.scheduler import Task, TaskGraph, run_tasks, \
+            uses_python_worker
+        project_info = {'DIAGNOSTICS': [
+            Diagnostic('test.ncl', "[('execute_in_worker', True)]"),
+            Diagnostic('test.py'),
+            Diagnostic('test_shell.py', "[('execute_as_shell', True)]")]}
+        self.assertFalse(uses_python_worker(project_info))
+        project_info['DIAGNOSTICS'].append(
+            Diagnostic('test_worker.py', "[('execute_in_worker', True)]"))
+        self.assertTrue(uses_python_worker(project_info))
+
+        # the task processes see the modules preloaded by the scheduler
+        marker = os.path.join(self.tmpdir, 'marker.txt')
+        G = TaskGraph()
+        G.add_task(Task('task', write_preloaded, (marker,)))
+        run_tasks(G, jobs=2, run_dir=os.path.join(self.tmpdir, 'run'),
+                  verbosity=0, poll_interval=0.01, preload=True)
+        self.assertIn('numpy', open(marker).read().split())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of ESMValTool
+
+
+"""
+Tests are implemented using *assert* statements
+"""
+
+import sys
+import os
+import json
+import shutil
+import tempfile
+
+import unittest
+
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        # to allow that test find the ESMValTool modules, we add here pathes to the system path
+        esmval_path = os.path.dirname(os.path.realpath(__file__)) + os.sep + '..' + os.sep
+        sys.path.append(esmval_path)
+        sys.path.append(os.path.join(esmval_path, "interface_scripts"))
+
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def read_trace(self):
+        import tracing
+        return json.load(open(tracing.write_trace(self.tmpdir)))['traceEvents']
+
+    def test_span(self):
+        import tracing
+        with tracing.span(self.tmpdir, "run", "run"):
+            with tracing.span(self.tmpdir, "derive_var tas", "derive_var"):
+                pass
+        events = self.read_trace()
+        self.assertEqual([e['name'] for e in events], ["run", "derive_var tas"])
+        self.assertTrue(events[0]['ts'] <= events[1]['ts'])
+        self.assertTrue(events[0]['ts'] + events[0]['dur']
+                        >= events[1]['ts'] + events[1]['dur'])
+
+    def test_ncl_trace(self):
+        import tracing
+        trace = tracing.ncl_trace(self.tmpdir, start=100.)
+        lines = ["(0)\tESMValTool-trace: B 0.5000 MyDiag.ncl",
+                 "(0)\tESMValTool-trace: B 1.0000 read_data (MyDiag.ncl)",
+                 "(0)\tESMValTool-trace: B 1.5000 write_filelist (messaging.ncl)",
+                 "(0)\tESMValTool-trace: E 2.0000 read_data (MyDiag.ncl)",
+                 "(0)\tESMValTool-trace: E 3.0000 MyDiag.ncl"]
+        self.assertTrue(all([trace.add(line) for line in lines]))
+        self.assertFalse(trace.add("(0)\tinfo: some output"))
+        trace.finish()
+        events = dict((e['name'], e) for e in self.read_trace())
+        self.assertEqual(events['MyDiag.ncl']['ts'], 100500000)
+        self.assertEqual(events['MyDiag.ncl']['dur'], 2500000)
+        # left by an early return, closed with its caller
+        self.assertEqual(events['write_filelist (messaging.ncl)']['dur'], 500000)
+
+    def test_trace_lines_removed_from_output(self):
+        import tracing
+        from interface_scripts.launchers import ncl_launcher
+        L = ncl_launcher()
+        L.trace = tracing.ncl_trace(self.tmpdir)
+        L.write_stdouterr(["(0)\tESMValTool-trace: B 0.1 fatal: (x.ncl)",
+                           "(0)\tESMValTool-trace: E 0.2 fatal: (x.ncl)"],
+                          0, True)
+        L.trace.finish()
+        self.assertEqual(len(self.read_trace()), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
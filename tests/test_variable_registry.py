@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of ESMValTool
+
+
+"""
+Tests are implemented using *assert* statements
+"""
+
+import sys
+import os
+import shutil
+import tempfile
+
+import unittest
+
+
+class TestVariableRegistry(unittest.TestCase):
+
+    def setUp(self):
+        # to allow that test find the ESMValTool modules, we add here pathes to the system path
+        esmval_path = os.path.dirname(os.path.realpath(__file__)) + os.sep + '..' + os.sep
+        sys.path.append(esmval_path)
+        sys.path.append(os.path.join(esmval_path, "interface_scripts"))
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.tmpdir, 'registry.pkl')
+        self.var_def = os.path.join(self.tmpdir, 'pr-mmday.ncl')
+        self.write_var_def('pr:T2Ms', '"mm/day"')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_var_def(self, requires, units):
+        with open(self.var_def, 'w') as f:
+            f.write(';\n; Requires: ' + requires + '\n;\n')
+            f.write('variable_info = True\n')
+            f.write('variable_info@units = ' + units + '  ; comment\n')
+            f.write('variable_info@map_Levels = ispan(0, 10, 1)\n')
+
+    def test_variable_def(self):
+        import variable_registry
+        registry = variable_registry.VariableRegistry(self.cache_file)
+        var_def = registry.get_variable_def(self.tmpdir, 'pr-mmday')
+        self.assertEqual(var_def['requires'], ['pr:T2Ms'])
+        self.assertTrue(var_def['variable_info_true'])
+        self.assertEqual(var_def['units'], 'mm/day')
+        self.assertEqual(var_def['variable_info'][1],
+                         ['map_Levels', 'ispan(0, 10, 1)'])
+        with self.assertRaises(IOError):
+            registry.get_variable_def(self.tmpdir, 'missing')
+
+    def test_persistence_and_validation(self):
+        import variable_registry
+        registry = variable_registry.VariableRegistry(self.cache_file)
+        registry.get_variable_def(self.tmpdir, 'pr-mmday')
+        registry.save()
+        self.assertTrue(os.path.isfile(self.cache_file))
+
+        # reused from the cache file while the definition is unchanged
+        registry = variable_registry.VariableRegistry(self.cache_file)
+        registry.get_variable_def(self.tmpdir, 'pr-mmday')
+        self.assertFalse(registry.modified)
+
+        # parsed again once modified
+        self.write_var_def('none', '"kg m-2 s-1"')
+        os.utime(self.var_def, (0, 0))
+        registry = variable_registry.VariableRegistry(self.cache_file)
+        var_def = registry.get_variable_def(self.tmpdir, 'pr-mmday')
+        self.assertEqual(var_def['requires'], ['none'])
+        self.assertEqual(var_def['units'], 'kg m-2 s-1')
+
+    def test_names(self):
+        import variable_registry
+        names_file = os.path.join(self.tmpdir, 'names.dat')
+        with open(names_file, 'w') as f:
+            f.write('# STANDARD NAME | PROJECT NAME\n')
+            f.write('tas   | t2m | ERA\n')
+        self.assertEqual(variable_registry.parse_names_file(names_file),
+                         {'tas': 't2m'})
+
+        vars_file = os.path.join(self.tmpdir, 'recognized_vars.dat')
+        with open(vars_file, 'w') as f:
+            f.write('# std_name = ta\n\nstd_name = plev\nalt_name = p,plevs\n\n')
+            f.write('std_name = lev\nalt_name = \n')
+        self.assertEqual(variable_registry.parse_recognized_vars(vars_file),
+                         {'plev': ['p', 'plevs'], 'lev': []})
+
+
+if __name__ == "__main__":
+    unittest.main()
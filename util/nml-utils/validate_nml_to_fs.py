@@ -72,7 +72,7 @@ def check_namelist(args, proj):
 
         # Prepare/reformat model data for each model
         for model in project_info['MODELS']:
-            currProject = getattr(vars()['proj'], model.split_entries()[0])()
+            currProject = proj.get_project(model.entries[0])
             model_name = currProject.get_model_name(model)
             project_name = currProject.get_project_name(model)
             project_basename = currProject.get_project_basename()
@@ -91,7 +91,6 @@ def check_namelist(args, proj):
                     continue
 
                 # first try: use base variables provided by variable_defs script
-                os.environ['__ESMValTool_base_var'] = base_var.var
                 infile = reformat.infile(currProject,
                                          project_info,
                                          base_var,